@@ -0,0 +1,115 @@
+# async_runtime.py
+# Runtime assíncrono do peer: um único event loop asyncio, em uma thread dedicada, agenda
+# heartbeats, timeouts de tracker, coleta de votos e os downloads (como corrotinas). Chamadas
+# bloqueantes (Pyro, disco) rodam em um pool limitado de threads, então rearmar um timer ou
+# enviar heartbeats a centenas de peers não cria uma thread nova por operação.
+# submit/to_thread levam o contexto (contextvars) de quem chamou, como asyncio.to_thread; os timers
+# não, para que um span de trace não se propague para todos os heartbeats seguintes.
+# Os timers (heartbeat, timeout do tracker, coleta de votos) disparam em um pool pequeno próprio:
+# uma rajada de downloads ocupando o pool de chamadas bloqueantes não atrasa heartbeats nem eleições.
+# Pelo mesmo motivo, as RPCs de controle que esses timers disparam (heartbeat para cada peer, pedidos de
+# voto) vão para um terceiro pool (submit_control), e não para o pool compartilhado.
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import RUNTIME_BLOCKING_WORKERS, RUNTIME_TIMER_WORKERS, RUNTIME_CONTROL_WORKERS
+
+
+class ScheduledCall:
+    """Chamada agendada no event loop, com a interface usada dos threading.Timer (cancel/is_alive)."""
+
+    __slots__ = ("_runtime", "_handle", "_pending")
+
+    def __init__(self, runtime):
+        self._runtime = runtime
+        self._handle = None
+        self._pending = True
+
+    def is_alive(self):
+        # True enquanto a chamada ainda não disparou nem foi cancelada
+        return self._pending
+
+    def cancel(self):
+        self._pending = False
+        handle = self._handle
+        if handle is not None:
+            self._runtime.loop.call_soon_threadsafe(handle.cancel)
+
+
+class AsyncRuntime:
+    def __init__(self, name, logger, max_workers=RUNTIME_BLOCKING_WORKERS, timer_workers=RUNTIME_TIMER_WORKERS,
+                 control_workers=RUNTIME_CONTROL_WORKERS):
+        self.name = name
+        self.logger = logger
+        self.loop = asyncio.new_event_loop()
+        # Pool compartilhado por todas as chamadas bloqueantes do peer
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"Blocking-{name}")
+        self.loop.set_default_executor(self.executor)
+        self.timer_executor = ThreadPoolExecutor(max_workers=timer_workers, thread_name_prefix=f"Timer-{name}")
+        self.control_executor = ThreadPoolExecutor(max_workers=control_workers, thread_name_prefix=f"Control-{name}")
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run_loop, name=f"EventLoop-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self):
+        if self._thread and self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=2)
+        self.executor.shutdown(wait=False)
+        self.timer_executor.shutdown(wait=False)
+        self.control_executor.shutdown(wait=False)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # --- Agendamento (seguro para chamar de qualquer thread) ---
+    def call_later(self, delay, callback, *args):
+        """Agenda callback(*args) para daqui a 'delay' segundos; o callback roda no pool de timers (pode bloquear)."""
+        scheduled = ScheduledCall(self)
+
+        def fire():
+            if scheduled._pending:
+                scheduled._pending = False
+                self.timer_executor.submit(self._run_safely, callback, args)
+
+        def arm():
+            if scheduled._pending:
+                scheduled._handle = self.loop.call_later(delay, fire)
+
+        self.loop.call_soon_threadsafe(arm)
+        return scheduled
+
+    def submit(self, fn, *args):
+        # Executa uma função bloqueante no pool (substitui threading.Thread(...).start() avulsos)
+        return self.executor.submit(contextvars.copy_context().run, self._run_safely, fn, args)
+
+    def submit_control(self, fn, *args):
+        # Como submit, mas no pool das RPCs de controle (heartbeats, votos), que downloads não ocupam
+        return self.control_executor.submit(contextvars.copy_context().run, self._run_safely, fn, args)
+
+    def run_coroutine(self, coro):
+        """Executa uma corrotina no event loop e devolve um concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # --- Dentro de corrotinas ---
+    def to_thread(self, fn, *args):
+        # Aguardável que executa fn(*args) no pool, sem bloquear o event loop
+        return self.loop.run_in_executor(self.executor, functools.partial(contextvars.copy_context().run, fn, *args))
+
+    def _run_safely(self, fn, args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            self.logger.error(f"Runtime: erro em {getattr(fn, '__name__', fn)}: {e}", exc_info=True)
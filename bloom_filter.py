@@ -0,0 +1,61 @@
+# bloom_filter.py
+# Filtro de Bloom para resumir conjuntos de nomes de arquivo. O tracker monta um filtro com todos os
+# nomes do índice e o envia nos heartbeats; um peer que recebe o filtro responde "não existe na rede"
+# localmente quando o nome não está nele (sem falso negativo), sem ir até o tracker. Um "talvez"
+# (incluindo os falsos positivos, na taxa configurada) segue para a consulta normal.
+
+import hashlib
+import math
+
+from chunk_codec import to_bytes
+
+
+class BloomFilter:
+    __slots__ = ("num_bits", "num_hashes", "bits", "capacity")
+
+    def __init__(self, num_bits, num_hashes, bits=None, capacity=None):
+        self.num_bits = max(8, (int(num_bits) + 7) // 8 * 8)  # Múltiplo de 8 (bytearray inteiro)
+        self.num_hashes = max(1, int(num_hashes))
+        self.bits = bytearray(self.num_bits // 8) if bits is None else bytearray(bits)
+        if len(self.bits) != self.num_bits // 8:
+            raise ValueError(f"Bitfield com {len(self.bits)} bytes não corresponde a {self.num_bits} bits.")
+        self.capacity = capacity  # Nomes previstos no dimensionamento (None se recebido pela rede)
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate):
+        """Filtro dimensionado para 'capacity' nomes com a taxa de falso positivo pedida."""
+        capacity = max(1, int(capacity))
+        num_bits = math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))
+        num_hashes = round(num_bits / capacity * math.log(2))
+        return cls(num_bits, num_hashes, capacity=capacity)
+
+    def copy(self):
+        return BloomFilter(self.num_bits, self.num_hashes, self.bits, self.capacity)
+
+    def _positions(self, name):
+        # Hashing duplo (Kirsch-Mitzenmacher): k posições a partir de dois hashes de 64 bits
+        digest = hashlib.blake2b(name.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, name):
+        bits = self.bits
+        for position in self._positions(name):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def update(self, names):
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(name))
+
+    def to_dict(self):
+        """Formato de envio pelo Pyro (o bitfield vai como bytes)."""
+        return {"num_bits": self.num_bits, "num_hashes": self.num_hashes, "bits": bytes(self.bits)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["num_bits"], data["num_hashes"], to_bytes(data["bits"]))
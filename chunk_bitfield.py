@@ -0,0 +1,169 @@
+# chunk_bitfield.py
+# Bitfields de disponibilidade de chunks e escalonamento "rarest-first" para downloads com
+# várias fontes: cada holder (completo ou parcial) recebe o chunk que ele possui e que está
+# disponível em menos peers, como no BitTorrent.
+
+import os
+import random
+import threading
+
+from chunk_writer import ChunkWriter
+from constants import DOWNLOAD_CHUNK_SIZE
+
+
+def num_chunks_for(total_size, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    return -(-total_size // chunk_size) if total_size > 0 else 0
+
+
+class Bitfield:
+    """Um bit por chunk (bit mais significativo primeiro, como no BitTorrent)."""
+
+    __slots__ = ("num_chunks", "bits")
+
+    def __init__(self, num_chunks, bits=None):
+        self.num_chunks = num_chunks
+        self.bits = bytearray(bits) if bits is not None else bytearray((num_chunks + 7) // 8)
+
+    @classmethod
+    def full(cls, num_chunks):
+        bitfield = cls(num_chunks, b"\xff" * ((num_chunks + 7) // 8))
+        bitfield._clear_padding()
+        return bitfield
+
+    def _clear_padding(self):
+        extra = len(self.bits) * 8 - self.num_chunks
+        if extra and self.bits:
+            self.bits[-1] &= (0xFF << extra) & 0xFF
+
+    def has(self, index):
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def set(self, index):
+        self.bits[index >> 3] |= 0x80 >> (index & 7)
+
+    def count(self):
+        return sum(bin(byte).count("1") for byte in self.bits)
+
+    def is_complete(self):
+        return self.count() == self.num_chunks
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+
+class RarestFirstScheduler:
+    """Distribui os chunks que faltam entre as fontes, priorizando os mais raros.
+
+    availability[i] é o número de fontes que possuem o chunk i. Chunks em andamento não são
+    entregues a outra fonte; se a fonte falhar, o chunk volta para a fila com fail().
+    """
+
+    def __init__(self, num_chunks, have, sources):
+        # sources: {chave_da_fonte: Bitfield}
+        self.num_chunks = num_chunks
+        self.sources = sources
+        self.availability = [0] * num_chunks
+        for bitfield in sources.values():
+            for i in range(num_chunks):
+                if bitfield.has(i):
+                    self.availability[i] += 1
+        self._missing = {i for i in range(num_chunks) if not have.has(i)}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        with self._lock:
+            return len(self._missing)
+
+    def unreachable(self):
+        # Chunks que faltam e que nenhuma fonte restante possui
+        with self._lock:
+            return [i for i in self._missing if self.availability[i] == 0]
+
+    def next_chunk(self, source_key):
+        with self._lock:
+            bitfield = self.sources.get(source_key)
+            if bitfield is None:
+                return None
+            candidates = [i for i in self._missing if i not in self._in_flight and bitfield.has(i)]
+            if not candidates:
+                return None
+            rarest = min(self.availability[i] for i in candidates)
+            # Sorteio entre os igualmente raros: downloaders diferentes começam por chunks diferentes
+            chunk_index = random.choice([i for i in candidates if self.availability[i] == rarest])
+            self._in_flight.add(chunk_index)
+            return chunk_index
+
+    def complete(self, chunk_index):
+        with self._lock:
+            self._in_flight.discard(chunk_index)
+            self._missing.discard(chunk_index)
+
+    def fail(self, chunk_index):
+        with self._lock:
+            self._in_flight.discard(chunk_index)
+
+    def drop_source(self, source_key):
+        # Fonte falhou: deixa de contar na disponibilidade
+        with self._lock:
+            bitfield = self.sources.pop(source_key, None)
+            if bitfield is not None:
+                for i in range(self.num_chunks):
+                    if bitfield.has(i):
+                        self.availability[i] -= 1
+
+    def has_pending_work(self, source_key):
+        # True se ainda há chunks que esta fonte pode servir (livres ou em andamento em outra fonte)
+        with self._lock:
+            bitfield = self.sources.get(source_key)
+            return bitfield is not None and any(bitfield.has(i) for i in self._missing)
+
+
+class PartialFile:
+    """Arquivo .part de um download em andamento: recebe chunks fora de ordem e serve os já completos."""
+
+    def __init__(self, path, total_size, chunk_size=DOWNLOAD_CHUNK_SIZE, resume_bits=None):
+        self.path = path
+        self.total_size = total_size
+        self.chunk_size = chunk_size
+        self.num_chunks = num_chunks_for(total_size, chunk_size)
+        self.bitfield = Bitfield(self.num_chunks)
+        self._lock = threading.Lock()
+        # Retomada: reaproveita o .part de uma tentativa anterior e os chunks marcados em resume_bits
+        resume = resume_bits is not None and len(resume_bits) == len(self.bitfield.bits) \
+            and os.path.isfile(path) and os.path.getsize(path) == total_size
+        if resume:
+            self.bitfield = Bitfield(self.num_chunks, resume_bits)
+        self._writer = ChunkWriter(path, total_size, keep_existing=resume, sync_snapshot=self.bitfield_bytes)
+
+    def write_chunk(self, index, data):
+        # pwrite fora do lock: chunks de fontes diferentes são gravados em paralelo. Os dados já estão
+        # no SO quando o bit é marcado, então outros peers podem ler o .part em seguida
+        self._writer.write_at(index * self.chunk_size, data)
+        with self._lock:
+            self.bitfield.set(index)
+
+    def servable_size(self, offset, size):
+        # Quantos bytes a partir de 'offset' podem ser servidos (0 se o chunk ainda não chegou).
+        # Nunca atravessa o fim do chunk; offsets no meio dele vêm do restante de uma resposta parcial.
+        if offset < 0 or offset >= self.total_size:
+            return 0
+        index = offset // self.chunk_size
+        with self._lock:
+            if not self.bitfield.has(index):
+                return 0
+        return min(size, (index + 1) * self.chunk_size - offset, self.total_size - offset)
+
+    def bitfield_bytes(self):
+        with self._lock:
+            return self.bitfield.to_bytes()
+
+    def durable_bitfield_bytes(self):
+        # Bits que podem ir para o estado de retomada: só chunks que o último fsync já garantiu em disco.
+        # Com "always" cada chunk é sincronizado antes do bit; com "none" não há garantia a respeitar
+        if self._writer.fsync_policy in ("none", "always"):
+            return self.bitfield_bytes()
+        return self._writer.durable_state
+
+    def close(self):
+        self._writer.close()
@@ -0,0 +1,93 @@
+# chunk_cache.py
+# Cache em memória dos chunks servidos (LRU limitado em bytes). Quando vários peers baixam o mesmo
+# arquivo popular, cada chunk é lido do disco uma vez e servido da memória aos demais. A chave inclui
+# o mtime e o tamanho do arquivo, então uma cópia alterada nunca é servida do cache mesmo antes de o
+# observador da pasta chamar invalidate(). Leituras frias sequenciais pedem ao SO (posix_fadvise) que
+# já traga os próximos chunks do disco.
+
+import os
+import threading
+from collections import OrderedDict
+
+_FADVISE = hasattr(os, "posix_fadvise")
+
+
+class ChunkCache:
+    def __init__(self, max_bytes, readahead_bytes=0):
+        self.max_bytes = max_bytes
+        self.readahead_bytes = readahead_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (caminho, mtime_ns, tamanho_arquivo, offset, tamanho) -> bytes
+        self._bytes = 0
+        self._loading = {}  # chave -> Event: a primeira thread lê do disco, as outras esperam por ela
+        self._next_offset = {}  # caminho -> offset seguinte à última leitura fria (detecta acesso sequencial)
+
+    def read(self, path, offset, size):
+        """(dados, veio_do_cache) do trecho [offset, offset + size) de 'path'."""
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size, offset, size)
+        while True:
+            with self._lock:
+                data = self._entries.get(key)
+                if data is not None:
+                    self._entries.move_to_end(key)
+                    return data, True
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # Outra thread já está lendo este chunk: espera e tenta o cache de novo
+            loading.wait()
+        try:
+            data = self._read_from_disk(path, offset, size)
+            self._store(key, data)
+            return data, False
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+    def _read_from_disk(self, path, offset, size):
+        with open(path, "rb") as f:
+            if _FADVISE and self.readahead_bytes:
+                with self._lock:
+                    sequential = self._next_offset.get(path) == offset
+                    self._next_offset[path] = offset + size
+                if sequential:
+                    # Leitura sequencial: o SO já busca os próximos chunks enquanto este é enviado
+                    os.posix_fadvise(f.fileno(), offset + size, self.readahead_bytes, os.POSIX_FADV_WILLNEED)
+            f.seek(offset)
+            return f.read(size)
+
+    def _store(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def invalidate(self, paths):
+        """Descarta os chunks dos arquivos em 'paths' (alterados ou removidos)."""
+        paths = set(paths)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in paths]:
+                self._bytes -= len(self._entries.pop(key))
+            for path in paths:
+                self._next_offset.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._next_offset.clear()
+            self._bytes = 0
+
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
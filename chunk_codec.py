@@ -0,0 +1,79 @@
+# chunk_codec.py
+# Compressão negociada por chunk no caminho de transferência. O downloader informa os codecs que
+# aceita; o holder escolhe o primeiro que também suporta e comprime o chunk, a menos que uma
+# amostra indique que os dados são incompressíveis (mídia, arquivos já comprimidos etc.).
+# A compressão roda na thread do pedido, então o holder só usa os codecs baratos de
+# COMPRESSION_SERVING_CODECS; os demais de CODECS continuam decodificáveis (holders de versões anteriores).
+
+import lzma
+import zlib
+
+import serpent
+
+from constants import COMPRESSION_SAMPLE_SIZE, COMPRESSION_MIN_RATIO, COMPRESSION_MIN_CHUNK_SIZE, \
+    COMPRESSION_ZLIB_LEVEL, COMPRESSION_LZMA_PRESET, COMPRESSION_SERVING_CODECS
+
+# Codec -> (comprimir, descomprimir). Todos da biblioteca padrão e liberam o GIL durante o trabalho.
+CODECS = {
+    "zlib": (lambda data: zlib.compress(data, COMPRESSION_ZLIB_LEVEL), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=COMPRESSION_LZMA_PRESET), lzma.decompress),
+}
+
+
+class ChunkDecodeError(Exception):
+    """Chunk recebido com codec desconhecido ou tamanho diferente do anunciado."""
+
+
+def to_bytes(data):
+    # O serializador serpent entrega bytes como {'data': <base64>, 'encoding': 'base64'}
+    if isinstance(data, dict):
+        return serpent.tobytes(data)
+    return data
+
+
+def choose_codec(accepted_codecs):
+    # Primeiro codec da lista do cliente (ordem de preferência dele) que este peer usa ao servir
+    for codec in accepted_codecs or ():
+        if codec in CODECS and codec in COMPRESSION_SERVING_CODECS:
+            return codec
+    return None
+
+
+def looks_compressible(data):
+    # Comprime rapidamente uma amostra do início do chunk e decide pela razão obtida
+    if len(data) < COMPRESSION_MIN_CHUNK_SIZE:
+        return False
+    sample = data[:COMPRESSION_SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) / len(sample) <= COMPRESSION_MIN_RATIO
+
+
+def encode_chunk(data, accepted_codecs):
+    """Monta a resposta {'codec', 'size', 'data'} para um chunk.
+
+    Comprime na própria thread que atende o pedido: os codecs liberam o GIL, e quem chama já está
+    dentro de um slot de upload, então no máximo UPLOAD_SLOTS chunks são comprimidos ao mesmo tempo.
+    Só codecs de COMPRESSION_SERVING_CODECS, para o custo por chunk não segurar o slot.
+    """
+    codec = choose_codec(accepted_codecs)
+    if codec is None or not looks_compressible(data):
+        return {"codec": None, "size": len(data), "data": data}
+    compress = CODECS[codec][0]
+    compressed = compress(data)
+    if len(compressed) >= len(data):
+        return {"codec": None, "size": len(data), "data": data}
+    return {"codec": codec, "size": len(data), "data": compressed}
+
+
+def decode_chunk(payload):
+    """Converte a resposta de encode_chunk (já desserializada) de volta para os bytes originais."""
+    if payload is None:
+        return None
+    codec = payload.get("codec")
+    data = to_bytes(payload.get("data"))
+    if codec:
+        if codec not in CODECS:
+            raise ChunkDecodeError(f"codec desconhecido: {codec}")
+        data = CODECS[codec][1](data)
+    if payload.get("size") is not None and len(data) != payload["size"]:
+        raise ChunkDecodeError(f"tamanho do chunk ({len(data)}) difere do anunciado ({payload['size']})")
+    return data
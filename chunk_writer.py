@@ -0,0 +1,143 @@
+# chunk_writer.py
+# Escrita de downloads em disco por posição: o arquivo é pré-alocado com o tamanho final
+# (posix_fallocate, quando disponível) e cada chunk é gravado no seu offset com os.pwrite, sem seek
+# compartilhado, então várias threads escrevem chunks fora de ordem em paralelo. A durabilidade
+# segue CHUNK_WRITER_FSYNC_POLICY:
+#   "none"   - nunca força o disco (o SO grava quando quiser)
+#   "close"  - um fsync ao fechar, antes do arquivo ser renomeado para o nome final
+#   "batch"  - fsync a cada CHUNK_WRITER_FSYNC_BYTES gravados ou CHUNK_WRITER_FSYNC_INTERVAL segundos, e ao fechar
+#   "always" - fsync após cada chunk (lento; para quem não aceita perder nada)
+# Quem guarda metadados de retomada passa sync_snapshot: o estado capturado antes de cada fsync fica em
+# durable_state quando ele termina, e só esse estado (já em disco) deve ser persistido.
+
+import errno
+import os
+import threading
+import time
+
+from constants import CHUNK_WRITER_FSYNC_POLICY, CHUNK_WRITER_FSYNC_BYTES, CHUNK_WRITER_FSYNC_INTERVAL
+
+FSYNC_POLICIES = ("none", "close", "batch", "always")
+
+# fdatasync não grava metadados (mtime etc.), que não importam para retomar o download
+_datasync = getattr(os, "fdatasync", os.fsync)
+
+
+class ChunkWriter:
+    """Arquivo de destino de um download, aberto para escrita em offsets arbitrários por várias threads."""
+
+    def __init__(self, path, total_size, fsync_policy=CHUNK_WRITER_FSYNC_POLICY, keep_existing=False,
+                 sync_snapshot=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Política de fsync inválida: '{fsync_policy}' (use uma de {FSYNC_POLICIES})")
+        self.path = path
+        self.total_size = total_size
+        self.fsync_policy = fsync_policy
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if not keep_existing:
+            flags |= os.O_TRUNC
+        self._fd = os.open(path, flags, 0o644)
+        self._lock = threading.Lock()  # Só para o fallback sem pwrite e para a contabilidade do fsync
+        self._sync_lock = threading.Lock()
+        self._unsynced_bytes = 0
+        self._last_sync = time.monotonic()
+        self._closed = False
+        self._sync_snapshot = sync_snapshot
+        self._sync_seq = 0
+        self._durable_seq = 0
+        # O que já existia no arquivo ao abrir foi gravado por uma execução anterior e conta como durável
+        self.durable_state = sync_snapshot() if sync_snapshot is not None else None
+        try:
+            self._preallocate()
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _preallocate(self):
+        # Reserva os blocos de uma vez: evita fragmentação e falha cedo se o disco não tiver espaço
+        if self.total_size <= 0:
+            return
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(self._fd, 0, self.total_size)
+                return
+            except OSError as e:
+                # Sistemas de arquivos sem suporte (EOPNOTSUPP/EINVAL) ficam com o arquivo esparso
+                if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+        if os.fstat(self._fd).st_size != self.total_size:
+            os.ftruncate(self._fd, self.total_size)
+
+    def write_at(self, offset, data):
+        """Grava 'data' em 'offset'. Pode ser chamado por várias threads ao mesmo tempo."""
+        view = memoryview(data)
+        if hasattr(os, "pwrite"):
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                while view:
+                    view = view[os.write(self._fd, view):]
+        self._after_write(len(data))
+
+    def _after_write(self, size):
+        if self.fsync_policy == "always":
+            _datasync(self._fd)
+            return
+        if self.fsync_policy != "batch":
+            return
+        with self._lock:
+            self._unsynced_bytes += size
+            due = (self._unsynced_bytes >= CHUNK_WRITER_FSYNC_BYTES
+                   or time.monotonic() - self._last_sync >= CHUNK_WRITER_FSYNC_INTERVAL)
+        # Uma thread faz o fsync do lote; as outras seguem escrevendo em vez de esperar por ele
+        if due and self._sync_lock.acquire(blocking=False):
+            try:
+                self.sync()
+            finally:
+                self._sync_lock.release()
+
+    def sync(self):
+        # O snapshot é tirado antes do fsync: tudo o que ele descreve já foi escrito e fica em disco ao final
+        snapshot = self._sync_snapshot() if self._sync_snapshot is not None else None
+        with self._lock:
+            self._unsynced_bytes = 0
+            self._last_sync = time.monotonic()
+            self._sync_seq += 1
+            seq = self._sync_seq
+        _datasync(self._fd)
+        self._mark_durable(seq, snapshot)
+
+    def _mark_durable(self, seq, snapshot):
+        if self._sync_snapshot is None:
+            return
+        with self._lock:
+            # Dois fsyncs simultâneos podem terminar fora de ordem: vale o snapshot mais recente
+            if seq > self._durable_seq:
+                self._durable_seq = seq
+                self.durable_state = snapshot
+
+    def close(self):
+        """Fecha o arquivo, com fsync final exceto na política "none"."""
+        if self._closed:
+            return
+        self._closed = True
+        snapshot = self._sync_snapshot() if self._sync_snapshot is not None else None
+        try:
+            if self.fsync_policy != "none":
+                os.fsync(self._fd)
+                with self._lock:
+                    self._sync_seq += 1
+                    seq = self._sync_seq
+                self._mark_durable(seq, snapshot)
+        finally:
+            os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -23,3 +23,153 @@ QUORUM = TOTAL_PEERS_EXPECTED // 2 + 1
 # Outras constantes
 MAX_EPOCH_SEARCH = 100 # Ao buscar um tracker, até qual época procurar
 DOWNLOAD_CHUNK_SIZE = 1024 * 1024 # 1MB por chunk para download
+
+# Observador da pasta compartilhada
+WATCHER_COALESCE_WINDOW = 0.3  # Janela (s) para agrupar rajadas de eventos em uma única notificação
+WATCHER_MAX_DELAY = 2.0  # Atraso máximo (s) até notificar o tracker, mesmo com eventos contínuos
+WATCHER_POLL_INTERVAL = 1.0  # Intervalo (s) do modo polling, usado quando inotify não está disponível
+# Padrões glob (nome ou caminho relativo) ignorados ao compartilhar a árvore da pasta
+SHARED_EXCLUDE_PATTERNS = [".*", "*.tmp", "*.part", "*.swp", "__pycache__"]
+
+# Pontuação de holders (escolha do peer de origem de um download)
+PEER_SCORING_EWMA_ALPHA = 0.3  # Peso da medição mais recente nas médias móveis (RTT, vazão, erros)
+PEER_SCORING_DEFAULT_RTT = 0.05  # RTT (s) assumido para holders ainda não medidos
+PEER_SCORING_DEFAULT_THROUGHPUT = 10 * 1024 * 1024  # Vazão (bytes/s) otimista para holders sem histórico
+PEER_SCORING_RTT_MAX_AGE = 30.0  # Idade máxima (s) de uma medição de RTT antes de pingar o holder de novo
+PEER_SCORING_PROBE_TIMEOUT = 1.0  # Timeout (s) do ping de medição de RTT
+PEER_SCORING_MAX_PROBES = 8  # Máximo de holders pingados antes de um download
+
+# Escalonador de uploads (lado do holder)
+UPLOAD_SLOTS = 4  # Chunks servidos simultaneamente; os demais pedidos aguardam em fila justa por peer
+UPLOAD_MAX_BYTES_PER_SEC = 0  # Limite global de banda de upload em bytes/s (0 = sem limite)
+UPLOAD_PER_PEER_MAX_BYTES_PER_SEC = 0  # Limite de banda por peer solicitante em bytes/s (0 = sem limite)
+UPLOAD_QUEUE_TIMEOUT = 3.0  # Tempo máximo (s) que um pedido de chunk espera por um slot
+UPLOAD_WAIT_BUDGET = 6.0  # Espera máxima (s) de um pedido no holder, fila + banda; acima disso envia só parte do chunk
+UPLOAD_MIN_PIECE_BYTES = 16 * 1024  # Maior pedaço mínimo enviado quando o orçamento de banda já acabou
+UPLOAD_MIN_PIECE_WAIT = 0.25  # O pedaço mínimo nunca custa mais que isso de banda (no pior caso, slots x 0.25 s extras)
+UPLOAD_PEER_BUCKET_IDLE = 60.0  # Buckets de peers sem pedidos há este tempo (s) são descartados
+CHUNK_REQUEST_TIMEOUT = 10.0  # Timeout (s) do downloader nos pedidos de chunk/tamanho; maior que UPLOAD_WAIT_BUDGET + 1 s
+
+# Compressão negociada por chunk
+CHUNK_COMPRESSION_CODECS = ["zlib", "lzma"]  # Codecs aceitos pelo downloader, em ordem de preferência
+COMPRESSION_SERVING_CODECS = ["zlib"]  # Codecs que o holder usa ao servir (comprime inline no slot; lzma custa ~10x a CPU)
+COMPRESSION_SAMPLE_SIZE = 16 * 1024  # Bytes do início do chunk usados para estimar a compressibilidade
+COMPRESSION_MIN_RATIO = 0.9  # Só comprime se a amostra encolher para no máximo 90% do tamanho original
+COMPRESSION_MIN_CHUNK_SIZE = 512  # Chunks menores que isso vão sem compressão
+COMPRESSION_ZLIB_LEVEL = 6
+COMPRESSION_LZMA_PRESET = 1
+
+# Sincronização por delta (estilo rsync) de arquivos já baixados
+DELTA_MIN_BLOCK_SIZE = 2 * 1024  # Tamanho mínimo de bloco da assinatura
+DELTA_MAX_BLOCK_SIZE = 64 * 1024  # Tamanho máximo de bloco da assinatura
+DELTA_MAX_LITERAL_RUN = 1024 * 1024  # Dados literais são enviados em trechos de até 1 MB
+DELTA_MAX_LITERAL_RATIO = 0.5  # Acima desta fração do arquivo em literais, o download completo compensa mais
+DELTA_REQUEST_TIMEOUT = 60.0  # Timeout (s) da chamada que calcula uma página do delta no holder
+DELTA_PAGE_MAX_LITERAL_BYTES = 1024 * 1024  # Dados literais por resposta do delta; o restante vem nas páginas seguintes
+DELTA_PAGE_MAX_OPS = 10000  # Operações por página do delta (limita respostas de arquivos com muitas mudanças pequenas)
+DELTA_FIRST_PAGE_LITERAL_BYTES = 256 * 1024  # Literais da 1ª página; se ela vier quase toda literal, o delta é recusado
+DELTA_EARLY_REJECT_RATIO = 0.9  # Fração de literais no trecho da 1ª página acima da qual o delta é recusado
+DELTA_SESSION_TTL = 60.0  # Tempo (s) que o holder guarda a assinatura de um delta entre duas páginas
+DELTA_SESSION_MAX = 64  # Máximo de sessões de delta guardadas ao mesmo tempo por processo
+
+# Armazenamento endereçado por conteúdo e recompartilhamento de downloads
+CONTENT_STORE_BASE_DIR = "p2p_store"  # Pasta base do store (um subdiretório por peer)
+SHARE_DOWNLOADED_FILES = True  # Downloads concluídos são publicados na pasta compartilhada e anunciados ao tracker
+
+# Downloads de várias fontes com escalonamento "rarest-first"
+MULTI_SOURCE_MAX_HOLDERS = 4  # Máximo de holders (completos ou parciais) usados ao mesmo tempo em um download
+CHUNK_ANNOUNCE_INTERVAL = 2.0  # Intervalo mínimo (s) entre anúncios ao tracker dos chunks já baixados
+
+# Runtime assíncrono do peer
+RUNTIME_BLOCKING_WORKERS = 32  # Threads do pool que executa chamadas bloqueantes (Pyro, disco) do event loop
+RUNTIME_TIMER_WORKERS = 4  # Threads que executam os callbacks dos timers (heartbeat, timeouts, votos), fora do pool acima
+RUNTIME_CONTROL_WORKERS = 16  # Threads das RPCs de controle disparadas pelos timers (heartbeat a cada peer, pedidos de voto)
+
+# Pool de proxies Pyro5 (conexões reaproveitadas entre chamadas)
+PROXY_POOL_MAX_IDLE_PER_URI = 2  # Proxies ociosos mantidos por URI (cada conexão aberta ocupa uma thread do daemon remoto)
+PROXY_POOL_IDLE_TIMEOUT = 30.0  # Proxies ociosos há mais tempo que isso (s) são fechados
+PROXY_POOL_HEALTH_CHECK_AGE = 5.0  # Proxies parados há mais tempo que isso (s) são testados antes de reutilizar
+PROXY_POOL_CONNECT_TIMEOUT = 3.0  # Timeout (s) para abrir a conexão e para o teste de saúde
+
+# Logging (fila em memória + thread que grava no arquivo)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(peer_id)s - %(message)s'
+LOG_ROOT_LEVEL = "INFO"  # Nível padrão dos loggers do peer e das bibliotecas
+# Nível de cada subsistema (logger p2p.<subsistema>); DEBUG liga o detalhe só daquela parte
+LOG_SUBSYSTEM_LEVELS = {
+    "peer": "INFO",  # Ciclo de vida, eleição, CLI
+    "heartbeat": "INFO",  # Envio/recebimento de heartbeats e timers de falha do tracker
+    "tracker": "INFO",  # Registros e consultas recebidos quando sou o tracker
+    "transfer": "INFO",  # Chunks servidos e baixados
+}
+LOG_RATE_LIMITED_SUBSYSTEMS = ("heartbeat", "tracker", "transfer")  # Subsistemas com limite de taxa (caminhos quentes)
+LOG_RATE_LIMIT_INTERVAL = 10.0  # Janela (s) do limitador de taxa de logs
+LOG_RATE_LIMIT_BURST = 5  # Registros de uma mesma mensagem permitidos por janela (WARNING e acima sempre passam)
+
+# Métricas (método Pyro get_metrics e endpoint HTTP no formato do Prometheus)
+METRICS_HTTP_HOST = "localhost"  # Interface do endpoint HTTP de métricas
+METRICS_HTTP_BASE_PORT = 9464  # Primeira porta tentada (cada peer da máquina usa a próxima livre)
+METRICS_HTTP_PORT_ATTEMPTS = 50  # Quantas portas tentar a partir de METRICS_HTTP_BASE_PORT
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Limites (s) dos histogramas
+
+# Profiler por amostragem (API de administração start_profiling/stop_profiling)
+PROFILER_SAMPLE_INTERVAL = 0.01  # Intervalo (s) entre amostras das pilhas de todas as threads
+PROFILER_DEFAULT_DURATION = 30.0  # Duração (s) padrão de uma coleta
+PROFILER_MAX_DURATION = 600.0  # Duração máxima (s) aceita, para uma coleta esquecida não rodar para sempre
+PROFILER_MAX_STACK_DEPTH = 64  # Quadros mais internos mantidos por pilha
+
+# Rastreamento distribuído (spans por peer em TRACE_DIR, juntados por merge_traces.py)
+TRACING_ENABLED = True  # Grava spans dos fluxos de busca/download e eleição
+TRACE_DIR = "traces"  # Pasta dos arquivos <peer_id>_spans.jsonl
+TRACE_ANNOTATION = "P2PT"  # Chave (4 caracteres) da anotação Pyro5 que leva "trace_id:span_id"
+TRACE_FLUSH_INTERVAL = 1.0  # Intervalo mínimo (s) entre flushes do arquivo de spans
+
+# Resumo do índice em filtro de Bloom (enviado pelo tracker nos heartbeats, para respostas negativas locais)
+NETWORK_FILTER_ENABLED = True  # Tracker envia o filtro e peers respondem "não existe na rede" sem consultá-lo
+NETWORK_FILTER_FALSE_POSITIVE_RATE = 0.01  # Taxa de falso positivo (nomes ausentes que ainda vão ao tracker)
+NETWORK_FILTER_MIN_CAPACITY = 1024  # Capacidade mínima do filtro (evita redimensionar a cada arquivo novo)
+NETWORK_FILTER_MAX_STALE_RATIO = 0.25  # Reconstrói o filtro quando os nomes já removidos passam desta fração da capacidade
+NETWORK_FILTER_MAX_AGE = 2.0  # Filtro sem confirmação do tracker há mais que isso (s) não é usado
+
+# Cache no cliente das consultas ao tracker (query_file, get_all_indexed_files)
+LOOKUP_CACHE_ENABLED = True  # Repete respostas enquanto a época e a versão do índice não mudarem
+LOOKUP_CACHE_MAX_ENTRIES = 256  # Entradas mantidas (LRU)
+LOOKUP_CACHE_TTL = 30.0  # Validade máxima (s) de uma entrada, mesmo sem mudança de versão
+LOOKUP_CACHE_MAX_VERSION_AGE = 2.0  # Versão do índice vista em heartbeat há mais que isso (s) não valida o cache
+
+# Assinaturas de mudanças no índice (eventos add/remove empurrados pelo tracker)
+INDEX_CHANGE_LOG_SIZE = 10000  # Eventos mantidos no log do tracker (quem ficar mais para trás recebe a lista completa)
+SUBSCRIPTION_PUSH_INTERVAL = 0.5  # Intervalo mínimo (s) entre lotes para o mesmo assinante (agrupa rajadas)
+SUBSCRIPTION_MAX_BATCH = 500  # Eventos por lote
+SUBSCRIPTION_MAX_FAILURES = 20  # Envios seguidos com falha antes de o tracker descartar a assinatura
+SUBSCRIPTION_RESUME_AFTER = 5.0  # Sem lotes há mais que isso (s) com o índice à frente, o assinante retoma a assinatura
+
+# Gerenciador de downloads (fila persistente de jobs em segundo plano)
+DOWNLOAD_JOBS_DIR = "download_jobs"  # Pasta da fila de cada peer (<peer_id>.json)
+DOWNLOAD_MAX_CONCURRENT = 3  # Downloads simultâneos (cada um já usa várias fontes em paralelo)
+DOWNLOAD_MAX_ATTEMPTS = 8  # Tentativas por job antes de desistir
+DOWNLOAD_RETRY_BASE_DELAY = 2.0  # Espera (s) antes da 2ª tentativa; dobra a cada falha
+DOWNLOAD_RETRY_MAX_DELAY = 60.0  # Espera máxima (s) entre tentativas
+DOWNLOAD_JOBS_SAVE_INTERVAL = 2.0  # Intervalo mínimo (s) entre gravações do progresso dos jobs
+DOWNLOAD_JOBS_HISTORY = 100  # Jobs concluídos/falhos mantidos no histórico
+
+# Escrita dos downloads em disco (chunk_writer.py)
+CHUNK_WRITER_FSYNC_POLICY = "batch"  # "none", "close", "batch" ou "always" (ver chunk_writer.py)
+CHUNK_WRITER_FSYNC_BYTES = 64 * 1024 * 1024  # Na política "batch": fsync a cada tantos bytes gravados...
+CHUNK_WRITER_FSYNC_INTERVAL = 5.0  # ...ou a cada tantos segundos, o que vier primeiro
+
+# Cache de chunks servidos (chunk_cache.py)
+CHUNK_CACHE_ENABLED = True  # Serve da memória os chunks lidos recentemente (arquivos populares)
+CHUNK_CACHE_MAX_BYTES = 256 * 1024 * 1024  # Orçamento de memória do cache (LRU)
+CHUNK_CACHE_READAHEAD_BYTES = 4 * 1024 * 1024  # Leitura antecipada pedida ao SO em leituras frias sequenciais
+
+# Plano de dados (data_plane.py)
+DATA_PLANE_ENABLED = True  # Chunks/deltas em um daemon próprio, separado de heartbeats e eleições
+
+# Processos que servem a pasta compartilhada (serving_workers.py)
+SERVING_WORKERS = 0  # Processos de upload por peer (0 = tudo no processo principal); use até o nº de núcleos
+SERVING_WORKER_START_TIMEOUT = 15.0  # Espera máxima (s) pelo URI de cada worker
+
+# Leitura de arquivos remotos sem download completo (remote_file.py)
+REMOTE_FILE_CACHE_CHUNKS = 16  # Chunks mantidos em memória por arquivo aberto (LRU)
+REMOTE_FILE_MAX_READAHEAD = 8  # Máximo de chunks pedidos à frente em leitura sequencial
+REMOTE_PEEK_DEFAULT_BYTES = 256  # Bytes mostrados pelo comando 'peek' quando não informado
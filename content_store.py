@@ -0,0 +1,98 @@
+# content_store.py
+# Armazenamento endereçado por conteúdo de cada peer. Cada arquivo baixado vira um objeto
+# imutável em <raiz>/objects/<2 primeiros hex>/<hash>; as "visões" (pasta de download e pasta
+# compartilhada) são hardlinks para esse objeto, então o mesmo conteúdo ocupa disco uma vez só.
+
+import errno
+import os
+import shutil
+import stat
+
+from delta_sync import file_digest
+
+
+class ContentStore:
+    def __init__(self, root, logger):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.logger = logger
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def is_store_linked(self, path):
+        # True se 'path' é um hardlink de algum objeto do store (e não um arquivo próprio do usuário).
+        # Compara (inode, dispositivo) com os objetos sem ler o conteúdo: DirEntry.inode() vem do
+        # próprio diretório, então o custo é uma listagem do store, não um hash do arquivo
+        try:
+            st = os.stat(path)
+            store_dev = os.stat(self.objects_dir).st_dev
+        except OSError:
+            return False
+        if st.st_nlink < 2 or st.st_dev != store_dev:
+            return False
+        return any(obj_entry.inode() == st.st_ino for obj_entry in self._iter_objects())
+
+    def ingest(self, path):
+        """Adiciona o arquivo ao store e devolve seu hash. O arquivo original passa a ser um hardlink do objeto."""
+        digest = file_digest(path)
+        obj = self.object_path(digest)
+        if os.path.exists(obj):
+            # Conteúdo já conhecido: a visão vira um link para o objeto existente (deduplicação)
+            try:
+                self._link_or_copy(obj, path)
+                return digest
+            except FileNotFoundError:
+                pass  # Objeto sem visões removido pelo collect_garbage entre a checagem e o link
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        try:
+            os.link(path, obj)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copy2(path, obj)
+        # Objetos são imutáveis: protege contra escrita acidental através de qualquer visão
+        os.chmod(obj, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return digest
+
+    def link_into(self, digest, dest_path):
+        """Cria (ou substitui atomicamente) dest_path como hardlink do objeto 'digest'."""
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        self._link_or_copy(self.object_path(digest), dest_path)
+
+    def _link_or_copy(self, src, dest_path):
+        temp_path = dest_path + ".link.tmp"
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        try:
+            os.link(src, temp_path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            # Sistemas de arquivos diferentes ou sem suporte a hardlinks: cai para cópia
+            self.logger.debug(f"Store: hardlink indisponível para {dest_path} ({e}). Copiando.")
+            shutil.copy2(src, temp_path)
+        os.replace(temp_path, dest_path)
+
+    def _iter_objects(self):
+        for dir_entry in os.scandir(self.objects_dir):
+            if not dir_entry.is_dir():
+                continue
+            try:
+                with os.scandir(dir_entry.path) as objects:
+                    yield from objects
+            except OSError:
+                continue
+
+    def collect_garbage(self):
+        # Remove objetos que não são mais referenciados por nenhuma visão (apenas o link do próprio store)
+        removed = 0
+        for obj_entry in self._iter_objects():
+            try:
+                if obj_entry.stat().st_nlink == 1:
+                    os.remove(obj_entry.path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
@@ -0,0 +1,59 @@
+# data_plane.py
+# Plano de dados separado do plano de controle. O daemon principal do peer (URI registrado no servidor
+# de nomes) atende heartbeats, eleições, ping e o tracker; as transferências (chunks, deltas, tamanho
+# de arquivo) vão para um segundo daemon Pyro, com seu próprio socket e seu próprio pool de threads.
+# No servidor "thread" do Pyro5 cada conexão ocupa um worker enquanto estiver aberta; com um daemon só,
+# uma rajada de downloads esgota os workers e os heartbeats passam a ser recusados ou atrasados, o que
+# dispara eleições sem o tracker ter caído. Os downloaders descobrem o URI de dados com get_data_uri().
+
+import threading
+
+import Pyro5.api
+import Pyro5.server
+
+
+@Pyro5.api.expose
+class DataPlaneService:
+    """Métodos de transferência do peer, publicados no daemon de dados (delegam ao Peer)."""
+
+    def __init__(self, peer):
+        self._peer = peer
+
+    def request_file_chunk(self, filename, chunk_offset, chunk_size, requester_id=None):
+        return self._peer.request_file_chunk(filename, chunk_offset, chunk_size, requester_id)
+
+    def request_file_chunk_compressed(self, filename, chunk_offset, chunk_size, accepted_codecs, requester_id=None):
+        return self._peer.request_file_chunk_compressed(filename, chunk_offset, chunk_size, accepted_codecs,
+                                                        requester_id)
+
+    def request_file_delta(self, filename, signature, accepted_codecs=None, requester_id=None, cursor=None):
+        return self._peer.request_file_delta(filename, signature, accepted_codecs, requester_id, cursor)
+
+    def get_file_size(self, filename):
+        return self._peer.get_file_size(filename)
+
+
+class DataPlane:
+    """Daemon de dados rodando em uma thread própria."""
+
+    def __init__(self, peer, host, logger):
+        self.logger = logger
+        self.daemon = Pyro5.server.Daemon(host=host)
+        self.uri = self.daemon.register(DataPlaneService(peer))
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="DataPlane", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Plano de dados (chunks/deltas) em {self.uri}")
+
+    def _run(self):
+        try:
+            self.daemon.requestLoop()
+        except Exception as e:
+            self.logger.error(f"Daemon do plano de dados encerrado por erro: {e}")
+
+    def stop(self):
+        self.daemon.shutdown()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
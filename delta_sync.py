@@ -0,0 +1,321 @@
+# delta_sync.py
+# Sincronização por delta no estilo rsync. O downloader envia a assinatura (checksum fraco
+# rolante + checksum forte por bloco) da sua cópia antiga; o holder procura esses blocos no
+# arquivo atual e responde só com referências a blocos e os dados literais que mudaram.
+# O delta vai em páginas: cada resposta traz até DELTA_PAGE_MAX_LITERAL_BYTES de dados literais e
+# um cursor (offset no arquivo novo + literais já enviados + versão do arquivo + handle da sessão)
+# para a próxima. A assinatura é enviada uma vez: o holder a guarda, com o índice dos checksums, em
+# uma sessão de vida curta (DeltaSessions) referenciada pelo cursor. Nenhum dos lados monta o delta
+# inteiro em memória, e um arquivo que mudou quase todo é recusado já na primeira página (menor).
+
+import hashlib
+import math
+import mmap
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from chunk_codec import encode_chunk
+from constants import (
+    DELTA_MIN_BLOCK_SIZE, DELTA_MAX_BLOCK_SIZE, DELTA_MAX_LITERAL_RUN, DELTA_MAX_LITERAL_RATIO,
+    DELTA_PAGE_MAX_LITERAL_BYTES, DELTA_PAGE_MAX_OPS, DELTA_FIRST_PAGE_LITERAL_BYTES, DELTA_EARLY_REJECT_RATIO,
+    DELTA_SESSION_TTL, DELTA_SESSION_MAX
+)
+
+_ADLER_MOD = 65521
+
+
+def choose_block_size(file_size):
+    # Como no rsync: ~sqrt(tamanho), arredondado para múltiplo de 1 KiB e limitado
+    block_size = int(math.sqrt(max(file_size, 1))) // 1024 * 1024
+    return max(DELTA_MIN_BLOCK_SIZE, min(DELTA_MAX_BLOCK_SIZE, block_size))
+
+
+def strong_checksum(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(path):
+    # Hash do arquivo inteiro, usado para validar o resultado da reconstrução
+    digest = hashlib.blake2b(digest_size=32)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _map_file(f, size):
+    # mmap evita copiar o arquivo inteiro para a memória; arquivos vazios não podem ser mapeados
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+
+def compute_signature(path, block_size=None):
+    """Assinatura da cópia local: {'block_size', 'size', 'blocks': [[adler32, blake2b], ...]}."""
+    size = os.path.getsize(path)
+    block_size = block_size or choose_block_size(size)
+    blocks = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            blocks.append([zlib.adler32(block), strong_checksum(block)])
+    return {"block_size": block_size, "size": size, "blocks": blocks}
+
+
+class DeltaTooLarge(Exception):
+    """O arquivo mudou tanto que o delta não compensa em relação ao download completo."""
+
+
+class DeltaSourceChanged(Exception):
+    """O arquivo do holder mudou entre duas páginas do mesmo delta."""
+
+
+class DeltaSessionExpired(Exception):
+    """O cursor aponta para uma sessão que o holder já descartou; o cliente reenvia a assinatura."""
+
+
+def build_weak_index(signature):
+    # adler32 -> {blake2b -> índice do bloco}
+    weak_index = {}
+    for index, (weak, strong) in enumerate(signature["blocks"]):
+        weak_index.setdefault(weak, {}).setdefault(strong, index)
+    return weak_index
+
+
+class DeltaSessions:
+    """Assinaturas (e seus índices) dos deltas em andamento, por handle, com validade curta."""
+
+    def __init__(self, ttl=DELTA_SESSION_TTL, max_sessions=DELTA_SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # handle -> [assinatura, índice fraco, último uso]
+
+    def _prune(self, now):
+        # Chamado com _lock adquirido: expiradas e, acima do limite, as menos usadas
+        while self._sessions:
+            handle, entry = next(iter(self._sessions.items()))
+            if now - entry[2] < self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[handle]
+
+    def open(self, signature):
+        weak_index = build_weak_index(signature)  # Fora do lock: O(blocos)
+        handle = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[handle] = [signature, weak_index, now]
+            self._prune(now)
+        return handle, signature, weak_index
+
+    def get(self, handle):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._sessions.get(handle)
+            if entry is None:
+                return None
+            entry[2] = now
+            self._sessions.move_to_end(handle)
+            return entry[0], entry[1]
+
+    def close(self, handle):
+        with self._lock:
+            self._sessions.pop(handle, None)
+
+
+def compute_delta(path, signature, max_literal_bytes=None, start=0, literal_before=0,
+                  page_literal_bytes=None, page_max_ops=None, weak_index=None):
+    """Gera as operações para transformar a cópia descrita por 'signature' no arquivo 'path'.
+
+    Operações: ['copy', primeiro_bloco, quantidade] ou ['data', bytes]. Regiões inalteradas
+    são verificadas bloco a bloco com zlib.adler32 (em C); só as regiões alteradas pagam o
+    custo de rolar o checksum byte a byte em Python, então o custo acompanha o tamanho da mudança.
+
+    Paginação: começa no offset 'start' do arquivo novo e para (entre duas operações) depois de
+    page_literal_bytes literais ou page_max_ops operações. Retorna (ops, próximo_offset, literais),
+    com próximo_offset None na última página; 'literais' soma literal_before, para que o limite
+    max_literal_bytes valha para o delta inteiro. weak_index (de build_weak_index) evita
+    reconstruir o índice a cada página.
+    """
+    block_size = signature["block_size"]
+    if weak_index is None:
+        weak_index = build_weak_index(signature)
+
+    ops = []
+    literal = bytearray()
+    literal_total = literal_before
+
+    def emit_copy(block_index):
+        if ops and ops[-1][0] == "copy" and ops[-1][1] + ops[-1][2] == block_index:
+            ops[-1][2] += 1
+        else:
+            ops.append(["copy", block_index, 1])
+
+    def flush_literal():
+        nonlocal literal
+        if literal:
+            ops.append(["data", bytes(literal)])
+            literal = bytearray()
+
+    # Último bloco da cópia antiga, que pode ser menor que block_size
+    num_blocks = len(signature["blocks"])
+    last_block_len = signature["size"] - (num_blocks - 1) * block_size if num_blocks else 0
+
+    def add_literal(chunk):
+        nonlocal literal_total
+        literal_total += len(chunk)
+        if max_literal_bytes is not None and literal_total > max_literal_bytes:
+            raise DeltaTooLarge(f"mais de {max_literal_bytes} bytes literais")
+        literal.extend(chunk)
+        if len(literal) >= DELTA_MAX_LITERAL_RUN or \
+                (page_literal_bytes is not None and literal_total - literal_before >= page_literal_bytes):
+            flush_literal()  # Na cota da página: a próxima iteração encerra a página
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        data = _map_file(f, size)
+        try:
+            pos = start
+            weak = None  # Checksum do bloco [pos, pos + block_size), mantido enquanto rola
+            while pos < size:
+                if ops and not literal and (
+                        (page_literal_bytes is not None and literal_total - literal_before >= page_literal_bytes)
+                        or (page_max_ops is not None and len(ops) >= page_max_ops)):
+                    # Fim da página: nada pendente, e a próxima recomeça em pos com o mesmo resultado
+                    # (o checksum da janela é recalculado em vez de rolado)
+                    return ops, pos, literal_total
+                end = min(pos + block_size, size)
+                if weak is None:
+                    weak = zlib.adler32(data[pos:end])
+                candidates = weak_index.get(weak)
+                if candidates is not None:
+                    match = candidates.get(strong_checksum(data[pos:end]))
+                    if match is not None:
+                        flush_literal()
+                        emit_copy(match)
+                        pos = end
+                        weak = None
+                        continue
+                if end >= size:
+                    # A janela chegou ao fim do arquivo: resta apenas tentar casar o final com o
+                    # último bloco (parcial) da cópia antiga; o que sobrar vai como literal.
+                    tail_start = size - last_block_len
+                    if 0 < last_block_len < block_size and tail_start > pos and \
+                            strong_checksum(data[tail_start:size]) == signature["blocks"][-1][1]:
+                        add_literal(data[pos:tail_start])
+                        flush_literal()
+                        emit_copy(num_blocks - 1)
+                    else:
+                        add_literal(data[pos:size])
+                    break
+                # Sem correspondência: o byte atual vira literal e a janela rola um byte
+                add_literal(data[pos:pos + 1])
+                weak = _roll_adler32(weak, data[pos], data[end], block_size)
+                pos += 1
+            flush_literal()
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    return ops, None, literal_total
+
+
+def file_version(path):
+    # Identifica a versão do arquivo entre as páginas de um delta sem reler o conteúdo
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def delta_page_response(path, signature, cursor, accepted_codecs, sessions,
+                        page_literal_bytes=DELTA_PAGE_MAX_LITERAL_BYTES):
+    """Resposta de request_file_delta para a página indicada por 'cursor' (None = primeira).
+
+    'signature' só é necessária na primeira página (ou quando a sessão expirou); as seguintes usam
+    a guardada em 'sessions'. Retorna (resposta, bytes_na_rede). Levanta DeltaTooLarge se o delta
+    não compensar, DeltaSourceChanged se o arquivo mudou desde a primeira página e
+    DeltaSessionExpired se a sessão do cursor não existe mais e a assinatura não veio.
+    """
+    version = file_version(path)
+    size = version[0]
+    if cursor is None:
+        start, literal_before = 0, 0
+        # Primeira página menor: um arquivo que mudou quase todo é recusado com pouco trabalho
+        page_literal_bytes = min(page_literal_bytes, DELTA_FIRST_PAGE_LITERAL_BYTES)
+    else:
+        if list(cursor.get("version") or ()) != version:
+            raise DeltaSourceChanged(f"'{path}' mudou durante o delta")
+        start, literal_before = cursor["pos"], cursor["literal"]
+    session = sessions.get(cursor.get("session")) if cursor is not None else None
+    if session is not None:
+        handle = cursor["session"]
+        signature, weak_index = session
+    elif signature is not None:
+        handle, signature, weak_index = sessions.open(signature)
+    else:
+        raise DeltaSessionExpired("sessão de delta expirada")
+    max_literal_bytes = int(size * DELTA_MAX_LITERAL_RATIO)
+    try:
+        ops, next_pos, literal_total = compute_delta(
+            path, signature, max_literal_bytes=max_literal_bytes, start=start, literal_before=literal_before,
+            page_literal_bytes=page_literal_bytes, page_max_ops=DELTA_PAGE_MAX_OPS, weak_index=weak_index)
+        if cursor is None and next_pos is not None and literal_total > next_pos * DELTA_EARLY_REJECT_RATIO:
+            # O trecho já varrido é quase todo literal (arquivo reescrito): o resto provavelmente também
+            raise DeltaTooLarge(f"{literal_total} de {next_pos} bytes iniciais são literais")
+    except DeltaTooLarge:
+        sessions.close(handle)
+        raise
+    if next_pos is None:
+        sessions.close(handle)
+    wire_bytes = 0
+    for op in ops:
+        if op[0] == "data":
+            op[1] = encode_chunk(op[1], accepted_codecs or [])
+            wire_bytes += len(op[1]["data"])
+    response = {"status": "ok", "size": size, "block_size": signature["block_size"], "ops": ops,
+                "next": None if next_pos is None else {"pos": next_pos, "literal": literal_total,
+                                                       "version": version, "session": handle}}
+    if cursor is None:
+        # Hash do arquivo inteiro só na primeira página; as seguintes são amarradas a ela pela versão
+        response["digest"] = file_digest(path)
+    return response, wire_bytes
+
+
+def _roll_adler32(checksum, byte_out, byte_in, window):
+    # Desliza a janela do adler32 um byte para a frente (mesmo resultado de zlib.adler32 na nova janela)
+    a = checksum & 0xFFFF
+    b = checksum >> 16
+    a = (a - byte_out + byte_in) % _ADLER_MOD
+    b = (b - window * byte_out + a - 1) % _ADLER_MOD
+    return (b << 16) | a
+
+
+def apply_delta(old_path, ops, out_path, block_size, to_bytes=bytes):
+    """Reconstrói o arquivo novo em out_path a partir da cópia antiga e das operações do delta."""
+    with open(old_path, "rb") as old, open(out_path, "wb") as out:
+        write_delta_ops(old, out, ops, block_size, to_bytes)
+
+
+def write_delta_ops(old, out, ops, block_size, to_bytes=bytes):
+    # Aplica uma sequência de operações (ex.: uma página do delta) nos arquivos já abertos
+    for op in ops:
+        if op[0] == "copy":
+            old.seek(op[1] * block_size)
+            remaining = op[2] * block_size
+            while remaining > 0:
+                block = old.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                out.write(block)
+                remaining -= len(block)
+        elif op[0] == "data":
+            out.write(to_bytes(op[1]))
+        else:
+            raise ValueError(f"operação de delta desconhecida: {op[0]}")
+
+
+def delta_stats(ops, block_size):
+    # (bytes reaproveitados da cópia local, bytes literais) — o último bloco pode ser parcial
+    copied = sum(op[2] for op in ops if op[0] == "copy") * block_size
+    literal = sum(len(op[1]) for op in ops if op[0] == "data" and isinstance(op[1], (bytes, bytearray)))
+    return copied, literal
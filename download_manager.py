@@ -0,0 +1,278 @@
+# download_manager.py
+# Gerenciador de downloads em segundo plano: fila persistente de jobs com prioridade, limite global de
+# downloads simultâneos, progresso/vazão por job e novas tentativas com backoff exponencial (evitando
+# os holders que já falharam). A fila é gravada em DOWNLOAD_JOBS_DIR/<peer_id>.json a cada mudança de
+# estado (e periodicamente durante o download, com o bitfield dos chunks já gravados), então os jobs
+# continuam de onde pararam quando o peer é reiniciado.
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import (
+    DOWNLOAD_JOBS_DIR, DOWNLOAD_MAX_CONCURRENT, DOWNLOAD_MAX_ATTEMPTS, DOWNLOAD_RETRY_BASE_DELAY,
+    DOWNLOAD_RETRY_MAX_DELAY, DOWNLOAD_JOBS_SAVE_INTERVAL, DOWNLOAD_JOBS_HISTORY
+)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class DownloadCancelled(Exception):
+    """Levantada pelo download quando o job é cancelado no meio da transferência."""
+
+
+class DownloadJob:
+    """Um arquivo a baixar, com o estado da última tentativa."""
+
+    FIELDS = ("job_id", "filename", "priority", "state", "attempts", "next_attempt_at", "created_at",
+              "started_at", "finished_at", "total_size", "bytes_done", "resume_bits", "failed_holders", "error")
+
+    def __init__(self, job_id, filename, priority=0):
+        self.job_id = job_id
+        self.filename = filename
+        self.priority = priority  # Maior primeiro; empate = ordem de criação
+        self.state = QUEUED
+        self.attempts = 0
+        self.next_attempt_at = 0.0  # time.time() a partir do qual pode rodar (backoff)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.total_size = None
+        self.bytes_done = 0
+        self.resume_bits = None  # Bitfield (hex) dos chunks já gravados no .part, para retomar
+        self.failed_holders = []  # URIs que falharam neste job (evitados nas próximas tentativas)
+        self.error = None
+        # Só em memória: vazão da tentativa atual
+        self.cancel_requested = False
+        self._attempt_started = None
+        self._attempt_start_bytes = 0
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["job_id"], data["filename"], data.get("priority", 0))
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(job, field, data[field])
+        return job
+
+    def update_progress(self, bytes_done, total_size, bits=None):
+        """Chamado pelo download a cada chunk (bits = bitfield atual do .part, se houver)."""
+        self.bytes_done = bytes_done
+        self.total_size = total_size
+        if bits is not None:
+            self.resume_bits = bits.hex()
+
+    def throughput(self):
+        # Bytes/s da tentativa em andamento (0 fora dela)
+        if self.state != RUNNING or self._attempt_started is None:
+            return 0.0
+        elapsed = time.monotonic() - self._attempt_started
+        return (self.bytes_done - self._attempt_start_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def describe(self):
+        size = f"{self.bytes_done}/{self.total_size}" if self.total_size else f"{self.bytes_done}/?"
+        progress = f" ({self.bytes_done / self.total_size * 100:.1f}%)" if self.total_size else ""
+        text = f"#{self.job_id} [{self.state}] {self.filename} p={self.priority} {size} bytes{progress}"
+        if self.state == RUNNING:
+            text += f", {self.throughput() / 1024:.0f} KiB/s"
+        if self.state == QUEUED and self.attempts:
+            text += f", tentativa {self.attempts + 1} em {max(0.0, self.next_attempt_at - time.time()):.0f}s"
+        if self.error and self.state != DONE:
+            text += f" - {self.error}"
+        return text
+
+
+class DownloadManager:
+    def __init__(self, peer_id, run_job, runtime, logger, metrics=None, directory=DOWNLOAD_JOBS_DIR,
+                 max_concurrent=DOWNLOAD_MAX_CONCURRENT):
+        # run_job(job) -> True se o arquivo foi baixado; exceções e False contam como falha da tentativa
+        self.run_job = run_job
+        self.runtime = runtime
+        self.logger = logger
+        self.metrics = metrics
+        self.max_concurrent = max_concurrent
+        self.path = os.path.join(directory, f"{peer_id}.json")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._next_id = 1
+        self._running = set()
+        self._wakeup = None
+        self._last_save = 0.0
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"Download-{peer_id}")
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # --- Persistência ---
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Fila de downloads em {self.path} ilegível ({e}); começando vazia.")
+            return
+        for job_data in data.get("jobs", []):
+            job = DownloadJob.from_dict(job_data)
+            if job.state == RUNNING:  # Interrompido pelo encerramento do peer: retoma
+                job.state = QUEUED
+                job.next_attempt_at = 0.0
+            self._jobs[job.job_id] = job
+        self._next_id = max(self._jobs, default=0) + 1
+        pending = sum(1 for job in self._jobs.values() if job.state == QUEUED)
+        if pending:
+            self.logger.info(f"{pending} download(s) pendente(s) recuperado(s) de {self.path}.")
+
+    def _save(self):
+        # Chamado com _lock adquirido; grava em arquivo temporário e troca (nunca deixa a fila pela metade)
+        finished = sorted((job for job in self._jobs.values() if job.state in FINISHED_STATES),
+                          key=lambda job: job.finished_at or 0)
+        for job in finished[:max(0, len(finished) - DOWNLOAD_JOBS_HISTORY)]:
+            del self._jobs[job.job_id]  # Histórico limitado aos DOWNLOAD_JOBS_HISTORY mais recentes
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"jobs": [job.to_dict() for job in self._jobs.values()]}, f)
+            os.replace(tmp_path, self.path)
+            self._last_save = time.monotonic()
+        except OSError as e:
+            self.logger.error(f"Erro ao gravar a fila de downloads em {self.path}: {e}")
+
+    def save_progress(self):
+        """Grava o progresso dos jobs em andamento, no máximo a cada DOWNLOAD_JOBS_SAVE_INTERVAL."""
+        if time.monotonic() - self._last_save < DOWNLOAD_JOBS_SAVE_INTERVAL:
+            return
+        with self._lock:
+            self._save()
+
+    # --- API ---
+    def start(self):
+        self._dispatch()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+            self._save()
+        # Downloads em andamento são interrompidos junto com o runtime; na volta, são retomados
+        self._executor.shutdown(wait=False)
+
+    def enqueue(self, filename, priority=0):
+        with self._lock:
+            for job in self._jobs.values():
+                if job.filename == filename and job.state in (QUEUED, RUNNING):
+                    return job  # Já na fila
+            job = DownloadJob(self._next_id, filename, priority)
+            self._next_id += 1
+            self._jobs[job.job_id] = job
+            self._save()
+        self.logger.info(f"Download de '{filename}' adicionado à fila (job #{job.job_id}, prioridade {priority}).")
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINISHED_STATES:
+                return False
+            job.cancel_requested = True
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+            self._save()
+        return True
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.job_id)
+
+    def stats(self):
+        with self._lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+            for job in self._jobs.values():
+                counts[job.state] += 1
+            counts["throughput"] = sum(job.throughput() for job in self._jobs.values())
+            return counts
+
+    # --- Escalonamento ---
+    def _dispatch(self):
+        # Inicia os jobs prontos de maior prioridade até o limite; agenda o próximo despertar do backoff
+        with self._lock:
+            if self._stopped:
+                return
+            now = time.time()
+            queued = sorted((job for job in self._jobs.values() if job.state == QUEUED),
+                            key=lambda job: (-job.priority, job.job_id))
+            ready = [job for job in queued if job.next_attempt_at <= now]
+            to_start = ready[:max(0, self.max_concurrent - len(self._running))]
+            for job in to_start:
+                job.state = RUNNING
+                job.attempts += 1
+                job.started_at = job.started_at or time.time()
+                job._attempt_started = time.monotonic()
+                job._attempt_start_bytes = job.bytes_done
+                self._running.add(job.job_id)
+            if to_start:
+                self._save()
+            waiting = [job.next_attempt_at for job in queued if job.next_attempt_at > now]
+            if self._wakeup is not None:
+                self._wakeup.cancel()
+                self._wakeup = None
+            if waiting:
+                self._wakeup = self.runtime.call_later(min(waiting) - now + 0.01, self._dispatch)
+        for job in to_start:
+            self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        ok = False
+        try:
+            ok = bool(self.run_job(job))
+            if not ok and not job.error:
+                job.error = "download não concluído"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            self.logger.error(f"Erro no job #{job.job_id} ('{job.filename}'): {e}")
+        with self._lock:
+            self._running.discard(job.job_id)
+            if ok:
+                job.state = DONE
+                job.error = None
+                job.resume_bits = None
+                job.finished_at = time.time()
+                result = "done"
+            elif job.cancel_requested:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+                result = "cancelled"
+            elif job.attempts >= DOWNLOAD_MAX_ATTEMPTS:
+                job.state = FAILED
+                job.finished_at = time.time()
+                result = "failed"
+            else:
+                # Backoff exponencial com jitter; a próxima tentativa evita os holders que falharam
+                delay = min(DOWNLOAD_RETRY_MAX_DELAY, DOWNLOAD_RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+                job.next_attempt_at = time.time() + delay * random.uniform(0.8, 1.2)
+                job.state = QUEUED
+                result = "retry"
+            self._save()
+        if self.metrics is not None:
+            self.metrics.download_jobs.inc(result=result)
+        if result == "done":
+            self.logger.info(f"Job #{job.job_id}: '{job.filename}' baixado ({job.bytes_done} bytes, "
+                             f"tentativa {job.attempts}).")
+        elif result == "retry":
+            self.logger.warning(f"Job #{job.job_id}: tentativa {job.attempts} de '{job.filename}' falhou "
+                                f"({job.error}); nova tentativa em {job.next_attempt_at - time.time():.1f}s.")
+        elif result == "failed":
+            self.logger.error(f"Job #{job.job_id}: '{job.filename}' desistido após {job.attempts} tentativas "
+                              f"({job.error}).")
+        self._dispatch()
@@ -0,0 +1,330 @@
+# file_watcher.py
+# Observa a árvore compartilhada em segundo plano e entrega as diferenças (adições/remoções)
+# ao peer, sem depender do comando 'refresh'. Usa inotify no Linux (um watch por diretório)
+# e, na falta dele, um modo polling baseado em os.scandir com cache de stat.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+
+from constants import WATCHER_COALESCE_WINDOW, WATCHER_MAX_DELAY, WATCHER_POLL_INTERVAL, SHARED_EXCLUDE_PATTERNS
+from shared_tree import compile_exclude_patterns, is_excluded, scan_shared_tree, to_local_path
+
+# Constantes do inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc_inotify():
+    # Retorna a libc com as funções de inotify, ou None se não estiverem disponíveis
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class SharedFolderWatcher:
+    """Observa a árvore compartilhada e chama on_change(arquivos_atuais, adicionados, removidos, modificados)."""
+
+    def __init__(self, folder, on_change, logger, exclude_patterns=SHARED_EXCLUDE_PATTERNS,
+                 coalesce_window=WATCHER_COALESCE_WINDOW, max_delay=WATCHER_MAX_DELAY,
+                 poll_interval=WATCHER_POLL_INTERVAL):
+        self.folder = folder
+        self.on_change = on_change
+        self.logger = logger
+        self.exclude_regex = compile_exclude_patterns(exclude_patterns)
+        self.coalesce_window = coalesce_window
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._inotify_fd = None
+        self._libc = None
+        self._root_wd = None
+        self._wd_to_dir = {}  # watch descriptor -> prefixo relativo do diretório ("" para a raiz)
+        self.backend = None
+
+        # Estado conhecido: nome -> (inode, mtime_ns, tamanho). É a "foto" mantida pelo observador.
+        self._stat_cache = self._full_scan()
+
+    # --- API pública ---
+    def start(self):
+        self._libc = _load_libc_inotify()
+        if self._libc is not None:
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                self._inotify_fd = fd
+            if fd >= 0 and self._add_watch_tree(""):
+                self._root_wd = next(wd for wd, prefix in self._wd_to_dir.items() if prefix == "")
+                self.backend = "inotify"
+            else:
+                err = ctypes.get_errno()
+                if fd >= 0:
+                    os.close(fd)
+                self._inotify_fd = None
+                self._wd_to_dir = {}
+                self.logger.warning(
+                    f"Observador: inotify indisponível ({errno.errorcode.get(err, err)}). Usando polling.")
+        if self.backend is None:
+            self.backend = "polling"
+        else:
+            # Revarre após instalar os watches para não perder o que mudou entre o __init__ e agora
+            current = self._full_scan()
+            with self._lock:
+                self._stat_cache = current
+
+        target = self._run_inotify if self.backend == "inotify" else self._run_polling
+        self._thread = threading.Thread(target=target, name="SharedFolderWatcher", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Observador da pasta compartilhada iniciado (modo {self.backend}): {self.folder}")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=max(self.poll_interval, self.coalesce_window) + 1)
+        if self._inotify_fd is not None:
+            try:
+                os.close(self._inotify_fd)
+            except OSError:
+                pass
+            self._inotify_fd = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def snapshot(self):
+        # Lista atual de arquivos conhecidos pelo observador (sem acessar o disco)
+        with self._lock:
+            return sorted(self._stat_cache)
+
+    # --- Varredura e stat ---
+    def _stat_entry(self, name):
+        # Retorna (inode, mtime_ns, tamanho) se 'name' for um arquivo regular, senão None
+        local_path = to_local_path(self.folder, name)
+        if local_path is None:
+            return None
+        try:
+            st = os.stat(local_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _full_scan(self):
+        # Varredura completa da árvore, usada no início, no polling e em caso de overflow do inotify
+        return scan_shared_tree(self.folder, self.exclude_regex, with_stat=True)
+
+    def _apply(self, new_state_by_name):
+        # Aplica novos estados (nome -> stat ou None) ao cache e devolve (adicionados, removidos, modificados)
+        added, removed, modified = [], [], []
+        with self._lock:
+            for name, new_st in new_state_by_name.items():
+                old_st = self._stat_cache.get(name)
+                if new_st is None:
+                    if old_st is not None:
+                        del self._stat_cache[name]
+                        removed.append(name)
+                elif old_st is None:
+                    self._stat_cache[name] = new_st
+                    added.append(name)
+                elif old_st != new_st:
+                    self._stat_cache[name] = new_st
+                    modified.append(name)
+        return added, removed, modified
+
+    def _notify(self, added, removed, modified):
+        if not (added or removed or modified):
+            return
+        try:
+            self.on_change(self.snapshot(), added, removed, modified)
+        except Exception as e:
+            self.logger.error(f"Observador: erro ao processar mudanças na pasta compartilhada: {e}")
+
+    # --- Backend polling ---
+    def _run_polling(self):
+        # Mantém o cache de stat e compara apenas (inode, mtime, tamanho) de cada entrada
+        while not self._stop_event.wait(self.poll_interval):
+            current = self._full_scan()
+            with self._lock:
+                changes = {name: None for name in self._stat_cache if name not in current}
+            for name, st in current.items():
+                changes[name] = st
+            self._notify(*self._apply(changes))
+
+    # --- Backend inotify ---
+    def _add_watch_tree(self, rel_dir):
+        # Adiciona watches para rel_dir e todos os subdiretórios (iterativo; "" é a raiz)
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            abs_dir = to_local_path(self.folder, current.rstrip("/")) if current else self.folder
+            if abs_dir is None:
+                continue
+            wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(abs_dir), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if current == "":
+                    return False
+                self.logger.warning(
+                    f"Observador: não foi possível observar '{current}' ({errno.errorcode.get(err, err)}).")
+                continue
+            self._wd_to_dir[wd] = current
+            try:
+                with os.scandir(abs_dir) as it:
+                    for entry in it:
+                        rel_name = current + entry.name
+                        if not is_excluded(rel_name, self.exclude_regex) and entry.is_dir(follow_symlinks=False):
+                            pending.append(rel_name + "/")
+            except OSError:
+                continue
+        return True
+
+    def _forget_watch_tree(self, rel_dir):
+        # Remove os watches de um diretório que saiu da árvore (removido ou movido para fora)
+        for wd, prefix in list(self._wd_to_dir.items()):
+            if prefix.startswith(rel_dir):
+                self._libc.inotify_rm_watch(self._inotify_fd, wd)
+                self._wd_to_dir.pop(wd, None)
+
+    def _read_inotify_events(self, batch):
+        # Lê os eventos pendentes e acumula em batch (dict com conjuntos de nomes/diretórios afetados)
+        while True:
+            try:
+                buf = os.read(self._inotify_fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError:
+                batch["folder_gone"] = True
+                break
+            if not buf:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(buf):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(buf, offset)
+                offset += _EVENT_HEADER.size
+                raw_name = buf[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    batch["overflow"] = True
+                    continue
+                rel_dir = self._wd_to_dir.get(wd)
+                if mask & IN_IGNORED:
+                    self._wd_to_dir.pop(wd, None)
+                    if wd == self._root_wd:
+                        batch["folder_gone"] = True
+                    continue
+                if rel_dir is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    if wd == self._root_wd:
+                        batch["folder_gone"] = True
+                    continue  # Para subdiretórios, o evento no diretório pai já trata o caso
+                if not raw_name:
+                    continue
+                rel_name = rel_dir + os.fsdecode(raw_name)
+                if is_excluded(rel_name, self.exclude_regex):
+                    continue
+                if mask & IN_ISDIR:
+                    if mask & (IN_DELETE | IN_MOVED_FROM):
+                        batch["gone_dirs"].add(rel_name + "/")
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        batch["new_dirs"].add(rel_name + "/")
+                else:
+                    batch["names"].add(rel_name)
+
+    def _run_inotify(self):
+        fd = self._inotify_fd
+        while not self._stop_event.is_set():
+            try:
+                ready, _, _ = select.select([fd], [], [], 0.5)
+            except (OSError, ValueError):
+                break
+            if not ready:
+                continue
+
+            # Agrupa a rajada: continua lendo enquanto chegarem eventos dentro da janela,
+            # limitado por max_delay para que o tracker não fique desatualizado indefinidamente.
+            batch = {"names": set(), "new_dirs": set(), "gone_dirs": set(), "overflow": False, "folder_gone": False}
+            burst_start = time.monotonic()
+            while True:
+                self._read_inotify_events(batch)
+                remaining = self.max_delay - (time.monotonic() - burst_start)
+                if batch["folder_gone"] or remaining <= 0 or self._stop_event.is_set():
+                    break
+                try:
+                    more, _, _ = select.select([fd], [], [], min(self.coalesce_window, remaining))
+                except (OSError, ValueError):
+                    break
+                if not more:
+                    break
+
+            if batch["overflow"]:
+                self.logger.warning("Observador: fila do inotify transbordou. Fazendo varredura completa.")
+                for new_dir in batch["new_dirs"]:
+                    self._add_watch_tree(new_dir)
+                current = self._full_scan()
+                with self._lock:
+                    changes = {name: None for name in self._stat_cache if name not in current}
+                changes.update(current)
+            else:
+                # Custo proporcional às mudanças, não ao tamanho da árvore
+                changes = {}
+                if batch["gone_dirs"]:
+                    with self._lock:
+                        for gone_dir in batch["gone_dirs"]:
+                            self._forget_watch_tree(gone_dir)
+                            changes.update((name, None) for name in self._stat_cache if name.startswith(gone_dir))
+                for new_dir in batch["new_dirs"]:
+                    # Diretório criado/movido para dentro da árvore: observa e varre só essa subárvore
+                    self._add_watch_tree(new_dir)
+                    abs_dir = to_local_path(self.folder, new_dir.rstrip("/"))
+                    if abs_dir:
+                        changes.update(scan_shared_tree(abs_dir, self.exclude_regex, with_stat=True, prefix=new_dir))
+                for name in batch["names"]:
+                    changes[name] = self._stat_entry(name)
+            self._notify(*self._apply(changes))
+
+            if batch["folder_gone"]:
+                self.logger.warning("Observador: a pasta compartilhada foi removida/movida. Voltando ao modo polling.")
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+                self._inotify_fd = None
+                self._wd_to_dir = {}
+                self.backend = "polling"
+                self._run_polling()
+                return
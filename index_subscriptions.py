@@ -0,0 +1,132 @@
+# index_subscriptions.py
+# Assinaturas de mudanças no índice do tracker. Um peer assina um padrão glob ("*" = todos os
+# arquivos, "dataset/*" = um prefixo) e o tracker empurra em lotes os eventos "add" (o nome entrou no
+# índice) e "remove" (o último holder saiu), em vez de o peer repetir get_all_indexed_files e comparar
+# o índice inteiro. O número de sequência é a versão do índice: quem reconecta retoma da última
+# versão recebida; se os eventos já saíram do log do tracker, recebe a lista completa (ressincronização).
+
+import fnmatch
+import itertools
+import threading
+import time
+
+
+class Subscription:
+    """Assinatura registrada no tracker (o que já foi entregue a um peer e o que falta)."""
+
+    __slots__ = ("subscription_id", "peer_id", "callback_uri", "pattern", "delivered_version", "failures",
+                 "in_flight", "next_push_at")
+
+    def __init__(self, subscription_id, peer_id, callback_uri, pattern, delivered_version):
+        self.subscription_id = subscription_id
+        self.peer_id = peer_id
+        self.callback_uri = callback_uri
+        self.pattern = pattern
+        self.delivered_version = delivered_version  # Eventos até esta versão já foram entregues
+        self.failures = 0  # Envios seguidos que falharam
+        self.in_flight = False  # Um lote por vez para cada assinante, na ordem
+        self.next_push_at = 0.0
+
+    def matches(self, filename):
+        return fnmatch.fnmatchcase(filename, self.pattern)
+
+    def next_batch(self, tracker_index, max_events):
+        """(eventos, versão_até, nomes_para_ressincronizar) a enviar; nomes é None fora da ressincronização."""
+        changes = tracker_index.changes_since(self.delivered_version)
+        if changes is None:
+            # Eventos já descartados do log: envia o conjunto atual de nomes que casam com o padrão
+            snapshot = tracker_index.snapshot()
+            return [], snapshot.version, [name for name in snapshot.files if self.matches(name)]
+        events, upto_version = changes
+        events = [event for event in events if self.matches(event[2])]
+        if len(events) > max_events:
+            # Corta no limite do lote sem separar eventos da mesma versão (a próxima retoma da seguinte)
+            cut = max_events
+            while cut < len(events) and events[cut][0] == events[cut - 1][0]:
+                cut += 1
+            events = events[:cut]
+            upto_version = events[-1][0]
+        return events, upto_version, None
+
+
+class SubscriptionRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._ids = itertools.count(1)
+
+    def subscribe(self, peer_id, callback_uri, pattern, delivered_version):
+        # Um peer tem no máximo uma assinatura: assinar de novo substitui a anterior
+        with self._lock:
+            for subscription_id, existing in list(self._subscriptions.items()):
+                if existing.peer_id == peer_id:
+                    del self._subscriptions[subscription_id]
+            subscription = Subscription(next(self._ids), peer_id, callback_uri, pattern, delivered_version)
+            self._subscriptions[subscription.subscription_id] = subscription
+            return subscription
+
+    def unsubscribe(self, subscription_id):
+        with self._lock:
+            return self._subscriptions.pop(subscription_id, None)
+
+    def all(self):
+        with self._lock:
+            return list(self._subscriptions.values())
+
+    def clear(self):
+        with self._lock:
+            self._subscriptions.clear()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+class IndexMirror:
+    """Lado do assinante: cópia local dos nomes do índice que casam com o padrão assinado."""
+
+    __slots__ = ("pattern", "subscription_id", "tracker_epoch", "version", "files", "updated_at", "resubscribing",
+                 "_lock")
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.subscription_id = None
+        self.tracker_epoch = None
+        self.version = None  # Última versão do índice aplicada (ponto de retomada)
+        self.files = set()
+        self.updated_at = time.monotonic()
+        self.resubscribing = False
+        self._lock = threading.Lock()
+
+    def attach(self, subscription_id, tracker_epoch, resumed):
+        # Nova assinatura no tracker; sem retomada, a lista completa chega no primeiro lote
+        with self._lock:
+            self.subscription_id = subscription_id
+            if not resumed:
+                self.tracker_epoch = tracker_epoch
+                self.version = None
+            self.updated_at = time.monotonic()
+            self.resubscribing = False
+
+    def apply(self, events, upto_version, snapshot_names=None):
+        """Aplica um lote; devolve (adicionados, removidos)."""
+        with self._lock:
+            if snapshot_names is not None:
+                names = set(snapshot_names)
+                added, removed = sorted(names - self.files), sorted(self.files - names)
+                self.files = names
+            else:
+                added, removed = [], []
+                for _, op, name in events:
+                    if op == "add" and name not in self.files:
+                        self.files.add(name)
+                        added.append(name)
+                    elif op == "remove" and name in self.files:
+                        self.files.discard(name)
+                        removed.append(name)
+            self.version = upto_version
+            self.updated_at = time.monotonic()
+            return added, removed
+
+    def sorted_files(self):
+        with self._lock:
+            return sorted(self.files)
@@ -0,0 +1,44 @@
+# lookup_cache.py
+# Cache no cliente das respostas do tracker (query_file, get_all_indexed_files). Cada entrada guarda a
+# época do tracker e a versão do índice em que foi obtida; só é servida enquanto o tracker atual
+# anunciar (nos heartbeats) a mesma época e versão e dentro do TTL. Qualquer escrita no índice muda a
+# versão e invalida todas as entradas de uma vez, sem precisar avisar cada cliente.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LookupCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chave -> (época, versão, expira_em, resposta); ordem = uso (LRU)
+
+    def get(self, key, tracker_epoch, index_version):
+        """Resposta guardada para 'key' se ainda vale para (época, versão) atuais; None caso contrário."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            epoch, version, expires_at, response = entry
+            if epoch != tracker_epoch or version != index_version or time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key, tracker_epoch, index_version, response):
+        with self._lock:
+            self._entries[key] = (tracker_epoch, index_version, time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
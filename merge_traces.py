@@ -0,0 +1,112 @@
+# merge_traces.py
+# Junta os spans gravados por cada peer (traces/<peer_id>_spans.jsonl) em uma linha do tempo única.
+# Uso: python merge_traces.py [pasta_dos_traces] [saída.json] [trace_id]
+#   - imprime cada trace como árvore (início relativo, duração, peer e atributos de cada span);
+#   - grava saída.json no formato Trace Event (abra em chrome://tracing ou https://ui.perfetto.dev),
+#     com um processo por peer.
+# Os horários vêm do relógio de cada peer: em máquinas diferentes, mantenha-os sincronizados (NTP).
+
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+
+from constants import TRACE_DIR
+
+
+def load_spans(trace_dir):
+    spans = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*_spans.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Última linha pode estar incompleta se o peer foi encerrado no meio da gravação
+                    print(f"Ignorando linha {line_number} inválida em {path}", file=sys.stderr)
+    return spans
+
+
+def group_traces(spans):
+    traces = defaultdict(list)
+    for span in spans:
+        traces[span["trace_id"]].append(span)
+    return traces
+
+
+def print_trace(trace_id, spans):
+    by_id = {span["span_id"]: span for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parent_id"] in by_id:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)  # Raiz do trace ou span cujo pai não foi gravado
+    trace_start = min(span["start"] for span in spans)
+    trace_end = max(span["start"] + span["duration"] for span in spans)
+    print(f"\nTrace {trace_id}: {len(spans)} spans, {(trace_end - trace_start) * 1000:.1f} ms, "
+          f"peers: {', '.join(sorted({span['peer'] for span in spans}))}")
+
+    def show(span, depth):
+        offset_ms = (span["start"] - trace_start) * 1000
+        attrs = " ".join(f"{k}={v}" for k, v in span.get("attrs", {}).items())
+        status = "" if span["status"] == "ok" else f" [{span['status']}]"
+        print(f"  {offset_ms:9.1f} ms {span['duration'] * 1000:9.1f} ms  {'  ' * depth}{span['name']} "
+              f"@{span['peer']}{status} {attrs}".rstrip())
+        for child in sorted(children[span["span_id"]], key=lambda s: s["start"]):
+            show(child, depth + 1)
+
+    for root in sorted(roots, key=lambda s: s["start"]):
+        show(root, 0)
+
+
+def to_trace_events(spans):
+    # Formato Trace Event: um "processo" por peer, uma "thread" por thread do peer
+    peer_pids = {peer: i + 1 for i, peer in enumerate(sorted({span["peer"] for span in spans}))}
+    thread_tids = {}
+    events = []
+    for peer, pid in peer_pids.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": peer}})
+    for span in spans:
+        pid = peer_pids[span["peer"]]
+        key = (pid, span.get("thread", ""))
+        if key not in thread_tids:
+            thread_tids[key] = len(thread_tids) + 1
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_tids[key],
+                           "args": {"name": key[1]}})
+        events.append({"name": span["name"], "cat": span.get("kind", "internal"), "ph": "X",
+                       "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6,
+                       "pid": pid, "tid": thread_tids[key],
+                       "args": dict(span.get("attrs", {}), trace_id=span["trace_id"], span_id=span["span_id"],
+                                    parent_id=span["parent_id"], status=span["status"])})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def main():
+    trace_dir = sys.argv[1] if len(sys.argv) > 1 else TRACE_DIR
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "merged_trace.json"
+    only_trace = sys.argv[3] if len(sys.argv) > 3 else None
+
+    spans = load_spans(trace_dir)
+    if only_trace:
+        spans = [span for span in spans if span["trace_id"].startswith(only_trace)]
+    if not spans:
+        print(f"Nenhum span encontrado em {trace_dir}.")
+        sys.exit(1)
+
+    traces = group_traces(spans)
+    for trace_id, trace_spans in sorted(traces.items(), key=lambda item: min(s["start"] for s in item[1])):
+        print_trace(trace_id, trace_spans)
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(to_trace_events(spans), f)
+    print(f"\n{len(spans)} spans de {len(traces)} traces gravados em {output_path}.")
+
+
+if __name__ == "__main__":
+    main()
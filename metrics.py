@@ -0,0 +1,286 @@
+# metrics.py
+# Métricas do peer em memória (contadores, gauges e histogramas com labels), expostas pelo método
+# Pyro get_metrics e por um endpoint HTTP local no formato texto do Prometheus (/metrics).
+
+import bisect
+import functools
+import http.server
+import threading
+import time
+
+import profiler
+from constants import METRICS_LATENCY_BUCKETS, METRICS_HTTP_HOST, METRICS_HTTP_BASE_PORT, METRICS_HTTP_PORT_ATTEMPTS
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # tupla de valores dos labels -> valor (ou estado do histograma)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Métrica {self.name} espera os labels {self.labelnames}, recebeu {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self):
+        """Lista de (sufixo, labels extras, valores dos labels, valor) para exportação."""
+        with self._lock:
+            return [("", (), key, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0  # Aparece zerado na coleta antes do primeiro incremento
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        # Gauge sem labels pode ser calculado na hora da coleta (ex.: tamanho do índice)
+        self._fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self._fn is not None:
+            return [("", (), (), self._fn())]
+        return super().samples()
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [contagens por bucket (não cumulativas) + overflow, soma, total]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total_sum, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                result.append(("_bucket", (("le", _format_value(float(bound))),), key, cumulative))
+            result.append(("_sum", (), key, total_sum))
+            result.append(("_count", (), key, count))
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self, namespace="p2p"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(f"{self.namespace}_{name}", help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=(), fn=None):
+        return self._register(Gauge(f"{self.namespace}_{name}", help_text, labelnames, fn))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        return self._register(Histogram(f"{self.namespace}_{name}", help_text, labelnames, buckets))
+
+    def render_prometheus(self):
+        """Todas as métricas no formato texto de exposição do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, extra, key, value in metric.samples():
+                labels = _format_labels(metric.labelnames, key, extra)
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # Versão serializável (dicts e listas) para o método Pyro get_metrics
+        with self._lock:
+            metrics = list(self._metrics.values())
+        result = {}
+        for metric in metrics:
+            samples = []
+            for suffix, extra, key, value in metric.samples():
+                labels = dict(zip(metric.labelnames, key))
+                labels.update(extra)
+                samples.append({"name": metric.name + suffix, "labels": labels, "value": value})
+            result[metric.name] = {"type": metric.type_name, "help": metric.help, "samples": samples}
+        return result
+
+
+class PeerMetrics(MetricsRegistry):
+    """Registry com as métricas comuns a todo peer; gauges calculados na coleta são adicionados pelo Peer."""
+
+    def __init__(self):
+        super().__init__()
+        self.rpc_calls = self.counter("rpc_calls_total", "Chamadas recebidas por método remoto.", ("method", "outcome"))
+        self.rpc_latency = self.histogram("rpc_latency_seconds", "Tempo de execução dos métodos remotos.",
+                                          ("method",))
+        self.bytes_served = self.counter("bytes_served_total", "Bytes de chunks enviados a outros peers (na rede).")
+        self.bytes_downloaded = self.counter("bytes_downloaded_total", "Bytes de arquivo recebidos de outros peers.")
+        self.heartbeats_sent = self.counter("heartbeats_sent_total", "Heartbeats enviados como tracker.",
+                                            ("outcome",))
+        self.heartbeat_send_latency = self.histogram("heartbeat_send_seconds",
+                                                     "Duração de cada envio de heartbeat a um peer.")
+        self.heartbeats_received = self.counter("heartbeats_received_total", "Heartbeats recebidos de trackers.")
+        self.heartbeat_receive_interval = self.histogram(
+            "heartbeat_receive_interval_seconds",
+            "Intervalo entre heartbeats consecutivos do tracker atual (acima de HEARTBEAT_INTERVAL = atraso).")
+        self.elections = self.counter("elections_total", "Eleições iniciadas por este peer, por resultado.",
+                                      ("result",))
+        self.election_duration = self.histogram("election_duration_seconds",
+                                                "Tempo entre iniciar a candidatura e apurar os votos.")
+        self.lookups_filtered = self.counter("lookups_filtered_total",
+                                             "Buscas respondidas localmente pelo filtro do índice (arquivo ausente).")
+        self.lookup_cache_requests = self.counter("lookup_cache_requests_total",
+                                                  "Consultas ao tracker atendidas (hit) ou não (miss) pelo cache local.",
+                                                  ("operation", "result"))
+        self.chunk_cache_requests = self.counter("chunk_cache_requests_total",
+                                                 "Chunks servidos da memória (hit) ou lidos do disco (miss).",
+                                                 ("result",))
+        self.download_jobs = self.counter("download_jobs_total",
+                                          "Tentativas de jobs da fila de downloads, por resultado.", ("result",))
+
+
+def timed_rpc(method):
+    """Conta chamadas e mede a latência de um método remoto em self.metrics (labels method/outcome).
+
+    Envolve todos os métodos @Pyro5.api.expose do Peer; também informa ao profiler qual RPC cada thread
+    está executando.
+    """
+    method_name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        # Marca a thread com o método em execução (o profiler agrupa as amostras por RPC)
+        ident = threading.get_ident()
+        outer_rpc = profiler.active_rpcs.get(ident)
+        profiler.active_rpcs[ident] = method_name
+        try:
+            result = method(self, *args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            if outer_rpc is None:
+                profiler.active_rpcs.pop(ident, None)
+            else:
+                profiler.active_rpcs[ident] = outer_rpc
+            self.metrics.rpc_calls.inc(method=method_name, outcome=outcome)
+            self.metrics.rpc_latency.observe(time.perf_counter() - start, method=method_name)
+
+    return wrapper
+
+
+class _MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Não escreve cada scrape no stderr (atrapalharia a CLI)
+
+
+class MetricsHTTPServer:
+    """Servidor HTTP local, em uma thread própria, que entrega o registry em /metrics."""
+
+    def __init__(self, registry, logger, host=METRICS_HTTP_HOST, base_port=METRICS_HTTP_BASE_PORT,
+                 port_attempts=METRICS_HTTP_PORT_ATTEMPTS):
+        self.registry = registry
+        self.logger = logger
+        self.host = host
+        self.base_port = base_port
+        self.port_attempts = port_attempts
+        self.port = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        # Vários peers na mesma máquina: usa a primeira porta livre a partir de base_port
+        for port in range(self.base_port, self.base_port + self.port_attempts):
+            try:
+                server = http.server.ThreadingHTTPServer((self.host, port), _MetricsRequestHandler)
+            except OSError:
+                continue
+            server.daemon_threads = True
+            server.registry = self.registry
+            self._server = server
+            self.port = port
+            self._thread = threading.Thread(target=server.serve_forever, name=f"MetricsHTTP-{port}", daemon=True)
+            self._thread.start()
+            self.logger.info(f"Métricas disponíveis em http://{self.host}:{port}/metrics")
+            return port
+        self.logger.warning(
+            f"Nenhuma porta livre para o endpoint de métricas entre {self.base_port} e "
+            f"{self.base_port + self.port_attempts - 1}. Métricas só pelo método get_metrics.")
+        return None
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,16 +1,56 @@
 import Pyro5.api
 import Pyro5.errors
+import asyncio
+import contextvars
+import fnmatch
 import threading
 import time
 import random
 import os
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from constants import (
     NAMESERVER_HOST, NAMESERVER_PORT, PEER_NAME_PREFIX, TRACKER_BASE_NAME,
     HEARTBEAT_INTERVAL, TRACKER_DETECTION_TIMEOUT_MIN, TRACKER_DETECTION_TIMEOUT_MAX,
-    QUORUM, MAX_EPOCH_SEARCH, DOWNLOAD_CHUNK_SIZE, ELECTION_REQUEST_TIMEOUT
+    QUORUM, MAX_EPOCH_SEARCH, DOWNLOAD_CHUNK_SIZE, ELECTION_REQUEST_TIMEOUT,
+    PEER_SCORING_PROBE_TIMEOUT, PEER_SCORING_MAX_PROBES, CHUNK_COMPRESSION_CODECS,
+    DELTA_PAGE_MAX_LITERAL_BYTES, DELTA_REQUEST_TIMEOUT, CONTENT_STORE_BASE_DIR, SHARE_DOWNLOADED_FILES,
+    MULTI_SOURCE_MAX_HOLDERS, CHUNK_ANNOUNCE_INTERVAL, PROFILER_DEFAULT_DURATION, PROFILER_SAMPLE_INTERVAL,
+    NETWORK_FILTER_ENABLED, NETWORK_FILTER_FALSE_POSITIVE_RATE, NETWORK_FILTER_MIN_CAPACITY,
+    NETWORK_FILTER_MAX_STALE_RATIO, NETWORK_FILTER_MAX_AGE,
+    LOOKUP_CACHE_ENABLED, LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL, LOOKUP_CACHE_MAX_VERSION_AGE,
+    SUBSCRIPTION_PUSH_INTERVAL, SUBSCRIPTION_MAX_BATCH, SUBSCRIPTION_MAX_FAILURES, SUBSCRIPTION_RESUME_AFTER,
+    CHUNK_CACHE_ENABLED, CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_READAHEAD_BYTES, DATA_PLANE_ENABLED,
+    SERVING_WORKERS, REMOTE_PEEK_DEFAULT_BYTES, CHUNK_REQUEST_TIMEOUT
 )
+from async_runtime import AsyncRuntime
+from bloom_filter import BloomFilter
+from chunk_cache import ChunkCache
+from chunk_bitfield import Bitfield, PartialFile, RarestFirstScheduler, num_chunks_for
+from chunk_writer import ChunkWriter
+from chunk_codec import encode_chunk, decode_chunk, to_bytes as chunk_to_bytes, ChunkDecodeError
+from content_store import ContentStore
+from data_plane import DataPlane
+from download_manager import DownloadManager, DownloadCancelled
+from delta_sync import (
+    compute_signature, delta_page_response, write_delta_ops, delta_stats, file_digest, DeltaSessions, DeltaTooLarge,
+    DeltaSourceChanged, DeltaSessionExpired
+)
+from peer_logging import setup_peer_logging, get_peer_logger
+from peer_scoring import PeerScoreBoard
+from profiler import SamplingProfiler
+from proxy_pool import ProxyPool, nameserver_uri
+from tracker_index import TrackerIndex
+from tracing import Tracer, traced_rpc
+from upload_scheduler import UploadScheduler, UploadQueueTimeout
+from file_watcher import SharedFolderWatcher
+from index_subscriptions import SubscriptionRegistry, IndexMirror
+from lookup_cache import LookupCache
+from metrics import PeerMetrics, MetricsHTTPServer, timed_rpc
+from remote_file import RemoteFile
+from serving_workers import ServingWorkerPool
+from shared_tree import scan_shared_tree, to_local_path, is_safe_relative_name
 
 # Configuração básica de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(peer_id)s - %(message)s')
@@ -27,45 +67,131 @@ class Peer:
         os.makedirs(log_dir, exist_ok=True)  # Cria o diretório de logs caso não exista
         self.log_file_path = os.path.join(log_dir, f"{self.peer_id}_app.log")
 
-        # Remove handlers antigos do logger raiz para evitar logs duplicados
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(peer_id)s - %(message)s',
-            filename=self.log_file_path,
-            filemode='w'  # Sobrescreve o log a cada execução
-        )
+        # Os registros vão para uma fila; uma thread separada grava no arquivo (sobrescrito a cada execução)
+        setup_peer_logging(self.peer_id, self.log_file_path)
 
-        self.logger = logging.LoggerAdapter(logging.getLogger(__name__), {'peer_id': self.peer_id})
+        self.logger = get_peer_logger(self.peer_id)
+        # Loggers dos caminhos quentes, com nível próprio e limite de taxa (ver LOG_SUBSYSTEM_LEVELS)
+        self.heartbeat_logger = get_peer_logger(self.peer_id, "heartbeat")
+        self.tracker_logger = get_peer_logger(self.peer_id, "tracker")
+        self.transfer_logger = get_peer_logger(self.peer_id, "transfer")
+        # Spans dos fluxos de busca/download e eleição (traces/<peer_id>_spans.jsonl)
+        self.tracer = Tracer(self.peer_id, self.logger)
 
         self.uri = None
         self.pyro_daemon = None
+        # Daemon separado para chunks/deltas (ver data_plane.py); None = tudo no daemon principal
+        self.data_plane = None
+        # Processos que servem os arquivos completos (SERVING_WORKERS > 0); iniciados em start()
+        self.serving_workers = None
+        # Conexões de saída (tracker, peers, servidor de nomes) reaproveitadas entre chamadas
+        self.proxy_pool = ProxyPool(self.logger, tracer=self.tracer)
 
         self.shared_folder = os.path.abspath(shared_folder_path)
         os.makedirs(self.shared_folder, exist_ok=True)
         # self.local_files é inicializado com os arquivos atuais.
         # Ele será a "foto" do estado anterior para a próxima verificação.
-        self.local_files = self._scan_local_files()
+        # self.local_files_set acompanha a lista (mesmo conteúdo) para checagens de pertinência em O(1)
+        self._set_local_files(self._scan_local_files())
+        # Serializa a comparação/troca de self.local_files (observador, CLI e downloads atualizam em paralelo).
+        # A lista nunca é modificada no lugar, só substituída, então leitores não precisam do lock.
+        self._local_files_lock = threading.Lock()
+        # Observador em segundo plano da pasta compartilhada (iniciado em start())
+        self.shared_folder_watcher = None
+        # Store endereçado por conteúdo: downloads viram objetos com hardlinks nas visões de download/compartilhada
+        self.content_store = ContentStore(os.path.join(os.getcwd(), CONTENT_STORE_BASE_DIR, self.peer_id),
+                                          self.logger)
 
         self.is_tracker = False
         self.current_tracker_uri_str = None
         self.current_tracker_proxy = None
         self.current_tracker_epoch = 0
-
-        # Atributos de eleição
+        # Índice de arquivos do tracker: snapshots imutáveis para leitura, um único caminho de escrita
+        self.tracker_index = TrackerIndex()
+        # Carga (uploads em andamento) de cada peer, reportada nas respostas aos heartbeats (usado pelo tracker)
+        self.holder_load = {}
+        # Filtro de Bloom com os nomes do índice, enviado nos heartbeats (atualizado a cada versão do índice)
+        self._network_filter_lock = threading.Lock()
+        self._network_filter_cache = None  # (names_version, BloomFilter, nomes removidos ainda no filtro, serializado)
+        self._network_filter_acked = {}  # URI do peer -> versão do filtro que ele confirmou ter
+        # Filtro recebido do tracker: (época, versão, BloomFilter) e quando o tracker o confirmou por último
+        self.network_filter = None
+        self._network_filter_confirmed_at = 0.0
+        # Respostas do tracker já obtidas, válidas enquanto a época e a versão do índice não mudarem
+        self.lookup_cache = LookupCache(LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL)
+        self._tracker_index_version = None  # (época, versão do índice, quando foi anunciada) do último heartbeat
+        # Assinaturas de mudanças no índice: as que recebo como tracker e a minha, como assinante
+        self.index_subscriptions = SubscriptionRegistry()
+        self.index_mirror = None
+
+        # Estatísticas dos holders (RTT, vazão, erros) para escolher de quem baixar
+        self.peer_scores = PeerScoreBoard()
+        # Slots de upload com fila justa por peer solicitante e limites de banda
+        self.upload_scheduler = UploadScheduler()
+        # Chunks servidos recentemente (arquivo popular = uma leitura do disco por chunk)
+        self.chunk_cache = ChunkCache(CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_READAHEAD_BYTES) if CHUNK_CACHE_ENABLED else None
+        # Pings de medição de RTT (_probe_holders), fora do pool do runtime onde rodam as buscas
+        self.probe_pool = ThreadPoolExecutor(max_workers=PEER_SCORING_MAX_PROBES,
+                                             thread_name_prefix=f"Probe-{self.peer_id}")
+        # Holders que não suportam request_file_chunk_compressed (versões antigas)
+        self._holders_without_compression = set()
+        # Assinaturas dos deltas sendo servidos em páginas (o cliente as envia só na primeira)
+        self.delta_sessions = DeltaSessions()
+        # URI principal do holder -> URI do seu plano de dados (descoberto com get_data_uri)
+        self._data_uris = {}  # Chave: (uri, é_fonte_parcial)
+        # Downloads em andamento (nome -> PartialFile): os chunks já recebidos são servidos a outros peers
+        self.partial_downloads = {}
+        self._last_chunk_announce = {}
+
+        # Atributos de eleição (protegidos por _election_lock: pedidos de voto chegam em várias threads do daemon)
+        self._election_lock = threading.RLock()
         self.candidate_for_epoch = 0
         self.candidate_for_epoch_value = 0
         self.votes_received_for_epoch = {}
         self.voted_in_epoch = {}
         self.candidate_for_epoch_value_history = 0  # Adicionado para rastrear a maior época tentada
 
-        # Timers
+        # Event loop que agenda timers, envios em paralelo e downloads (iniciado em start())
+        self.runtime = AsyncRuntime(self.peer_id, self.logger)
+
+        # Métricas (get_metrics e endpoint HTTP /metrics); gauges calculados a cada coleta
+        self.metrics = PeerMetrics()
+        self.metrics.gauge("is_tracker", "1 se este peer é o tracker atual.", fn=lambda: int(self.is_tracker))
+        self.metrics.gauge("tracker_epoch", "Época do tracker conhecido.", fn=lambda: self.current_tracker_epoch)
+        self.metrics.gauge("tracker_index_files", "Arquivos no índice (quando sou o tracker).",
+                           fn=lambda: len(self.tracker_index))
+        self.metrics.gauge("tracker_index_version",
+                           "Versão do índice do tracker (muda a cada escrita de arquivos completos).",
+                           fn=lambda: self.tracker_index.version)
+        self.metrics.gauge("local_files", "Arquivos compartilhados por este peer.", fn=lambda: len(self.local_files))
+        self.metrics.gauge("partial_downloads", "Downloads em andamento.", fn=lambda: len(self.partial_downloads))
+        self.metrics.gauge("upload_load", "Uploads ativos + na fila.", fn=lambda: self.upload_scheduler.load())
+        self.metrics.gauge("proxy_pool_idle", "Conexões Pyro ociosas no pool.",
+                           fn=lambda: self.proxy_pool.stats()["idle"])
+        self.metrics_http = MetricsHTTPServer(self.metrics, self.logger)
+        # Downloads em segundo plano: fila persistente com prioridade, limite global e novas tentativas
+        self.download_manager = DownloadManager(self.peer_id, self._run_download_job, self.runtime, self.logger,
+                                                self.metrics)
+        self.metrics.gauge("chunk_cache_bytes", "Bytes de chunks no cache de leitura.",
+                           fn=lambda: self.chunk_cache.size_bytes() if self.chunk_cache else 0)
+        self.metrics.gauge("serving_workers_bytes_served", "Bytes enviados pelos processos de upload (SERVING_WORKERS).",
+                           fn=lambda: self.serving_workers.bytes_served() if self.serving_workers else 0)
+        self.metrics.gauge("download_jobs_queued", "Downloads na fila (incluindo os aguardando nova tentativa).",
+                           fn=lambda: self.download_manager.stats()["queued"])
+        self.metrics.gauge("download_jobs_running", "Downloads da fila em andamento.",
+                           fn=lambda: self.download_manager.stats()["running"])
+        self.metrics.gauge("download_jobs_throughput_bytes", "Vazão somada (bytes/s) dos downloads da fila.",
+                           fn=lambda: self.download_manager.stats()["throughput"])
+        # Profiler por amostragem, ligado remotamente via start_profiling/stop_profiling
+        self.profiler = SamplingProfiler(self.logger)
+        self._last_heartbeat_received_at = None
+        self._election_started_at = None
+        self._election_trace_ref = None  # Span da eleição em andamento, continuado na apuração (timer)
+
+        # Timers (ScheduledCall do runtime)
         self.tracker_timeout_timer = None
         self.heartbeat_send_timer = None
         self.election_vote_collection_timer = None
-        self.ns_proxy = None  # Proxy do NameServer para uso geral
 
         self.logger.info(f"Peer inicializado. Pasta de compartilhamento: {self.shared_folder}")
         self.logger.info(f"Arquivos locais iniciais: {self.local_files}")
@@ -75,9 +201,11 @@ class Peer:
         try:
             self.pyro_daemon = Pyro5.server.Daemon(host=self._get_local_ip())
             self.uri = self.pyro_daemon.register(self)
-            # Obter um proxy NS local para registro inicial
-            ns_proxy_setup = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-            ns_proxy_setup.register(f"{PEER_NAME_PREFIX}{self.peer_id}", self.uri)
+            if DATA_PLANE_ENABLED:
+                self.data_plane = DataPlane(self, self._get_local_ip(), self.logger)
+            # Registro inicial no servidor de nomes
+            with self.proxy_pool.lease_ns() as ns_proxy_setup:
+                ns_proxy_setup.register(f"{PEER_NAME_PREFIX}{self.peer_id}", self.uri)
             self.logger.info(f"Registrado no daemon PyRO com URI: {self.uri}")
             self.logger.info(f"Registrado no servidor de nomes como: {PEER_NAME_PREFIX}{self.peer_id}")
         except Pyro5.errors.NamingError:
@@ -93,132 +221,169 @@ class Peer:
         return "localhost"  # Ou use uma lógica mais sofisticada para descobrir o IP
 
     def _scan_local_files(self):
-        # Varre a pasta compartilhada e retorna lista de arquivos locais
+        # Varre recursivamente a pasta compartilhada e retorna lista de arquivos locais (caminhos relativos)
         try:
-            return [f for f in os.listdir(self.shared_folder) if os.path.isfile(os.path.join(self.shared_folder, f))]
+            return scan_shared_tree(self.shared_folder)
         except Exception as e:
             self.logger.error(f"Erro ao escanear arquivos locais: {e}")
             return []
 
-    def update_local_files_and_notify_tracker(self):
-        # Atualiza lista de arquivos locais e avisa o tracker sobre mudanças
+    def _set_local_files(self, files):
+        # Troca a lista publicada e o frozenset correspondente (leitores sem lock veem um ou outro atualizado)
+        self.local_files_set = frozenset(files)
+        self.local_files = files
+
+    def update_local_files_and_notify_tracker(self, current_files_list=None):
+        # Atualiza lista de arquivos locais e avisa o tracker sobre mudanças.
+        # current_files_list pode vir pronto do observador da pasta; se None, a pasta é varrida.
+
+        with self._local_files_lock:
+            # `self.local_files` contém os arquivos da última varredura (estado "antigo")
+            old_files_set = self.local_files_set
 
-        # `self.local_files` contém os arquivos da última varredura (estado "antigo")
-        old_files_set = set(self.local_files)
+            # Obtém o estado atual dos arquivos (do observador ou varrendo a pasta)
+            if current_files_list is None:
+                current_files_list = self._scan_local_files()
+            current_files_set = set(current_files_list)
 
-        # Varre a pasta para obter o estado atual dos arquivos
-        current_files_list = self._scan_local_files()
-        current_files_set = set(current_files_list)
+            # Atualiza a lista principal de arquivos do peer para o estado atual (troca atômica da referência)
+            if old_files_set != current_files_set:
+                self._set_local_files(current_files_list)
+                if self.serving_workers is not None:
+                    self.serving_workers.publish(current_files_list)
 
         # Verifica se houve alguma mudança (adição ou remoção)
         if old_files_set != current_files_set:
-            self.logger.info(
-                f"Mudança nos arquivos locais detectada. Antigos: {old_files_set}, Atuais: {current_files_set}")
-
-            # Calcula os arquivos que foram adicionados desde a última varredura
+            # Calcula os arquivos adicionados e removidos desde a última varredura
             added_files = list(current_files_set - old_files_set)
-            # Calcula os arquivos que foram removidos (para logging ou futuras implementações)
             removed_files = list(old_files_set - current_files_set)
+            # Em INFO só as contagens: as listas completas custariam O(arquivos) por mudança
+            self.logger.info("Mudança nos arquivos locais: %d adicionado(s), %d removido(s) (%d no total).",
+                             len(added_files), len(removed_files), len(current_files_set))
+            self.logger.debug("Arquivos adicionados: %s; removidos: %s", added_files, removed_files)
 
-            # Atualiza a lista principal de arquivos do peer para o estado atual
-            self.local_files = current_files_list
-
-            if added_files:
-                self.logger.info(f"Novos arquivos adicionados localmente: {added_files}")
+            if removed_files and self.chunk_cache is not None:
+                self.chunk_cache.invalidate(to_local_path(self.shared_folder, name) for name in removed_files)
             if removed_files:
-                self.logger.info(
-                    f"Arquivos removidos localmente: {removed_files}. O tracker não será notificado dessas remoções nesta atualização incremental.")
+                # Visões apagadas da pasta compartilhada podem ter sido o último link de um objeto do store
+                self.runtime.submit(self._collect_store_garbage)
 
-            # Se este peer não for o tracker e tiver um tracker conhecido, notifica sobre os NOVOS arquivos
+            # Se este peer não for o tracker e tiver um tracker conhecido, notifica as mudanças.
+            # Envio incremental: adições com register_files, remoções com unregister_files
             if self.current_tracker_uri_str and not self.is_tracker:
-                if added_files:  # Só notifica se houver arquivos realmente novos para adicionar
-                    try:
-                        tracker_proxy_local = Pyro5.api.Proxy(self.current_tracker_uri_str)
-                        tracker_proxy_local._pyroTimeout = 5
-                        self.logger.info(
-                            f"Notificando tracker {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}) sobre NOVOS arquivos: {added_files}.")
-
-                        # Envia APENAS os arquivos adicionados e informa que é uma atualização incremental
-                        response = tracker_proxy_local.register_files(
-                            self.peer_id,
-                            str(self.uri),
-                            added_files,  # Envia somente os arquivos novos
-                            self.current_tracker_epoch,
-                            is_incremental_update=True  # Novo parâmetro para indicar atualização incremental
-                        )
-                        if isinstance(response, dict) and response.get("status") == "epoch_too_low":
-                            self.logger.warning(
-                                f"Tracker informou que minha época ({self.current_tracker_epoch}) é muito baixa ao registrar novos arquivos. Tracker atual é época {response.get('current_tracker_epoch')}. Tentando reconectar/descobrir.")
-                            self._discover_tracker()
-                    except Pyro5.errors.CommunicationError:
-                        self.logger.warning(
-                            "Falha ao notificar tracker sobre novos arquivos (CommunicationError). Tracker pode estar offline.")
-                        self._handle_tracker_communication_error()
-                    except Exception as e:
-                        self.logger.error(f"Erro ao notificar tracker sobre novos arquivos: {e}")
-                else:
-                    self.logger.info(
-                        "Nenhum arquivo novo para adicionar ao tracker. Apenas remoções ou nenhuma mudança que necessite de adição incremental.")
+                try:
+                    self.logger.info("Notificando tracker %s (Época %s): %d novo(s), %d removido(s).",
+                                     self.current_tracker_uri_str, self.current_tracker_epoch, len(added_files),
+                                     len(removed_files))
+
+                    with self.tracer.client_span("register_files", added=len(added_files), removed=len(removed_files)), \
+                            self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                        responses = []
+                        if added_files:
+                            responses.append(tracker_proxy_local.register_files(
+                                self.peer_id, str(self.uri), added_files, self.current_tracker_epoch,
+                                is_incremental_update=True))
+                        if removed_files:
+                            try:
+                                responses.append(tracker_proxy_local.unregister_files(
+                                    self.peer_id, str(self.uri), removed_files, self.current_tracker_epoch))
+                            except AttributeError:
+                                # Tracker de versão anterior, sem unregister_files: lista completa (substitui a do peer)
+                                self.logger.info("Tracker sem unregister_files; enviando a lista completa (%d arquivos).",
+                                                 len(current_files_list))
+                                responses.append(tracker_proxy_local.register_files(
+                                    self.peer_id, str(self.uri), list(current_files_list), self.current_tracker_epoch,
+                                    is_incremental_update=False))
+                        for response in responses:
+                            if isinstance(response, dict) and response.get("status") == "epoch_too_low":
+                                self.logger.warning(
+                                    f"Tracker informou que minha época ({self.current_tracker_epoch}) é muito baixa ao registrar arquivos. Tracker atual é época {response.get('current_tracker_epoch')}. Tentando reconectar/descobrir.")
+                                self._discover_tracker()
+                                break
+                except Pyro5.errors.CommunicationError:
+                    self.logger.warning(
+                        "Falha ao notificar tracker sobre mudanças nos arquivos (CommunicationError). Tracker pode estar offline.")
+                    self._handle_tracker_communication_error()
+                except Exception as e:
+                    self.logger.error(f"Erro ao notificar tracker sobre mudanças nos arquivos: {e}")
 
-            # Se este peer for o tracker, ele atualiza seu próprio índice completamente
-            # (pois a mudança pode ser uma remoção, e a lógica incremental atual só adiciona)
+            # Se este peer for o tracker, ele atualiza seu próprio índice só com as diferenças
             elif self.is_tracker:
                 self.logger.info("Atualizando índice do tracker para meus próprios arquivos (mudança detectada).")
-                # Um tracker sempre faz uma atualização completa para seus próprios arquivos
-                # para lidar corretamente com adições e remoções.
-                self._update_tracker_index_for_peer(self.peer_id, str(self.uri), self.local_files, is_incremental=False)
+                if added_files:
+                    self._update_tracker_index_for_peer(self.peer_id, str(self.uri), added_files, is_incremental=True)
+                if removed_files:
+                    self._remove_from_tracker_index(self.peer_id, removed_files)
         else:
             self.logger.debug("Nenhuma mudança nos arquivos locais desde a última verificação.")
 
+    def _start_shared_folder_watcher(self):
+        # Inicia o observador que mantém self.local_files e o tracker atualizados sem 'refresh' manual
+        if self.shared_folder_watcher and self.shared_folder_watcher.is_running():
+            return
+        try:
+            self.shared_folder_watcher = SharedFolderWatcher(self.shared_folder, self._on_shared_folder_change,
+                                                             self.logger)
+            self.shared_folder_watcher.start()
+            # Sincroniza com a foto do observador (pode ter mudado entre o __init__ e agora)
+            self.update_local_files_and_notify_tracker(self.shared_folder_watcher.snapshot())
+        except Exception as e:
+            self.logger.error(f"Erro ao iniciar o observador da pasta compartilhada: {e}. Use 'refresh' manualmente.")
+            self.shared_folder_watcher = None
+
+    def _on_shared_folder_change(self, current_files, added, removed, modified):
+        # Chamado pelo observador (já com a rajada de eventos agrupada)
+        self.logger.debug(
+            f"Observador: {len(added)} adicionado(s), {len(removed)} removido(s), {len(modified)} modificado(s).")
+        if self.chunk_cache is not None and (removed or modified):
+            self.chunk_cache.invalidate(to_local_path(self.shared_folder, name) for name in removed + modified)
+        if added or removed:
+            self.update_local_files_and_notify_tracker(current_files)
+
     def _discover_tracker(self):
         # Busca um tracker ativo no servidor de nomes e conecta a ele
         self.logger.info("Procurando por um tracker ativo...")
         latest_epoch_found = -1
         tracker_uri_to_connect = None
-        ns_proxy_local_discover = None
-
         try:
-            ns_proxy_local_discover = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-        except Pyro5.errors.NamingError:
-            self.logger.error(f"Servidor de nomes não encontrado em _discover_tracker.")
-            pass
+            with self.proxy_pool.lease_ns() as ns_proxy_local_discover:
+                for i in range(MAX_EPOCH_SEARCH, -1, -1):
+                    tracker_name_to_find = f"{TRACKER_BASE_NAME}{i}"
+                    uri_obj_from_ns = None
+                    try:
+                        uri_obj_from_ns = ns_proxy_local_discover.lookup(tracker_name_to_find)
+                        if uri_obj_from_ns:
+                            with self.proxy_pool.lease(uri_obj_from_ns, timeout=1.5) as temp_proxy:
+                                temp_proxy.ping()
 
-        if ns_proxy_local_discover:
-            for i in range(MAX_EPOCH_SEARCH, -1, -1):
-                tracker_name_to_find = f"{TRACKER_BASE_NAME}{i}"
-                uri_obj_from_ns = None
-                try:
-                    uri_obj_from_ns = ns_proxy_local_discover.lookup(tracker_name_to_find)
-                    if uri_obj_from_ns:
-                        temp_proxy = Pyro5.api.Proxy(str(uri_obj_from_ns))
-                        temp_proxy._pyroTimeout = 1.5
-                        temp_proxy.ping()
-
-                        latest_epoch_found = i
-                        tracker_uri_to_connect = uri_obj_from_ns
-                        self.logger.info(
-                            f"Tracker encontrado: {tracker_name_to_find} com URI {uri_obj_from_ns} (Época {i}).")
-                        break
-                except Pyro5.errors.NamingError:
-                    continue
-                except Pyro5.errors.CommunicationError:
-                    self.logger.warning(
-                        f"Tracker {tracker_name_to_find} (URI {uri_obj_from_ns if uri_obj_from_ns else 'desconhecido'}) encontrado no NS, mas não respondeu ao ping. Considerando-o falho.")
-                    if uri_obj_from_ns:  # Tenta remover do NS se não responde
-                        try:
-                            ns_proxy_local_discover.remove(tracker_name_to_find)
+                            latest_epoch_found = i
+                            tracker_uri_to_connect = uri_obj_from_ns
                             self.logger.info(
-                                f"Tracker {tracker_name_to_find} (URI {uri_obj_from_ns}) removido do NS por não responder.")
-                        except Exception as e_remove:
-                            self.logger.warning(
-                                f"Falha ao tentar remover tracker {tracker_name_to_find} do NS: {e_remove}")
-                    continue
-                except Exception as e:
-                    self.logger.warning(
-                        f"Erro ao tentar conectar/pingar ao tracker {tracker_name_to_find} (URI {uri_obj_from_ns if uri_obj_from_ns else 'desconhecido'}): {e}")
-                    continue
-        else:
+                                f"Tracker encontrado: {tracker_name_to_find} com URI {uri_obj_from_ns} (Época {i}).")
+                            break
+                    except Pyro5.errors.NamingError:
+                        continue
+                    except Pyro5.errors.CommunicationError:
+                        self.logger.warning(
+                            f"Tracker {tracker_name_to_find} (URI {uri_obj_from_ns if uri_obj_from_ns else 'desconhecido'}) encontrado no NS, mas não respondeu ao ping. Considerando-o falho.")
+                        if uri_obj_from_ns:  # Tenta remover do NS se não responde
+                            try:
+                                ns_proxy_local_discover.remove(tracker_name_to_find)
+                                self.logger.info(
+                                    f"Tracker {tracker_name_to_find} (URI {uri_obj_from_ns}) removido do NS por não responder.")
+                            except Exception as e_remove:
+                                self.logger.warning(
+                                    f"Falha ao tentar remover tracker {tracker_name_to_find} do NS: {e_remove}")
+                        continue
+                    except Exception as e:
+                        self.logger.warning(
+                            f"Erro ao tentar conectar/pingar ao tracker {tracker_name_to_find} (URI {uri_obj_from_ns if uri_obj_from_ns else 'desconhecido'}): {e}")
+                        continue
+        except Pyro5.errors.NamingError:
+            self.logger.error(f"Servidor de nomes não encontrado em _discover_tracker.")
             self.logger.warning("Não foi possível conectar ao servidor de nomes durante a descoberta de tracker.")
+        except Pyro5.errors.CommunicationError:
+            self.logger.warning("Conexão com o servidor de nomes perdida durante a descoberta de tracker.")
 
         if tracker_uri_to_connect:
             self._connect_to_tracker(tracker_uri_to_connect, latest_epoch_found)
@@ -228,20 +393,21 @@ class Peer:
                 self.logger.info(
                     f"Nenhum tracker ativo encontrado. Como sou {self.peer_id} e não conheço nenhuma época, tentarei me tornar o tracker inicial da Época {initial_epoch_for_peer1}.")
 
-                ns_proxy_check_peer1 = None
                 can_become_tracker = True
                 try:
-                    ns_proxy_check_peer1 = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-                    # Verifica se já existe um tracker para a época 1
-                    ns_proxy_check_peer1.lookup(f"{TRACKER_BASE_NAME}{initial_epoch_for_peer1}")
-                    self.logger.info(
-                        f"Um tracker para a Época {initial_epoch_for_peer1} já foi registrado por outro peer enquanto eu verificava. Iniciando eleição normal.")
-                    can_become_tracker = False
+                    with self.proxy_pool.lease_ns() as ns_proxy_check_peer1:
+                        try:
+                            # Verifica se já existe um tracker para a época 1
+                            ns_proxy_check_peer1.lookup(f"{TRACKER_BASE_NAME}{initial_epoch_for_peer1}")
+                            self.logger.info(
+                                f"Um tracker para a Época {initial_epoch_for_peer1} já foi registrado por outro peer enquanto eu verificava. Iniciando eleição normal.")
+                            can_become_tracker = False
+                        except Pyro5.errors.NamingError:
+                            pass  # Nenhum tracker registrado para a época 1: posso assumir
                 except Pyro5.errors.NamingError:
-                    if not ns_proxy_check_peer1:
-                        self.logger.warning(
-                            f"Servidor de nomes inacessível ao tentar verificar {TRACKER_BASE_NAME}{initial_epoch_for_peer1} para Peer1. Não posso me tornar tracker.")
-                        can_become_tracker = False
+                    self.logger.warning(
+                        f"Servidor de nomes inacessível ao tentar verificar {TRACKER_BASE_NAME}{initial_epoch_for_peer1} para Peer1. Não posso me tornar tracker.")
+                    can_become_tracker = False
                 except Exception as e_check:
                     self.logger.error(f"Erro ao verificar tracker para Peer1: {e_check}")
                     can_become_tracker = False
@@ -265,12 +431,13 @@ class Peer:
                 return
 
             self.logger.info(f"Tentando conectar ao Tracker {tracker_uri_str} (Época {epoch}).")
-            new_tracker_proxy = Pyro5.api.Proxy(tracker_uri_str)
-            new_tracker_proxy._pyroTimeout = 5
-            new_tracker_proxy.ping()
+            with self.proxy_pool.lease(tracker_uri_str, timeout=5) as new_tracker_proxy:
+                new_tracker_proxy.ping()
 
             self.current_tracker_uri_str = tracker_uri_str
-            self.current_tracker_proxy = new_tracker_proxy
+            self._last_heartbeat_received_at = None  # Intervalo entre heartbeats recomeça com o novo tracker
+            # As conexões com o tracker vêm do pool; aqui fica só o URI (indica que há tracker conhecido)
+            self.current_tracker_proxy = tracker_uri
             self.current_tracker_epoch = epoch
             self.is_tracker = (str(self.uri) == self.current_tracker_uri_str)
 
@@ -278,25 +445,27 @@ class Peer:
                 self.logger.info(
                     f"Conectado ao Tracker_Epoca_{epoch} ({self.current_tracker_uri_str}). Registrando meus arquivos...")
 
-                if hasattr(self, 'candidate_for_epoch_value') and \
-                        self.candidate_for_epoch_value > 0 and \
-                        self.candidate_for_epoch_value <= epoch:
-                    self.logger.info(
-                        f"Conectei ao tracker da época {epoch}. Cancelando minha candidatura pendente para época {self.candidate_for_epoch_value}.")
-                    if self.election_vote_collection_timer and self.election_vote_collection_timer.is_alive():
-                        self.election_vote_collection_timer.cancel()
-                    self.candidate_for_epoch = 0
-                    self.votes_received_for_epoch.pop(self.candidate_for_epoch_value, None)
-                    self.candidate_for_epoch_value = 0
+                with self._election_lock:
+                    if hasattr(self, 'candidate_for_epoch_value') and \
+                            self.candidate_for_epoch_value > 0 and \
+                            self.candidate_for_epoch_value <= epoch:
+                        self.logger.info(
+                            f"Conectei ao tracker da época {epoch}. Cancelando minha candidatura pendente para época {self.candidate_for_epoch_value}.")
+                        if self.election_vote_collection_timer and self.election_vote_collection_timer.is_alive():
+                            self.election_vote_collection_timer.cancel()
+                        self.candidate_for_epoch = 0
+                        self.votes_received_for_epoch.pop(self.candidate_for_epoch_value, None)
+                        self.candidate_for_epoch_value = 0
 
                 # Registro inicial é sempre uma lista completa de arquivos
-                response = self.current_tracker_proxy.register_files(
-                    self.peer_id,
-                    str(self.uri),
-                    self.local_files,  # Envia a lista completa no primeiro registro
-                    self.current_tracker_epoch,
-                    is_incremental_update=False  # Primeiro registro não é incremental
-                )
+                with self.proxy_pool.lease(tracker_uri_str, timeout=5) as tracker_proxy_local:
+                    response = tracker_proxy_local.register_files(
+                        self.peer_id,
+                        str(self.uri),
+                        self.local_files,  # Envia a lista completa no primeiro registro
+                        self.current_tracker_epoch,
+                        is_incremental_update=False  # Primeiro registro não é incremental
+                    )
                 if isinstance(response, dict) and response.get("status") == "epoch_too_low":
                     self.logger.warning(
                         f"Ao registrar, tracker {self.current_tracker_uri_str} informou que minha época ({self.current_tracker_epoch}) é baixa. Tracker real é {response.get('current_tracker_epoch')}. Descobrindo novamente.")
@@ -346,6 +515,11 @@ class Peer:
 
     # Lógica de eleição
     def initiate_election(self):
+        # Cada eleição é um trace: os pedidos de voto (e seus spans nos outros peers) e a apuração ficam ligados
+        with self.tracer.start_trace("election", peer=self.peer_id):
+            self._run_election()
+
+    def _run_election(self):
         # Começa processo de eleição para escolher novo tracker
 
         # Se já existir um timer para coletar votos de uma eleição anterior, cancela-o.
@@ -353,43 +527,46 @@ class Peer:
         if self.election_vote_collection_timer and self.election_vote_collection_timer.is_alive():
             self.election_vote_collection_timer.cancel()
 
-        # Determina a maior época (epoch) que este peer conhece.
-        # Inicializa com a época do tracker atual que o peer conhecia.
-        max_known_epoch = self.current_tracker_epoch
-
-        # Verifica se o peer já votou em alguma época e, se sim,
-        # atualiza max_known_epoch caso encontre uma época maior no histórico de votos.
-        if self.voted_in_epoch:
-            max_known_epoch = max(max_known_epoch, max(self.voted_in_epoch.keys(), default=-1))
-
-        # Verifica o histórico de épocas para as quais este peer já foi candidato.
-        # Atualiza max_known_epoch se uma época de candidatura anterior for maior.
-        # 'candidate_for_epoch_value_history' rastreia a maior época para a qual este peer tentou se candidatar.
-        if hasattr(self, 'candidate_for_epoch_value_history') and self.candidate_for_epoch_value_history > 0:
-            max_known_epoch = max(max_known_epoch, self.candidate_for_epoch_value_history)
-
-        # A nova eleição ocorrerá para a próxima época após a maior época conhecida.
-        new_election_epoch = max_known_epoch + 1
-
-        # Se o peer já é um candidato ativo para esta nova época de eleição,
-        # não faz nada e apenas aguarda os resultados da eleição em andamento.
-        if self.candidate_for_epoch == 1 and self.candidate_for_epoch_value == new_election_epoch:
-            self.logger.info(f"Já sou candidato para a época {new_election_epoch}. Aguardando resultado.")
-            return
+        with self._election_lock:
+            # Determina a maior época (epoch) que este peer conhece.
+            # Inicializa com a época do tracker atual que o peer conhecia.
+            max_known_epoch = self.current_tracker_epoch
+
+            # Verifica se o peer já votou em alguma época e, se sim,
+            # atualiza max_known_epoch caso encontre uma época maior no histórico de votos.
+            if self.voted_in_epoch:
+                max_known_epoch = max(max_known_epoch, max(self.voted_in_epoch.keys(), default=-1))
+
+            # Verifica o histórico de épocas para as quais este peer já foi candidato.
+            # Atualiza max_known_epoch se uma época de candidatura anterior for maior.
+            # 'candidate_for_epoch_value_history' rastreia a maior época para a qual este peer tentou se candidatar.
+            if hasattr(self, 'candidate_for_epoch_value_history') and self.candidate_for_epoch_value_history > 0:
+                max_known_epoch = max(max_known_epoch, self.candidate_for_epoch_value_history)
+
+            # A nova eleição ocorrerá para a próxima época após a maior época conhecida.
+            new_election_epoch = max_known_epoch + 1
+
+            # Se o peer já é um candidato ativo para esta nova época de eleição,
+            # não faz nada e apenas aguarda os resultados da eleição em andamento.
+            if self.candidate_for_epoch == 1 and self.candidate_for_epoch_value == new_election_epoch:
+                self.logger.info(f"Já sou candidato para a época {new_election_epoch}. Aguardando resultado.")
+                return
 
-        # Define este peer como candidato para a nova época de eleição.
-        self.candidate_for_epoch = 1  # Flag indicando que é um candidato.
-        self.candidate_for_epoch_value = new_election_epoch # A época para a qual está se candidatando.
-        # Atualiza o histórico da maior época para a qual este peer se candidatou.
-        self.candidate_for_epoch_value_history = new_election_epoch
+            # Define este peer como candidato para a nova época de eleição.
+            self.candidate_for_epoch = 1  # Flag indicando que é um candidato.
+            self.candidate_for_epoch_value = new_election_epoch # A época para a qual está se candidatando.
+            # Atualiza o histórico da maior época para a qual este peer se candidatou.
+            self.candidate_for_epoch_value_history = new_election_epoch
 
-        self.logger.info(f"Iniciando eleição para Tracker_Epoca_{self.candidate_for_epoch_value}.")
+            self.logger.info(f"Iniciando eleição para Tracker_Epoca_{self.candidate_for_epoch_value}.")
+            self._election_started_at = time.monotonic()
+            self._election_trace_ref = self.tracer.current_ref()
 
-        # Registra o voto próprio: o candidato automaticamente vota em si mesmo.
-        # Inicializa o conjunto de votos recebidos para esta época, adicionando o próprio URI.
-        self.votes_received_for_epoch[self.candidate_for_epoch_value] = {str(self.uri)}
-        # Marca que este peer votou em si mesmo para esta época.
-        self.voted_in_epoch[self.candidate_for_epoch_value] = str(self.uri)
+            # Registra o voto próprio: o candidato automaticamente vota em si mesmo.
+            # Inicializa o conjunto de votos recebidos para esta época, adicionando o próprio URI.
+            self.votes_received_for_epoch[self.candidate_for_epoch_value] = {str(self.uri)}
+            # Marca que este peer votou em si mesmo para esta época.
+            self.voted_in_epoch[self.candidate_for_epoch_value] = str(self.uri)
 
         # Obtém uma lista dos URIs de outros peers na rede.
         other_peer_uris = self._get_other_peer_uris()
@@ -416,36 +593,27 @@ class Peer:
         # Isso permite que as solicitações sejam feitas em paralelo, sem bloquear o peer candidato.
         for peer_uri_str in other_peer_uris:
             try:
-                # Cria uma nova thread para cada solicitação de voto.
-                # A função _send_vote_request_to_peer será executada na nova thread.
+                # Cada solicitação de voto roda no pool de controle do runtime (sem criar uma thread por peer
+                # e sem disputar threads com os downloads).
                 # args: URI do peer de quem solicitar o voto, e a época da eleição.
-                threading.Thread(target=self._send_vote_request_to_peer,
-                                 args=(peer_uri_str, self.candidate_for_epoch_value)).start()
+                self.runtime.submit_control(self._send_vote_request_to_peer, peer_uri_str, self.candidate_for_epoch_value)
             except Exception as e:
-                self.logger.error(f"Erro ao criar thread para solicitar voto de {peer_uri_str} durante eleição: {e}")
+                self.logger.error(f"Erro ao agendar solicitação de voto para {peer_uri_str} durante eleição: {e}")
 
         # Configura um timer para verificar os resultados da eleição após um certo tempo (ELECTION_REQUEST_TIMEOUT).
         # Cancela qualquer timer anterior que possa estar ativo.
         if self.election_vote_collection_timer and self.election_vote_collection_timer.is_alive():
             self.election_vote_collection_timer.cancel()
-        # Cria um novo timer que chamará a função _check_election_results.
-        self.election_vote_collection_timer = threading.Timer(ELECTION_REQUEST_TIMEOUT, self._check_election_results)
-        self.election_vote_collection_timer.daemon = True # Permite que o programa saia mesmo se o timer estiver ativo.
-        self.election_vote_collection_timer.start() # Inicia o timer.
+        # Agenda no event loop a chamada de _check_election_results.
+        self.election_vote_collection_timer = self.runtime.call_later(ELECTION_REQUEST_TIMEOUT,
+                                                                      self._check_election_results)
 
     def _send_vote_request_to_peer(self, peer_uri_str,
                                    election_epoch_of_request):
 
         # Esta função é responsável por contatar outro peer e solicitar seu voto para uma eleição específica.
 
-        local_peer_proxy = None  # Inicializa a variável do proxy do peer.
         try:
-            # Cria um proxy para se comunicar com o peer especificado pelo URI.
-            # O proxy permite chamar métodos remotos no objeto do outro peer.
-            local_peer_proxy = Pyro5.api.Proxy(peer_uri_str)
-            # Define um timeout curto para a chamada remota, para não bloquear por muito tempo se o peer não responder.
-            local_peer_proxy._pyroTimeout = 2
-
             # Antes de solicitar o voto, verifica se este peer (o solicitante) ainda é um candidato ativo
             # para a época da eleição em questão.
             # Se a candidatura foi cancelada ou mudou para outra época, não prossegue com a solicitação.
@@ -456,28 +624,33 @@ class Peer:
 
             # Loga a ação de solicitar o voto.
             self.logger.info(f"Solicitando voto de {peer_uri_str} para época {election_epoch_of_request}")
-            # Chama o método remoto 'request_vote' no peer de destino.
+            # Pega emprestado do pool um proxy para o peer, com timeout curto para não bloquear por muito
+            # tempo se ele não responder, e chama o método remoto 'request_vote'.
             # Envia o URI do peer candidato (self.uri) e a época da eleição.
-            vote_granted = local_peer_proxy.request_vote(str(self.uri), election_epoch_of_request)
-
-            # Após receber a resposta, verifica novamente se a candidatura ainda é válida.
-            # Isso é importante porque a resposta do voto pode demorar, e o estado da candidatura pode ter mudado nesse meio tempo.
-            if self.candidate_for_epoch == 0 or self.candidate_for_epoch_value != election_epoch_of_request:
-                self.logger.info(
-                    f"Recebi resposta de voto de {peer_uri_str} para {election_epoch_of_request}, mas minha candidatura mudou/foi cancelada.")
-                return  # Encerra se a candidatura não for mais válida.
-
-            # Se o voto foi concedido pelo outro peer:
-            if vote_granted:
-                self.logger.info(f"Voto recebido de {peer_uri_str} para época {election_epoch_of_request}.")
-                # Garante que existe uma entrada no dicionário de votos recebidos para esta época.
-                if election_epoch_of_request not in self.votes_received_for_epoch:
-                    self.votes_received_for_epoch[election_epoch_of_request] = set()
-                # Adiciona o URI do peer que concedeu o voto ao conjunto de votos recebidos para esta eleição.
-                self.votes_received_for_epoch[election_epoch_of_request].add(peer_uri_str)
-            else:
-                # Se o voto foi negado.
-                self.logger.info(f"Voto negado por {peer_uri_str} para época {election_epoch_of_request}.")
+            with self.tracer.client_span("request_vote", peer=peer_uri_str, epoch=election_epoch_of_request) as span, \
+                    self.proxy_pool.lease(peer_uri_str, timeout=2) as local_peer_proxy:
+                vote_granted = local_peer_proxy.request_vote(str(self.uri), election_epoch_of_request)
+                span.set(granted=bool(vote_granted))
+
+            with self._election_lock:
+                # Após receber a resposta, verifica novamente se a candidatura ainda é válida.
+                # Isso é importante porque a resposta do voto pode demorar, e o estado da candidatura pode ter mudado nesse meio tempo.
+                if self.candidate_for_epoch == 0 or self.candidate_for_epoch_value != election_epoch_of_request:
+                    self.logger.info(
+                        f"Recebi resposta de voto de {peer_uri_str} para {election_epoch_of_request}, mas minha candidatura mudou/foi cancelada.")
+                    return  # Encerra se a candidatura não for mais válida.
+
+                # Se o voto foi concedido pelo outro peer:
+                if vote_granted:
+                    self.logger.info(f"Voto recebido de {peer_uri_str} para época {election_epoch_of_request}.")
+                    # Garante que existe uma entrada no dicionário de votos recebidos para esta época.
+                    if election_epoch_of_request not in self.votes_received_for_epoch:
+                        self.votes_received_for_epoch[election_epoch_of_request] = set()
+                    # Adiciona o URI do peer que concedeu o voto ao conjunto de votos recebidos para esta eleição.
+                    self.votes_received_for_epoch[election_epoch_of_request].add(peer_uri_str)
+                else:
+                    # Se o voto foi negado.
+                    self.logger.info(f"Voto negado por {peer_uri_str} para época {election_epoch_of_request}.")
         except Pyro5.errors.CommunicationError:
             # Captura erros de comunicação com o peer (ex: peer offline, rede instável).
             self.logger.warning(
@@ -487,7 +660,15 @@ class Peer:
             self.logger.error(f"Erro ao solicitar voto de {peer_uri_str} para época {election_epoch_of_request}: {e}")
 
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def request_vote(self, candidate_uri_str, election_epoch):
+        # Pedidos de voto chegam em threads diferentes do daemon: a decisão (ler e gravar voted_in_epoch
+        # e o estado de candidatura) é atômica sob o lock da eleição.
+        with self._election_lock:
+            return self._decide_vote(candidate_uri_str, election_epoch)
+
+    def _decide_vote(self, candidate_uri_str, election_epoch):
         # Este método é chamado por um peer candidato para solicitar o voto deste peer em uma eleição.
         # candidate_uri_str: O URI do peer que está se candidatando.
         # election_epoch: A época (número sequencial) da eleição para a qual o voto está sendo solicitado.
@@ -582,6 +763,20 @@ class Peer:
         return True  # Concede o voto.
 
     def _check_election_results(self):
+        # A apuração é feita sob o lock da eleição; o registro como tracker (que fala com o
+        # servidor de nomes) fica fora dele para não atrasar pedidos de voto concorrentes.
+        with self._election_lock:
+            trace_ref, self._election_trace_ref = self._election_trace_ref, None
+        with self.tracer.continue_trace(trace_ref, "tally_votes") as span:
+            with self._election_lock:
+                elected_epoch = self._tally_election_votes()
+            span.set(elected=bool(elected_epoch))
+            if elected_epoch:
+                with self.tracer.span("become_tracker", epoch=elected_epoch):
+                    self._become_tracker(elected_epoch)
+
+    def _tally_election_votes(self):
+        # Retorna a época em que este peer foi eleito, ou None.
         # Este método é chamado para verificar o resultado de uma eleição na qual este peer foi um candidato.
         # Geralmente é acionado após o término do timer de coleta de votos (self.election_vote_collection_timer).
 
@@ -601,6 +796,7 @@ class Peer:
         if election_epoch_being_checked not in self.votes_received_for_epoch:
             self.logger.info(f"Nenhum voto registrado para minha candidatura da época {election_epoch_being_checked}.")
             self.candidate_for_epoch = 0  # Marca que não é mais candidato.
+            self._record_election_result("lost")
             return  # Encerra a função.
 
         # Calcula o número de votos recebidos para a candidatura.
@@ -611,11 +807,12 @@ class Peer:
             f"Eleição para época {election_epoch_being_checked}: {num_votes} votos recebidos. Quórum necessário: {QUORUM}.")
 
         # Compara o número de votos recebidos com o quórum necessário para vencer a eleição.
+        elected_epoch = None
         if num_votes >= QUORUM:
             # Se o número de votos é maior ou igual ao quórum, o peer foi eleito.
             self.logger.info(f"Quórum atingido! Eleito como Tracker_Epoca_{election_epoch_being_checked}.")
-            # Chama o método para se tornar o tracker para a época em que foi eleito.
-            self._become_tracker(election_epoch_being_checked)
+            # O chamador assume o papel de tracker para a época em que foi eleito.
+            elected_epoch = election_epoch_being_checked
         else:
             # Se o quórum não foi atingido, a eleição falhou para esta tentativa.
             self.logger.info(
@@ -629,6 +826,15 @@ class Peer:
         # Se ele se tornou tracker, o estado de candidatura é resetado em _become_tracker.
         # Se perdeu, ele também não é mais candidato para *esta* rodada/época.
         self.candidate_for_epoch = 0
+        self._record_election_result("won" if elected_epoch is not None else "lost")
+        return elected_epoch
+
+    def _record_election_result(self, result):
+        # Chamado com _election_lock adquirido, ao apurar a candidatura
+        self.metrics.elections.inc(result=result)
+        if self._election_started_at is not None:
+            self.metrics.election_duration.observe(time.monotonic() - self._election_started_at)
+            self._election_started_at = None
 
 
     def _become_tracker(self, epoch):
@@ -638,10 +844,9 @@ class Peer:
             return
 
         self.logger.info(f"Tornando-me Tracker_Epoca_{epoch}.")
-        ns_proxy_local_become = None
         try:
-            ns_proxy_local_become = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-        except Pyro5.errors.NamingError:
+            ns_proxy_local_become = self.proxy_pool.acquire(nameserver_uri())
+        except Pyro5.errors.CommunicationError:
             self.logger.error(
                 f"Falha ao conectar ao servidor de nomes em _become_tracker. Não é possível registrar como tracker.")
             self.is_tracker = False
@@ -652,9 +857,10 @@ class Peer:
         self.current_tracker_uri_str = str(self.uri)
         self.current_tracker_proxy = self
 
-        self.candidate_for_epoch = 0
-        self.candidate_for_epoch_value = 0
-        self.votes_received_for_epoch = {}
+        with self._election_lock:
+            self.candidate_for_epoch = 0
+            self.candidate_for_epoch_value = 0
+            self.votes_received_for_epoch = {}
 
         tracker_name = f"{TRACKER_BASE_NAME}{epoch}"
         try:
@@ -673,16 +879,25 @@ class Peer:
             ns_proxy_local_become.register(tracker_name, self.uri)
             self.logger.info(f"Registrado no servidor de nomes como {tracker_name} (URI: {self.uri}).")
         except Exception as e:
+            self.proxy_pool.release(ns_proxy_local_become, broken=isinstance(e, Pyro5.errors.CommunicationError))
             self.logger.error(f"Falha ao registrar como {tracker_name} no servidor de nomes: {e}")
             self._step_down_as_tracker()
             return
-
-        self.file_index = {}
+        self.proxy_pool.release(ns_proxy_local_become)
+
+        self.tracker_index.clear()
+        self.holder_load = {}
+        self._network_filter_acked = {}
+        self._network_filter_cache = None
+        self.network_filter = None  # Como tracker, consulto o índice diretamente
+        self.index_subscriptions.clear()  # Assinantes voltam a assinar (com a lista completa) no novo tracker
         # Ao se tornar tracker, registra seus próprios arquivos com uma atualização completa.
         self._update_tracker_index_for_peer(self.peer_id, str(self.uri), self.local_files, is_incremental=False)
 
         self._stop_tracker_timeout_detection()
         self._start_sending_heartbeats()
+        if self.index_mirror is not None:  # Minha assinatura era com o tracker anterior
+            self.runtime.submit(self._subscribe_index, self.index_mirror)
 
     def _step_down_as_tracker(self):
         # Renuncia ao tracker e remove registro do servidor de nomes
@@ -692,17 +907,17 @@ class Peer:
         epoch_i_was_tracker = self.current_tracker_epoch
         self.logger.info(f"Renunciando ao posto de Tracker_Epoca_{epoch_i_was_tracker}.")
         self._stop_sending_heartbeats()
+        self.index_subscriptions.clear()
 
         tracker_name = f"{TRACKER_BASE_NAME}{epoch_i_was_tracker}"
-        ns_proxy_local_stepdown = None
         try:
-            ns_proxy_local_stepdown = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-            registered_uri = ns_proxy_local_stepdown.lookup(tracker_name)
-            if str(registered_uri) == str(self.uri):
-                ns_proxy_local_stepdown.remove(tracker_name)
-                self.logger.info(f"Removido {tracker_name} (meu registro) do servidor de nomes.")
-            else:
-                self.logger.info(f"Não removi {tracker_name} do NS, pois o URI ({registered_uri}) não é o meu.")
+            with self.proxy_pool.lease_ns() as ns_proxy_local_stepdown:
+                registered_uri = ns_proxy_local_stepdown.lookup(tracker_name)
+                if str(registered_uri) == str(self.uri):
+                    ns_proxy_local_stepdown.remove(tracker_name)
+                    self.logger.info(f"Removido {tracker_name} (meu registro) do servidor de nomes.")
+                else:
+                    self.logger.info(f"Não removi {tracker_name} do NS, pois o URI ({registered_uri}) não é o meu.")
         except Pyro5.errors.NamingError:
             self.logger.info(
                 f"{tracker_name} não encontrado no servidor de nomes para remoção (pode já ter sido substituído).")
@@ -729,19 +944,19 @@ class Peer:
 
         if self.current_tracker_proxy and self.current_tracker_uri_str:
             timeout = random.uniform(TRACKER_DETECTION_TIMEOUT_MIN, TRACKER_DETECTION_TIMEOUT_MAX)
-            self.tracker_timeout_timer = threading.Timer(timeout, self._handle_tracker_timeout)
-            self.tracker_timeout_timer.daemon = True
-            self.tracker_timeout_timer.start()
-            self.logger.info(
-                f"Timer de detecção de falha do tracker iniciado ({timeout:.2f}s) para {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}).")
+            self.tracker_timeout_timer = self.runtime.call_later(timeout, self._handle_tracker_timeout)
+            # Rearmado a cada heartbeat recebido: só aparece com o subsistema heartbeat em DEBUG
+            self.heartbeat_logger.debug(
+                "Timer de detecção de falha do tracker iniciado (%.2fs) para %s (Época %s).",
+                timeout, self.current_tracker_uri_str, self.current_tracker_epoch)
         else:
-            self.logger.debug("Não iniciando timer de detecção de falha: nenhum tracker atual definido.")
+            self.heartbeat_logger.debug("Não iniciando timer de detecção de falha: nenhum tracker atual definido.")
 
     def _stop_tracker_timeout_detection(self):
         # Cancela timer de detecção de falha
         if self.tracker_timeout_timer and self.tracker_timeout_timer.is_alive():
             self.tracker_timeout_timer.cancel()
-            self.logger.debug("Timer de detecção de falha do tracker parado.")
+            self.heartbeat_logger.debug("Timer de detecção de falha do tracker parado.")
 
     def _handle_tracker_timeout(self):
         # Executa ao expirar timer de falha do tracker e inicia eleição
@@ -776,9 +991,7 @@ class Peer:
                 self.logger.info("Não sou mais tracker, parando envio de heartbeats agendado.")
                 self._heartbeat_logging_once = False
 
-        self.heartbeat_send_timer = threading.Timer(HEARTBEAT_INTERVAL, heartbeat_wrapper)
-        self.heartbeat_send_timer.daemon = True
-        self.heartbeat_send_timer.start()
+        self.heartbeat_send_timer = self.runtime.call_later(HEARTBEAT_INTERVAL, heartbeat_wrapper)
 
         if not hasattr(self, '_heartbeat_logging_once') or not self._heartbeat_logging_once:
             self.logger.info(f"Tracker: Envio de heartbeats iniciado para época {self.current_tracker_epoch}.")
@@ -797,39 +1010,250 @@ class Peer:
             self.logger.info("Tentativa de enviar heartbeat, mas não sou mais tracker.")
             return
 
-        self.logger.debug(f"Tracker: Enviando heartbeat da época {self.current_tracker_epoch}.")
+        self.heartbeat_logger.debug("Tracker: Enviando heartbeat da época %s.", self.current_tracker_epoch)
         other_peer_uris = self._get_other_peer_uris()
 
         for peer_uri_str in other_peer_uris:
             try:
-                threading.Thread(target=self._safe_send_heartbeat_to_one_peer,
-                                 args=(peer_uri_str, str(self.uri),
-                                       self.current_tracker_epoch)).start()  # Removido peer_proxy
+                self.runtime.submit_control(self._safe_send_heartbeat_to_one_peer, peer_uri_str, str(self.uri),
+                                            self.current_tracker_epoch)
             except Exception as e:
-                self.logger.warning(f"Tracker: Falha ao criar thread para enviar heartbeat para {peer_uri_str}: {e}")
+                self.heartbeat_logger.warning("Tracker: Falha ao agendar heartbeat para %s: %s", peer_uri_str, e)
+        self._push_index_events()
 
         if self.is_tracker:
             self._start_sending_heartbeats()
 
+    def _push_index_events(self):
+        # Tracker: agenda um lote para cada assinante com eventos pendentes (um envio por vez por assinante,
+        # no máximo um a cada SUBSCRIPTION_PUSH_INTERVAL, agrupando rajadas de registros)
+        now = time.monotonic()
+        version = self.tracker_index.version
+        for subscription in self.index_subscriptions.all():
+            if subscription.in_flight or subscription.delivered_version >= version or now < subscription.next_push_at:
+                continue
+            subscription.in_flight = True
+            subscription.next_push_at = now + SUBSCRIPTION_PUSH_INTERVAL
+            try:
+                self.runtime.submit(self._send_index_events, subscription)
+            except Exception as e:
+                subscription.in_flight = False
+                self.tracker_logger.warning("Tracker: Falha ao agendar eventos do índice para %s: %s",
+                                            subscription.peer_id, e)
+
+    def _send_index_events(self, subscription):
+        try:
+            events, upto_version, snapshot_names = subscription.next_batch(self.tracker_index, SUBSCRIPTION_MAX_BATCH)
+            with self.proxy_pool.lease(subscription.callback_uri, timeout=2) as subscriber_proxy:
+                response = subscriber_proxy.receive_index_events(subscription.subscription_id,
+                                                                 self.current_tracker_epoch, events, upto_version,
+                                                                 snapshot_names)
+            if isinstance(response, dict) and response.get("status") == "ok":
+                subscription.delivered_version = upto_version
+                subscription.failures = 0
+            else:
+                self.index_subscriptions.unsubscribe(subscription.subscription_id)
+                self.tracker_logger.info("Tracker: Assinatura %s de %s recusada pelo assinante; descartada.",
+                                         subscription.subscription_id, subscription.peer_id)
+        except Pyro5.errors.CommunicationError:
+            subscription.failures += 1
+            if subscription.failures >= SUBSCRIPTION_MAX_FAILURES:
+                self.index_subscriptions.unsubscribe(subscription.subscription_id)
+                self.tracker_logger.warning("Tracker: Assinante %s inacessível após %d tentativas; assinatura descartada.",
+                                            subscription.peer_id, subscription.failures)
+        except Exception as e:
+            self.tracker_logger.warning("Tracker: Erro ao enviar eventos do índice para %s: %s", subscription.peer_id, e)
+        finally:
+            subscription.in_flight = False
+
     def _safe_send_heartbeat_to_one_peer(self, target_peer_uri_str, tracker_uri_str,
                                          tracker_epoch):  # Removido peer_proxy
         # Tenta enviar heartbeat a um peer e captura falhas sem interromper o tracker
-        local_target_proxy = None
+        send_start = time.perf_counter()
         try:
-            local_target_proxy = Pyro5.api.Proxy(target_peer_uri_str)
-            local_target_proxy._pyroTimeout = 0.5
-            local_target_proxy.receive_heartbeat(tracker_uri_str, tracker_epoch)
+            # O filtro só vai junto quando o peer ainda não confirmou a versão atual
+            index_filter = None
+            if NETWORK_FILTER_ENABLED:
+                filter_version, filter_data = self._current_network_filter()
+                if self._network_filter_acked.get(target_peer_uri_str) != filter_version:
+                    index_filter = {"version": filter_version, "filter": filter_data}
+            with self.proxy_pool.lease(target_peer_uri_str, timeout=0.5) as local_target_proxy:
+                response = local_target_proxy.receive_heartbeat(tracker_uri_str, tracker_epoch, index_filter,
+                                                                self.tracker_index.version)
+            self.metrics.heartbeats_sent.inc(outcome="ok")
+            self.metrics.heartbeat_send_latency.observe(time.perf_counter() - send_start)
+            # A resposta traz a carga atual do peer, repassada aos downloaders em query_file
+            if isinstance(response, dict) and "load" in response:
+                self.holder_load[target_peer_uri_str] = response["load"]
+            if isinstance(response, dict):
+                self._network_filter_acked[target_peer_uri_str] = response.get("index_filter_version")
         except Pyro5.errors.CommunicationError:
-            self.logger.debug(
-                f"Tracker: Falha de comunicação ao enviar heartbeat para {target_peer_uri_str}. Peer pode estar offline.")
+            self.metrics.heartbeats_sent.inc(outcome="error")
+            self.holder_load.pop(target_peer_uri_str, None)
+            self._network_filter_acked.pop(target_peer_uri_str, None)
+            self.heartbeat_logger.debug(
+                "Tracker: Falha de comunicação ao enviar heartbeat para %s. Peer pode estar offline.",
+                target_peer_uri_str)
         except Exception as e:
-            self.logger.warning(f"Tracker: Erro inesperado ao enviar heartbeat para {target_peer_uri_str}: {e}")
+            self.heartbeat_logger.warning("Tracker: Erro inesperado ao enviar heartbeat para %s: %s",
+                                          target_peer_uri_str, e)
 
     @Pyro5.api.expose
-    def receive_heartbeat(self, incoming_tracker_uri_str, incoming_tracker_epoch):
-        # Processa heartbeat recebido e decide se mantenho ou renuncio
-        self.logger.debug(
-            f"Heartbeat recebido de {incoming_tracker_uri_str} (Epoca {incoming_tracker_epoch}). Meu tracker: {self.current_tracker_uri_str} (Epoca {self.current_tracker_epoch}). Sou tracker: {self.is_tracker}")
+    @timed_rpc
+    @traced_rpc
+    def receive_heartbeat(self, incoming_tracker_uri_str, incoming_tracker_epoch, index_filter=None,
+                          index_version=None):
+        # Processa heartbeat recebido e responde com a carga atual deste peer (uploads ativos + na fila)
+        # e a versão do filtro do índice que já tenho (o tracker só reenvia o filtro quando ela muda)
+        self._process_heartbeat(incoming_tracker_uri_str, incoming_tracker_epoch)
+        if not self.is_tracker and incoming_tracker_uri_str == self.current_tracker_uri_str \
+                and incoming_tracker_epoch == self.current_tracker_epoch:
+            self._store_network_filter(incoming_tracker_epoch, index_filter)
+            if index_version is not None:  # Valida (ou invalida) as respostas guardadas no lookup_cache
+                self._tracker_index_version = (incoming_tracker_epoch, index_version, time.monotonic())
+                self._check_index_subscription(incoming_tracker_epoch, index_version)
+        network_filter = self.network_filter
+        filter_version = network_filter[1] if network_filter and network_filter[0] == self.current_tracker_epoch else None
+        return {"load": self.upload_scheduler.load(), "upload_queue_depth": self.upload_scheduler.queue_depth(),
+                "index_filter_version": filter_version}
+
+    def _check_index_subscription(self, tracker_epoch, index_version):
+        # Reassina se a assinatura é de outro tracker, ou retoma da última versão recebida se o índice
+        # avançou e nenhum lote chegou há SUBSCRIPTION_RESUME_AFTER (assinatura perdida pelo tracker)
+        mirror = self.index_mirror
+        if mirror is None or mirror.resubscribing:
+            return
+        stalled = (mirror.version is None or index_version > mirror.version) and \
+            time.monotonic() - mirror.updated_at > SUBSCRIPTION_RESUME_AFTER
+        if mirror.tracker_epoch != tracker_epoch or stalled:
+            mirror.resubscribing = True
+            self.runtime.submit(self._subscribe_index, mirror)
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def receive_index_events(self, subscription_id, tracker_epoch, events, upto_version, snapshot_names=None):
+        """Chamado pelo tracker com um lote de eventos [versão, "add" | "remove", nome] da minha assinatura."""
+        mirror = self.index_mirror
+        if mirror is None or mirror.subscription_id != subscription_id or tracker_epoch != mirror.tracker_epoch:
+            return {"status": "unknown_subscription"}
+        added, removed = mirror.apply(events, upto_version, snapshot_names)
+        if added or removed:
+            self.logger.info("Índice ('%s'): %d arquivo(s) novo(s), %d removido(s) (versão %s).",
+                             mirror.pattern, len(added), len(removed), upto_version)
+            self.logger.debug("Índice: novos %s, removidos %s", added, removed)
+        return {"status": "ok"}
+
+    def _subscribe_index(self, mirror):
+        # Registra (ou retoma) a assinatura 'mirror' no tracker atual
+        resume_from = mirror.version if mirror.tracker_epoch == self.current_tracker_epoch else None
+        try:
+            if self.is_tracker:
+                response = self.subscribe_index(self.peer_id, str(self.uri), mirror.pattern, resume_from,
+                                                self.current_tracker_epoch)
+            elif self.current_tracker_uri_str:
+                with self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                    response = tracker_proxy_local.subscribe_index(self.peer_id, str(self.uri), mirror.pattern,
+                                                                   resume_from, self.current_tracker_epoch)
+            else:
+                response = None
+            if isinstance(response, dict) and response.get("status") == "ok":
+                mirror.attach(response["subscription_id"], self.current_tracker_epoch, resumed=resume_from is not None)
+                self.logger.info(f"Assinatura do índice '{mirror.pattern}' registrada no tracker (época "
+                                 f"{self.current_tracker_epoch}, {'retomada da versão ' + str(resume_from) if resume_from is not None else 'lista completa'}).")
+                return True
+            self.logger.warning(f"Tracker não aceitou a assinatura do índice: {response}")
+        except Pyro5.errors.CommunicationError:
+            self.logger.warning("Falha de comunicação com o tracker ao assinar mudanças do índice.")
+        except Exception as e:
+            self.logger.error(f"Erro ao assinar mudanças do índice: {e}")
+        mirror.resubscribing = False
+        mirror.updated_at = time.monotonic()  # Nova tentativa só depois de SUBSCRIPTION_RESUME_AFTER
+        return False
+
+    def _store_network_filter(self, tracker_epoch, index_filter):
+        # Heartbeat do tracker atual: um filtro novo substitui o anterior; sem filtro, o meu continua válido
+        if index_filter is not None:
+            try:
+                bloom = BloomFilter.from_dict(index_filter["filter"])
+            except (KeyError, TypeError, ValueError) as e:
+                self.heartbeat_logger.warning("Filtro do índice inválido recebido do tracker: %s", e)
+                self.network_filter = None
+                return
+            self.network_filter = (tracker_epoch, index_filter["version"], bloom)
+            self.heartbeat_logger.debug("Filtro do índice versão %s recebido (%d bytes).",
+                                        index_filter["version"], len(bloom.bits))
+        elif self.network_filter is None or self.network_filter[0] != tracker_epoch:
+            return
+        self._network_filter_confirmed_at = time.monotonic()
+
+    def _current_network_filter(self):
+        # (versão dos nomes do índice, filtro serializado) com todos os nomes do índice atual. A versão é
+        # names_version: escritas que só mudam holders (ou os holders parciais) não geram filtro novo.
+        # Os nomes novos vêm do log de mudanças do índice e são adicionados ao filtro; nomes removidos
+        # continuam nele (viram falsos positivos) até a próxima reconstrução completa, feita quando o
+        # filtro enche, acumula removidos demais ou o log já não cobre a versão do filtro
+        with self._network_filter_lock:
+            names_version = self.tracker_index.names_version
+            cached = self._network_filter_cache
+            if cached is not None and cached[0] >= names_version:
+                return cached[0], cached[3]
+            if cached is not None:
+                changes = self.tracker_index.changes_since(cached[0])
+                if changes is not None:
+                    events, _ = changes
+                    added = {name for _, op, name in events if op == "add"}
+                    stale = cached[2] + sum(1 for _, op, _ in events if op == "remove")
+                    names_version = events[-1][0] if events else cached[0]
+                    bloom = cached[1]
+                    if len(self.tracker_index) + stale <= bloom.capacity and \
+                            stale <= bloom.capacity * NETWORK_FILTER_MAX_STALE_RATIO:
+                        bloom = bloom.copy()  # O serializado anterior pode estar sendo enviado
+                        bloom.update(added)
+                        self._network_filter_cache = (names_version, bloom, stale, bloom.to_dict())
+                        return names_version, self._network_filter_cache[3]
+            snapshot = self.tracker_index.snapshot()
+            bloom = BloomFilter.for_capacity(max(2 * len(snapshot), NETWORK_FILTER_MIN_CAPACITY),
+                                             NETWORK_FILTER_FALSE_POSITIVE_RATE)
+            bloom.update(snapshot.files)
+            self._network_filter_cache = (snapshot.names_version, bloom, 0, bloom.to_dict())
+            self.tracker_logger.debug("Tracker: Filtro do índice reconstruído (versão %d, %d arquivos, %d bytes).",
+                                      snapshot.names_version, len(snapshot), len(bloom.bits))
+            return snapshot.names_version, self._network_filter_cache[3]
+
+    def _cached_tracker_lookup(self, key):
+        # Resposta guardada para a consulta 'key', se a versão do índice anunciada pelo tracker atual não mudou
+        known = self._tracker_index_version
+        if not LOOKUP_CACHE_ENABLED or known is None or known[0] != self.current_tracker_epoch \
+                or time.monotonic() - known[2] > LOOKUP_CACHE_MAX_VERSION_AGE:
+            return None
+        response = self.lookup_cache.get(key, known[0], known[1])
+        self.metrics.lookup_cache_requests.inc(operation=key[0], result="miss" if response is None else "hit")
+        return response
+
+    def _store_tracker_lookup(self, key, response):
+        # Guarda uma resposta "ok" do tracker com a época e a versão do índice em que foi gerada
+        if LOOKUP_CACHE_ENABLED and isinstance(response, dict) and response.get("status") == "ok" \
+                and "index_version" in response:
+            self.lookup_cache.put(key, self.current_tracker_epoch, response["index_version"], response)
+
+    def _network_filter_excludes(self, filename):
+        # True se o filtro recente do tracker atual garante que nenhum peer tem o arquivo
+        network_filter = self.network_filter
+        if not NETWORK_FILTER_ENABLED or self.is_tracker or network_filter is None:
+            return False
+        if network_filter[0] != self.current_tracker_epoch or \
+                time.monotonic() - self._network_filter_confirmed_at > NETWORK_FILTER_MAX_AGE:
+            return False
+        return filename not in network_filter[2]
+
+    def _process_heartbeat(self, incoming_tracker_uri_str, incoming_tracker_epoch):
+        # Decide se mantenho o tracker atual, troco de tracker ou renuncio (se eu for o tracker)
+        self.metrics.heartbeats_received.inc()
+        self.heartbeat_logger.debug(
+            "Heartbeat recebido de %s (Epoca %s). Meu tracker: %s (Epoca %s). Sou tracker: %s",
+            incoming_tracker_uri_str, incoming_tracker_epoch, self.current_tracker_uri_str,
+            self.current_tracker_epoch, self.is_tracker)
 
         if self.is_tracker:
             if incoming_tracker_uri_str == str(self.uri):
@@ -846,19 +1270,22 @@ class Peer:
                     self._step_down_as_tracker()
                     return
                 else:
-                    self.logger.info(
-                        f"Sou Tracker (Época {self.current_tracker_epoch}), recebi heartbeat de {incoming_tracker_uri_str} (MESMA época) com URI MAIOR/IGUAL. Ignorando o dele.")
+                    self.heartbeat_logger.info(
+                        "Sou Tracker (Época %s), recebi heartbeat de %s (MESMA época) com URI MAIOR/IGUAL. Ignorando o dele.",
+                        self.current_tracker_epoch, incoming_tracker_uri_str)
                     return
             else:
-                self.logger.info(
-                    f"Sou Tracker (Época {self.current_tracker_epoch}), recebi heartbeat de um tracker antigo/inferior ({incoming_tracker_uri_str}, Época {incoming_tracker_epoch}). Ignorando.")
+                self.heartbeat_logger.info(
+                    "Sou Tracker (Época %s), recebi heartbeat de um tracker antigo/inferior (%s, Época %s). Ignorando.",
+                    self.current_tracker_epoch, incoming_tracker_uri_str, incoming_tracker_epoch)
                 return
 
         if incoming_tracker_epoch > self.current_tracker_epoch:
             self.logger.info(
                 f"Novo tracker ou tracker com época superior detectado (Época {incoming_tracker_epoch} > {self.current_tracker_epoch}). Conectando a {incoming_tracker_uri_str}.")
             self._stop_tracker_timeout_detection()
-            self.voted_in_epoch = {e: c for e, c in self.voted_in_epoch.items() if e >= incoming_tracker_epoch}
+            with self._election_lock:
+                self.voted_in_epoch = {e: c for e, c in self.voted_in_epoch.items() if e >= incoming_tracker_epoch}
             self._connect_to_tracker(Pyro5.api.URI(incoming_tracker_uri_str), incoming_tracker_epoch)
 
         elif incoming_tracker_epoch == self.current_tracker_epoch:
@@ -867,8 +1294,12 @@ class Peer:
                     f"Recebi heartbeat de tracker {incoming_tracker_uri_str} para época {incoming_tracker_epoch} (eu não tinha tracker para esta época). Conectando.")
                 self._connect_to_tracker(Pyro5.api.URI(incoming_tracker_uri_str), incoming_tracker_epoch)
             elif self.current_tracker_uri_str == incoming_tracker_uri_str:
-                self.logger.debug(
-                    f"Heartbeat válido do tracker atual {self.current_tracker_uri_str}. Reiniciando timer de timeout.")
+                self.heartbeat_logger.debug(
+                    "Heartbeat válido do tracker atual %s. Reiniciando timer de timeout.", self.current_tracker_uri_str)
+                now = time.monotonic()
+                if self._last_heartbeat_received_at is not None:
+                    self.metrics.heartbeat_receive_interval.observe(now - self._last_heartbeat_received_at)
+                self._last_heartbeat_received_at = now
                 self._start_tracker_timeout_detection()
             else:
                 if incoming_tracker_uri_str < self.current_tracker_uri_str:
@@ -877,15 +1308,19 @@ class Peer:
                     self._stop_tracker_timeout_detection()
                     self._connect_to_tracker(Pyro5.api.URI(incoming_tracker_uri_str), incoming_tracker_epoch)
                 else:
-                    self.logger.info(
-                        f"Heartbeat de tracker alternativo {incoming_tracker_uri_str} (época {incoming_tracker_epoch}), mas meu tracker atual {self.current_tracker_uri_str} tem URI menor/igual. Mantendo o atual e reiniciando timer.")
+                    self.heartbeat_logger.info(
+                        "Heartbeat de tracker alternativo %s (época %s), mas meu tracker atual %s tem URI menor/igual. Mantendo o atual e reiniciando timer.",
+                        incoming_tracker_uri_str, incoming_tracker_epoch, self.current_tracker_uri_str)
                     self._start_tracker_timeout_detection()
         else:
-            self.logger.debug(
-                f"Heartbeat de tracker antigo/inferior ({incoming_tracker_uri_str}, Época {incoming_tracker_epoch}) ignorado.")
+            self.heartbeat_logger.debug(
+                "Heartbeat de tracker antigo/inferior (%s, Época %s) ignorado.", incoming_tracker_uri_str,
+                incoming_tracker_epoch)
 
     # --- Funcionalidades do Tracker (quando self.is_tracker == True) ---
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def register_files(self, peer_id_req, peer_uri_str_req, file_list_req, peer_tracker_epoch_view_req,
                        is_incremental_update=False):  # Adicionado is_incremental_update
         """Chamado por peers para registrar/atualizar seus arquivos no tracker."""
@@ -902,54 +1337,96 @@ class Peer:
             return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch}
 
         log_action = "adicionando incrementalmente" if is_incremental_update else "registrando/atualizando (completo)"
-        self.logger.info(
-            f"Tracker: {peer_id_req} ({peer_uri_str_req}) {log_action} arquivos (peer viu época {peer_tracker_epoch_view_req}): {file_list_req}")
+        # Em INFO só a contagem: formatar a lista inteira custaria O(arquivos do peer) por registro
+        self.tracker_logger.info("Tracker: %s (%s) %s %d arquivos (peer viu época %s).", peer_id_req,
+                                 peer_uri_str_req, log_action, len(file_list_req), peer_tracker_epoch_view_req)
+        self.tracker_logger.debug("Tracker: Arquivos de %s: %s", peer_id_req, file_list_req)
 
         self._update_tracker_index_for_peer(peer_id_req, peer_uri_str_req, file_list_req,
                                             is_incremental=is_incremental_update)
         return {"status": "ok", "registered_at_epoch": self.current_tracker_epoch}
 
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def unregister_files(self, peer_id_req, peer_uri_str_req, file_list_req, peer_tracker_epoch_view_req):
+        """Chamado por peers para retirar do índice arquivos que removeram (em vez de reenviar a lista completa)."""
+        if not self.is_tracker:
+            return {"status": "not_tracker",
+                    "known_tracker_uri": self.current_tracker_uri_str,
+                    "known_tracker_epoch": self.current_tracker_epoch}
+
+        if peer_tracker_epoch_view_req < self.current_tracker_epoch:
+            return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch}
+
+        self.tracker_logger.info("Tracker: %s (%s) removendo %d arquivos (peer viu época %s).", peer_id_req,
+                                 peer_uri_str_req, len(file_list_req), peer_tracker_epoch_view_req)
+        self.tracker_logger.debug("Tracker: Arquivos removidos por %s: %s", peer_id_req, file_list_req)
+        self._remove_from_tracker_index(peer_id_req, file_list_req)
+        return {"status": "ok", "registered_at_epoch": self.current_tracker_epoch}
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def register_chunks(self, peer_id_req, peer_uri_str_req, filename, total_size, bitfield,
+                        peer_tracker_epoch_view_req):
+        """Chamado por peers com um download em andamento para anunciar quais chunks do arquivo já possuem.
+
+        bitfield None (download abortado) ou completo (o arquivo inteiro será registrado via
+        register_files) remove o peer dos holders parciais do arquivo.
+        """
+        if not self.is_tracker:
+            return {"status": "not_tracker",
+                    "known_tracker_uri": self.current_tracker_uri_str,
+                    "known_tracker_epoch": self.current_tracker_epoch}
+
+        if peer_tracker_epoch_view_req < self.current_tracker_epoch:
+            return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch}
+
+        bits = chunk_to_bytes(bitfield) if bitfield is not None else None
+        num_chunks = num_chunks_for(total_size)
+        if bits is None or len(bits) != (num_chunks + 7) // 8 or Bitfield(num_chunks, bits).is_complete():
+            self.tracker_index.set_partial(filename, peer_id_req, None)
+            self.tracker_logger.debug("Tracker: %s removido dos holders parciais de '%s'.", peer_id_req, filename)
+        else:
+            self.tracker_index.set_partial(filename, peer_id_req, (peer_uri_str_req, total_size, bits))
+            if self.tracker_logger.isEnabledFor(logging.DEBUG):
+                self.tracker_logger.debug("Tracker: %s possui %d/%d chunks de '%s'.", peer_id_req,
+                                          Bitfield(num_chunks, bits).count(), num_chunks, filename)
+        return {"status": "ok"}
+
     def _update_tracker_index_for_peer(self, peer_id_to_update, peer_uri_to_update, new_file_list,
                                        is_incremental=False):
         """Lógica interna para atualizar o índice de arquivos para um peer específico."""
         if not is_incremental:
-            # Lógica de atualização completa (remove todas as entradas antigas para este peer)
-            self.logger.debug(f"Tracker: Executando atualização COMPLETA do índice para {peer_id_to_update}.")
-            for filename in list(self.file_index.keys()):  # Itera sobre uma cópia das chaves
-                current_holders = self.file_index.get(filename, set())
-                # Filtra para remover o peer_id_to_update, mantendo outros
-                updated_holders = {(pid, puri) for pid, puri in current_holders if pid != peer_id_to_update}
-
-                if not updated_holders:  # Se o set ficar vazio
-                    if filename in self.file_index:  # Verifica se a chave ainda existe antes de deletar
-                        del self.file_index[filename]
-                elif len(updated_holders) < len(current_holders):  # Se algo foi removido
-                    self.file_index[filename] = updated_holders
-
-            # Adiciona os novos arquivos da new_file_list (que é a lista completa neste caso)
-            for filename in new_file_list:
-                if filename not in self.file_index:
-                    self.file_index[filename] = set()
-                self.file_index[filename].add((peer_id_to_update, peer_uri_to_update))
+            # Atualização completa: remove todas as entradas antigas deste peer e adiciona a lista nova
+            self.tracker_logger.debug("Tracker: Executando atualização COMPLETA do índice para %s.", peer_id_to_update)
+            self.tracker_index.replace_peer_files(peer_id_to_update, peer_uri_to_update, new_file_list)
         else:
             # Lógica de atualização incremental (APENAS adiciona os novos arquivos)
-            self.logger.debug(
-                f"Tracker: Executando atualização INCREMENTAL do índice para {peer_id_to_update} com arquivos: {new_file_list}.")
+            self.tracker_logger.debug(
+                "Tracker: Executando atualização INCREMENTAL do índice para %s com arquivos: %s.", peer_id_to_update,
+                new_file_list)
             if not new_file_list:  # Se a lista de novos arquivos estiver vazia, não faz nada.
-                self.logger.debug(
-                    f"Tracker: Nenhum arquivo novo para adicionar incrementalmente para {peer_id_to_update}.")
+                self.tracker_logger.debug(
+                    "Tracker: Nenhum arquivo novo para adicionar incrementalmente para %s.", peer_id_to_update)
                 return
+            self.tracker_index.add_peer_files(peer_id_to_update, peer_uri_to_update, new_file_list)
 
-            for filename in new_file_list:  # new_file_list contém apenas os arquivos a serem ADICIONADOS
-                if filename not in self.file_index:
-                    self.file_index[filename] = set()
-                # Adiciona o peer ao arquivo, mesmo que já exista (o set cuida da duplicidade)
-                self.file_index[filename].add((peer_id_to_update, peer_uri_to_update))
-                self.logger.debug(f"Tracker: Adicionado/confirmado {filename} para {peer_id_to_update}.")
+        self.tracker_logger.info("Tracker: Índice atualizado para %s (%d arquivos no índice, versão %d).",
+                                 peer_id_to_update, len(self.tracker_index), self.tracker_index.version)
+        # O snapshot é imutável: só é convertido em texto na thread de log, e apenas com DEBUG ligado
+        self.tracker_logger.debug("Tracker: Índice agora: %s", self.tracker_index.snapshot())
 
-        self.logger.info(f"Tracker: Índice atualizado para {peer_id_to_update}. Índice agora: {self.file_index}")
+    def _remove_from_tracker_index(self, peer_id_to_update, removed_files):
+        # Remoção incremental: só os arquivos informados, sem percorrer o índice inteiro
+        self.tracker_index.remove_peer_files(peer_id_to_update, removed_files)
+        self.tracker_logger.info("Tracker: Índice atualizado para %s (%d arquivos no índice, versão %d).",
+                                 peer_id_to_update, len(self.tracker_index), self.tracker_index.version)
 
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def query_file(self, filename_req, asking_peer_epoch_view_req):
         """Chamado por peers para perguntar quem tem um arquivo."""
         if not self.is_tracker:
@@ -963,13 +1440,30 @@ class Peer:
                 f"Tracker: Peer com época desatualizada ({asking_peer_epoch_view_req}) tentou consultar arquivo '{filename_req}'. Minha época: {self.current_tracker_epoch}")
             return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch, "holders": []}
 
-        self.logger.info(
-            f"Tracker: Consulta pelo arquivo '{filename_req}' (peer viu época {asking_peer_epoch_view_req}).")
-        holders = list(self.file_index.get(filename_req, set()))
-        self.logger.info(f"Tracker: Arquivo '{filename_req}' encontrado nos peers: {holders}")
-        return {"status": "ok", "holders": holders}
+        self.tracker_logger.info("Tracker: Consulta pelo arquivo '%s' (peer viu época %s).", filename_req,
+                                 asking_peer_epoch_view_req)
+        snapshot = self.tracker_index.snapshot()
+        holders = snapshot.holders(filename_req)
+        self.tracker_logger.info("Tracker: Arquivo '%s' encontrado em %d peers.", filename_req, len(holders))
+        self.tracker_logger.debug("Tracker: Holders de '%s': %s", filename_req, tuple(holders))
+        # Peers que ainda estão baixando o arquivo, com o bitfield dos chunks que já podem servir
+        full_holder_ids = {pid for pid, _ in holders}
+        partial_holders = [[pid, uri, total_size, bits]
+                           for pid, (uri, total_size, bits) in self.tracker_index.partial_holders(filename_req).items()
+                           if pid not in full_holder_ids]
+        # Carga conhecida de cada holder (a minha é lida diretamente)
+        holder_load = {uri: (self.upload_scheduler.load() if uri == str(self.uri) else self.holder_load.get(uri, 0))
+                       for uri in [uri for _, uri in holders] + [entry[1] for entry in partial_holders]}
+        response = {"status": "ok", "holders": holders, "partial_holders": partial_holders, "holder_load": holder_load}
+        if not partial_holders:
+            # Os anúncios de chunks não mudam a versão do índice: respostas com holders parciais não vão para
+            # o cache de consultas do cliente (sem "index_version"), senão os bitfields ficariam velhos
+            response["index_version"] = snapshot.version
+        return response
 
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def get_all_indexed_files(self, asking_peer_epoch_view_req):
         """Retorna um dicionário de todos os arquivos indexados e quem os possui."""
         if not self.is_tracker:
@@ -983,54 +1477,232 @@ class Peer:
                 f"Tracker: Peer com época desatualizada ({asking_peer_epoch_view_req}) tentou listar todos os arquivos.")
             return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch, "index": {}}
 
-        serializable_index = {filename: list(peers) for filename, peers in self.file_index.items()}
-        return {"status": "ok", "index": serializable_index}
+        # Itera sobre um snapshot imutável: registros concorrentes publicam um novo snapshot sem afetar este
+        snapshot = self.tracker_index.snapshot()
+        serializable_index = dict(snapshot.items())
+        return {"status": "ok", "index": serializable_index, "index_version": snapshot.version}
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def subscribe_index(self, peer_id_req, callback_uri_req, pattern, resume_from_version, asking_peer_epoch_view_req):
+        """Assina as mudanças do índice para nomes que casam com 'pattern' (glob); os eventos chegam em
+        receive_index_events a partir de resume_from_version (None = lista completa primeiro)."""
+        if not self.is_tracker:
+            return {"status": "not_tracker",
+                    "known_tracker_uri": self.current_tracker_uri_str,
+                    "known_tracker_epoch": self.current_tracker_epoch}
+        if asking_peer_epoch_view_req < self.current_tracker_epoch:
+            return {"status": "epoch_too_low", "current_tracker_epoch": self.current_tracker_epoch}
+
+        subscription = self.index_subscriptions.subscribe(peer_id_req, callback_uri_req, pattern or "*",
+                                                          -1 if resume_from_version is None else resume_from_version)
+        # Primeiro lote só depois de o assinante receber o id da assinatura (resposta desta chamada)
+        subscription.next_push_at = time.monotonic() + SUBSCRIPTION_PUSH_INTERVAL
+        self.tracker_logger.info("Tracker: %s assinou mudanças do índice ('%s', a partir da versão %s).",
+                                 peer_id_req, subscription.pattern, resume_from_version)
+        return {"status": "ok", "subscription_id": subscription.subscription_id,
+                "index_version": self.tracker_index.version}
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def unsubscribe_index(self, subscription_id):
+        """Cancela uma assinatura feita com subscribe_index."""
+        subscription = self.index_subscriptions.unsubscribe(subscription_id)
+        if subscription is not None:
+            self.tracker_logger.info("Tracker: %s cancelou a assinatura do índice.", subscription.peer_id)
+        return {"status": "ok"}
 
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def ping(self):
         """Método simples para verificar se o tracker (ou qualquer peer) está vivo."""
-        self.logger.debug(f"Ping recebido em {self.peer_id} (URI: {self.uri})")
+        self.logger.debug("Ping recebido em %s (URI: %s)", self.peer_id, self.uri)
         return True
 
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def get_data_uri(self, requester_id=None, partial=False):
+        """URI que atende as transferências de 'requester_id', ou None se tudo é atendido por este URI.
+
+        Com processos de upload, cada downloader é direcionado sempre ao mesmo worker; pedidos de chunks
+        de um download em andamento (partial=True) ficam no plano de dados do processo principal.
+        """
+        if not partial and self.serving_workers is not None and self.serving_workers.uris:
+            return self.serving_workers.pick(requester_id)
+        return str(self.data_plane.uri) if self.data_plane is not None else None
+
     # --- Funcionalidades do Peer (para transferência P2P) ---
     @Pyro5.api.expose
-    def request_file_chunk(self, filename, chunk_offset, chunk_size):
+    @timed_rpc
+    @traced_rpc
+    def request_file_chunk(self, filename, chunk_offset, chunk_size, requester_id=None):
         """Chamado por outro peer para baixar um chunk de um arquivo."""
-        if filename not in self.local_files:
-            self.logger.warning(f"Pedido de arquivo '{filename}' recebido, mas não o possuo.")
-            return None  # Ou levantar uma exceção específica
+        return self._serve_chunk(filename, chunk_offset, chunk_size, requester_id)
 
-        file_path = os.path.join(self.shared_folder, filename)
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def request_file_chunk_compressed(self, filename, chunk_offset, chunk_size, accepted_codecs, requester_id=None):
+        """Como request_file_chunk, mas devolve {'codec', 'size', 'data'} comprimido com um dos codecs aceitos."""
+        return self._serve_chunk(filename, chunk_offset, chunk_size, requester_id, accepted_codecs or [])
+
+    def _serve_chunk(self, filename, chunk_offset, chunk_size, requester_id, accepted_codecs=None):
+        # Lê o chunk dentro de um slot de upload; com accepted_codecs != None a resposta é codificada
+        if filename in self.local_files_set:
+            file_path = to_local_path(self.shared_folder, filename)
+        else:
+            # Download em andamento: serve o chunk se ele já chegou por completo
+            partial = self.partial_downloads.get(filename)
+            chunk_size = partial.servable_size(chunk_offset, chunk_size) if partial else 0
+            if not chunk_size:
+                self.transfer_logger.warning("Pedido de arquivo '%s' recebido, mas não o possuo.", filename)
+                return None  # Ou levantar uma exceção específica
+            file_path = partial.path
+
+        requester_id = requester_id or "desconhecido"
         try:
-            with open(file_path, 'rb') as f:
-                f.seek(chunk_offset)
-                data = f.read(chunk_size)
-                self.logger.debug(f"Enviando chunk de '{filename}', offset {chunk_offset}, size {len(data)}")
-                return data
+            # Aguarda um slot de upload (fila justa por peer) e respeita os limites de banda
+            with self.upload_scheduler.slot(requester_id) as slot:
+                with self.tracer.span("read_chunk", bytes=chunk_size) as span:
+                    if self.chunk_cache is not None and filename in self.local_files_set:
+                        # Arquivo compartilhado: N peers pedindo o mesmo chunk custam uma leitura do disco
+                        data, cached = self.chunk_cache.read(file_path, chunk_offset, chunk_size)
+                        self.metrics.chunk_cache_requests.inc(result="hit" if cached else "miss")
+                        span.set(cached=cached)
+                    else:
+                        with open(file_path, 'rb') as f:
+                            f.seek(chunk_offset)
+                            data = f.read(chunk_size)
+                # Com pouca banda vai só o pedaço que cabe no orçamento de espera; o downloader pede o resto
+                reservation = slot.reserve(len(data))
+                if reservation.nbytes < len(data):
+                    data = data[:reservation.nbytes]
+                if accepted_codecs is None:
+                    with self.tracer.span("throttle"):
+                        reservation.settle(len(data))
+                    self.metrics.bytes_served.inc(len(data))
+                    self.transfer_logger.debug("Enviando chunk de '%s', offset %s, size %d", filename, chunk_offset,
+                                               len(data))
+                    return data
+                # Os limites de banda valem para os bytes que de fato vão pela rede (já comprimidos)
+                with self.tracer.span("encode_chunk") as span:
+                    payload = encode_chunk(data, accepted_codecs)
+                    span.set(codec=payload["codec"], wire_bytes=len(payload["data"]))
+                with self.tracer.span("throttle"):
+                    reservation.settle(len(payload["data"]))
+                self.metrics.bytes_served.inc(len(payload["data"]))
+                self.transfer_logger.debug(
+                    "Enviando chunk de '%s', offset %s, size %d (codec %s, %d bytes na rede)", filename, chunk_offset,
+                    len(data), payload['codec'], len(payload['data']))
+                return payload
+        except UploadQueueTimeout:
+            self.transfer_logger.warning(
+                "Pedido de chunk de '%s' de %s descartado: nenhum slot de upload livre a tempo.", filename, requester_id)
+            return None
         except FileNotFoundError:
             self.logger.error(
                 f"Arquivo '{filename}' não encontrado no caminho {file_path} ao tentar ler para download.")
-            self.local_files = self._scan_local_files()  # Re-sincroniza se o arquivo sumiu
-            self.update_local_files_and_notify_tracker()  # Notifica o tracker da mudança
+            self.update_local_files_and_notify_tracker()  # Re-sincroniza e notifica o tracker se o arquivo sumiu
             return None
         except Exception as e:
             self.logger.error(f"Erro ao ler arquivo '{filename}' para download: {e}")
             return None
 
     @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def request_file_delta(self, filename, signature, accepted_codecs=None, requester_id=None, cursor=None):
+        """Uma página do delta (estilo rsync) entre a cópia do solicitante, descrita pela assinatura, e o meu arquivo.
+
+        'cursor' é o 'next' da página anterior (None na primeira); a resposta traz 'next' None na última.
+        """
+        if filename not in self.local_files_set:
+            self.logger.warning(f"Pedido de delta para arquivo '{filename}' que não possuo.")
+            return {"status": "not_found"}
+
+        file_path = to_local_path(self.shared_folder, filename)
+        requester_id = requester_id or "desconhecido"
+        try:
+            with self.upload_scheduler.slot(requester_id) as slot:
+                # Página limitada também pela banda: a espera fica no orçamento do pedido
+                reservation = slot.reserve(DELTA_PAGE_MAX_LITERAL_BYTES)
+                response, wire_bytes = delta_page_response(file_path, signature, cursor, accepted_codecs,
+                                                           self.delta_sessions, reservation.nbytes)
+                reservation.settle(wire_bytes)
+                self.metrics.bytes_served.inc(wire_bytes)
+                self.logger.info(
+                    f"Delta de '{filename}' para {requester_id}: {len(response['ops'])} operações, {wire_bytes} bytes "
+                    f"literais na rede{' (continua)' if response['next'] else ''}.")
+                return response
+        except DeltaTooLarge:
+            self.logger.info(f"Delta de '{filename}' para {requester_id} não compensa (arquivo mudou demais).")
+            return {"status": "too_different"}
+        except DeltaSourceChanged:
+            self.logger.info(f"'{filename}' mudou durante o delta para {requester_id}.")
+            return {"status": "changed"}
+        except DeltaSessionExpired:
+            return {"status": "expired"}
+        except UploadQueueTimeout:
+            return {"status": "busy"}
+        except FileNotFoundError:
+            self.logger.error(f"Arquivo '{filename}' não encontrado em {file_path} ao calcular delta.")
+            return {"status": "not_found"}
+        except Exception as e:
+            self.logger.error(f"Erro ao calcular delta de '{filename}': {e}")
+            return {"status": "error"}
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def get_metrics(self):
+        """Métricas deste peer (mesmo conteúdo do endpoint HTTP /metrics), em dicts e listas."""
+        return self.metrics.snapshot()
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def start_profiling(self, duration=PROFILER_DEFAULT_DURATION, interval=PROFILER_SAMPLE_INTERVAL):
+        """Administração: amostra as pilhas de todas as threads por 'duration' segundos, sem reiniciar o peer."""
+        started = self.profiler.start(duration, interval)
+        return dict(self.profiler.summary(), status="started" if started else "already_running")
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def stop_profiling(self):
+        """Administração: encerra a coleta (se ainda em andamento) e devolve as pilhas no formato folded."""
+        self.profiler.stop()
+        return dict(self.profiler.summary(), status="ok", folded=self.profiler.folded())
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
+    def get_upload_status(self):
+        """Retorna o estado do escalonador de uploads (slots, ativos e fila por peer)."""
+        return self.upload_scheduler.status()
+
+    @Pyro5.api.expose
+    @timed_rpc
+    @traced_rpc
     def get_file_size(self, filename):
         """Retorna o tamanho de um arquivo local."""
-        if filename not in self.local_files:
+        partial = self.partial_downloads.get(filename)
+        if filename not in self.local_files_set and partial is not None:
+            return partial.total_size
+        if filename not in self.local_files_set:
             self.logger.warning(f"Pedido de tamanho para arquivo '{filename}' que não possuo.")
             return -1
 
-        file_path = os.path.join(self.shared_folder, filename)
+        file_path = to_local_path(self.shared_folder, filename)
         try:
             return os.path.getsize(file_path)
         except FileNotFoundError:
             self.logger.error(f"Arquivo '{filename}' não encontrado no caminho {file_path} ao tentar obter tamanho.")
-            self.local_files = self._scan_local_files()  # Re-sincroniza
-            self.update_local_files_and_notify_tracker()
+            self.update_local_files_and_notify_tracker()  # Re-sincroniza
             return -1
         except Exception as e:
             self.logger.error(f"Erro ao obter tamanho do arquivo {filename}: {e}")
@@ -1039,13 +1711,11 @@ class Peer:
     def _get_other_peer_uris(self):
         """Busca URIs de outros peers no servidor de nomes, excluindo o próprio URI."""
         try:
-            if not self.ns_proxy:  # Cria proxy se não existir
-                self.ns_proxy = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-            peers_map = self.ns_proxy.list(prefix=PEER_NAME_PREFIX)
+            with self.tracer.client_span("nameserver_list"), self.proxy_pool.lease_ns() as ns_proxy_list:
+                peers_map = ns_proxy_list.list(prefix=PEER_NAME_PREFIX)
             return [uri for name, uri in peers_map.items() if uri != str(self.uri)]
         except Pyro5.errors.NamingError:
             self.logger.error(f"Servidor de nomes não encontrado ao listar outros peers.")
-            self.ns_proxy = None  # Reseta o proxy para tentar reconectar depois
             return []
         except Exception as e:
             self.logger.error(f"Erro ao listar outros peers no servidor de nomes: {e}")
@@ -1081,60 +1751,112 @@ class Peer:
 
     def cli_search_file(self):
         filename = input("Digite o nome do arquivo para buscar: ")
+        # Um trace por busca: consulta ao tracker, medição dos holders, escolha do usuário e download
+        with self.tracer.start_trace("search_and_download", filename=filename):
+            self._search_and_download(filename)
+
+    def _query_file_response(self, filename):
+        # Consulta o tracker (ou o cache/filtro local) por 'filename'; resposta "ok" ou None
         if not self.current_tracker_uri_str and not self.is_tracker:
             self.logger.info("Nenhum tracker ativo conhecido. Tentando descobrir...")
             self._discover_tracker()
             if not self.current_tracker_uri_str and not self.is_tracker:
                 self.logger.info("Ainda não há tracker ativo após nova tentativa de descoberta.")
-                return
+                return None
+
+        if self._network_filter_excludes(filename):
+            # Resposta negativa local: o nome não está no filtro do índice enviado pelo tracker
+            self.metrics.lookups_filtered.inc()
+            self.logger.info(f"Arquivo '{filename}' não encontrado na rede (segundo o filtro do índice do tracker).")
+            return None
 
         raw_response = None
         if self.is_tracker:
             self.logger.info(f"Consultando meu próprio índice (sou o tracker) por '{filename}'...")
-            raw_response = self.query_file(filename, self.current_tracker_epoch)
+            with self.tracer.span("query_file_local"):
+                raw_response = self.query_file(filename, self.current_tracker_epoch)
         elif self.current_tracker_uri_str:
-            try:
-                tracker_proxy_local = Pyro5.api.Proxy(self.current_tracker_uri_str)
-                tracker_proxy_local._pyroTimeout = 5
-                self.logger.info(
-                    f"Consultando tracker {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}) por '{filename}'...")
-                raw_response = tracker_proxy_local.query_file(filename, self.current_tracker_epoch)
-            except Pyro5.errors.CommunicationError:
-                self.logger.error("Falha de comunicação com o tracker ao buscar arquivo.")
-                self._handle_tracker_communication_error()
-                return
-            except Exception as e:
-                self.logger.error(f"Erro ao buscar arquivo no tracker: {e}")
-                return
+            raw_response = self._cached_tracker_lookup(("query_file", filename))
+            if raw_response is not None:
+                self.logger.info(f"Usando resposta em cache para '{filename}' (índice do tracker não mudou).")
+            else:
+                try:
+                    self.logger.info(
+                        f"Consultando tracker {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}) por '{filename}'...")
+                    with self.tracer.client_span("query_file", tracker=self.current_tracker_uri_str), \
+                            self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                        raw_response = tracker_proxy_local.query_file(filename, self.current_tracker_epoch)
+                    self._store_tracker_lookup(("query_file", filename), raw_response)
+                except Pyro5.errors.CommunicationError:
+                    self.logger.error("Falha de comunicação com o tracker ao buscar arquivo.")
+                    self._handle_tracker_communication_error()
+                    return None
+                except Exception as e:
+                    self.logger.error(f"Erro ao buscar arquivo no tracker: {e}")
+                    return None
         else:
             self.logger.info("Não foi possível determinar um tracker para consultar.")
-            return
+            return None
 
-        response = self._handle_tracker_response_for_cli(raw_response, "busca de arquivo")
+        return self._handle_tracker_response_for_cli(raw_response, "busca de arquivo")
+
+    def _search_and_download(self, filename):
+        response = self._query_file_response(filename)
         if not response: return
 
-        holders = response.get("holders", [])
-        if holders:
+        holders = [tuple(h) for h in response.get("holders", [])]
+        holder_load = response.get("holder_load", {})
+        # Peers ainda baixando o arquivo: [peer_id, uri, tamanho_total, bitfield]
+        partial_holders = [(pid, uri, total_size, chunk_to_bytes(bits))
+                           for pid, uri, total_size, bits in response.get("partial_holders", [])
+                           if uri != str(self.uri)]
+        if holders or partial_holders:
+            if holders:
+                # Mede o RTT dos holders sem medição recente e ordena pelo tempo estimado de conclusão
+                with self.tracer.span("probe_holders", holders=len(holders)):
+                    self._probe_holders(holders)
+                holders = self.peer_scores.rank(holders, holder_load=holder_load)
             self.logger.info(f"Arquivo '{filename}' encontrado nos seguintes peers:")
             for i, (holder_id, holder_uri_str) in enumerate(holders):
-                print(f"  {i + 1}. Peer ID: {holder_id} (URI: {holder_uri_str})")
-
-            choice = input("Deseja baixar? (s/n) ou escolha o número do peer: ")
-            if choice.lower() == 's' or choice.isdigit():
-                target_peer_index = 0
+                print(f"  {i + 1}. Peer ID: {holder_id} (URI: {holder_uri_str}) - carga: {holder_load.get(holder_uri_str, '?')}, "
+                      f"{self.peer_scores.describe(holder_uri_str)}")
+            for holder_id, holder_uri_str, total_size, bits in partial_holders:
+                num_chunks = num_chunks_for(total_size)
+                print(f"  -. Peer ID: {holder_id} (URI: {holder_uri_str}) - baixando, "
+                      f"{Bitfield(num_chunks, bits).count()}/{num_chunks} chunks disponíveis")
+
+            with self.tracer.span("await_user_choice"):  # Tempo humano, separado da latência do sistema
+                choice = input("Deseja baixar? (s/n, f = fila em segundo plano) ou escolha o número do peer: ")
+            if choice.lower() == 'f':
+                job = self.download_manager.enqueue(filename)
+                print(f"Download de '{filename}' na fila (job #{job.job_id}). Acompanhe com 'jobs'.")
+            elif (choice.lower() == 's' or choice.isdigit()) and not holders:
+                # Só peers ainda baixando o arquivo: o download multi-fonte junta os chunks que eles já têm
+                download_folder = os.path.join(os.getcwd(), "p2p_download_folders", self.peer_id)
+                os.makedirs(download_folder, exist_ok=True)
+                save_path = to_local_path(download_folder, filename) if is_safe_relative_name(filename) else None
+                if not save_path or os.path.exists(save_path):
+                    self.logger.error(f"'{filename}' só está em peers parciais e já existe uma cópia local; "
+                                      f"tente de novo quando houver um holder completo.")
+                    return
+                with self.tracer.span("download", mode="multi_source", sources=len(partial_holders)):
+                    self._download_file_multi_source(filename, [], partial_holders, download_folder)
+            elif choice.lower() == 's' or choice.isdigit():
                 if choice.isdigit() and 0 < int(choice) <= len(holders):
-                    target_peer_index = int(choice) - 1
-                else:  # Se 's' ou número inválido, pega o primeiro da lista
-                    self.logger.info("Opção inválida ou 's', baixando do primeiro peer da lista.")
+                    chosen_peer_id, chosen_peer_uri_str = holders[int(choice) - 1]
+                else:  # Se 's' ou número inválido, escolhe pelo tempo estimado de conclusão
+                    self.logger.info("Opção inválida ou 's', baixando do holder com menor tempo estimado.")
+                    own_entry = [h for h in holders if h[1] == str(self.uri)]
+                    chosen_peer_id, chosen_peer_uri_str = own_entry[0] if own_entry else \
+                        self.peer_scores.pick(holders, holder_load=holder_load)
 
-                chosen_peer_id, chosen_peer_uri_str = holders[target_peer_index]
                 if str(self.uri) == chosen_peer_uri_str:
                     self.logger.info("Este peer já possui o arquivo localmente.")
                     # Verifica se o arquivo está na pasta de download ou na de compartilhamento
                     download_folder_check = os.path.join(os.getcwd(), "p2p_download_folders", self.peer_id)
-                    if os.path.exists(os.path.join(download_folder_check, filename)):
+                    if os.path.exists(to_local_path(download_folder_check, filename)):
                         self.logger.info(f"Arquivo '{filename}' já existe em {download_folder_check}")
-                    elif os.path.exists(os.path.join(self.shared_folder, filename)):
+                    elif os.path.exists(to_local_path(self.shared_folder, filename)):
                         self.logger.info(f"Arquivo '{filename}' já existe em {self.shared_folder}")
                     else:
                         self.logger.warning(
@@ -1144,71 +1866,582 @@ class Peer:
 
                 download_folder = os.path.join(os.getcwd(), "p2p_download_folders", self.peer_id)
                 os.makedirs(download_folder, exist_ok=True)
-                self._download_file_from_peer(filename, chosen_peer_uri_str, download_folder)
+                save_path = to_local_path(download_folder, filename) if is_safe_relative_name(filename) else None
+                sources = [h for h in holders if h[1] != str(self.uri)]
+                if choice.lower() == 's' and save_path and not os.path.exists(save_path) \
+                        and (sources or partial_holders):
+                    # Baixa chunks em paralelo de todas as fontes, dos mais raros para os mais comuns,
+                    # anunciando os já recebidos para que outros peers possam baixá-los daqui
+                    with self.tracer.span("download", mode="multi_source", sources=len(sources) + len(partial_holders)):
+                        self._download_file_multi_source(filename, sources, partial_holders, download_folder)
+                else:
+                    with self.tracer.span("download", mode="single_source", source=chosen_peer_uri_str):
+                        self._download_file_from_peer(filename, chosen_peer_uri_str, download_folder)
         else:
             self.logger.info(f"Arquivo '{filename}' não encontrado na rede (segundo o tracker).")
 
-    def _download_file_from_peer(self, filename, target_peer_uri_str, download_folder):
-        """Baixa um arquivo de outro peer em chunks."""
-        save_path = os.path.join(download_folder, filename)
-        if os.path.exists(save_path):
-            self.logger.info(f"Arquivo '{filename}' já existe em {save_path}. Download cancelado.")
-            # Opcional: verificar hash ou tamanho para decidir se baixa novamente
+    def _probe_holders(self, holders):
+        # Pinga em paralelo os holders sem RTT recente, alimentando a pontuação usada na escolha
+        to_probe = [uri for _, uri in holders
+                    if uri != str(self.uri) and self.peer_scores.needs_probe(uri)][:PEER_SCORING_MAX_PROBES]
+        if not to_probe:
+            return
+
+        def probe(holder_uri_str):
+            try:
+                # O pool entrega o proxy já conectado: a conexão em si não entra na medição
+                with self.tracer.client_span("probe", holder=holder_uri_str), \
+                        self.proxy_pool.lease(holder_uri_str, timeout=PEER_SCORING_PROBE_TIMEOUT) as probe_proxy:
+                    start = time.perf_counter()
+                    probe_proxy.ping()
+                    self.peer_scores.record_rtt(holder_uri_str, time.perf_counter() - start)
+            except Pyro5.errors.CommunicationError:
+                self.peer_scores.record_error(holder_uri_str)
+            except Exception as e:
+                self.logger.debug(f"Erro ao medir RTT de {holder_uri_str}: {e}")
+
+        # Pool próprio: quem chama já roda no pool do runtime, e esperar por tarefas do mesmo pool pode
+        # travá-lo quando todas as threads estiverem esperando
+        futures = [self.probe_pool.submit(contextvars.copy_context().run, probe, uri) for uri in to_probe]
+        for probe_future in futures:
+            probe_future.result()
+
+    def _data_uri(self, holder_uri_str, partial=False):
+        # Transferências vão para o plano de dados do holder, fora do daemon dos heartbeats/eleições.
+        # Descoberto uma vez por holder; versões sem plano separado continuam no URI principal
+        data_uri = self._data_uris.get((holder_uri_str, partial))
+        if data_uri is not None:
+            return data_uri
+        try:
+            with self.proxy_pool.lease(holder_uri_str, timeout=5) as holder_proxy:
+                data_uri = holder_proxy.get_data_uri(self.peer_id, partial) or holder_uri_str
+        except AttributeError:
+            data_uri = holder_uri_str
+        self._data_uris[(holder_uri_str, partial)] = data_uri
+        return data_uri
+
+    def _forget_data_uri(self, holder_uri_str):
+        # Falha de comunicação: o holder pode ter reiniciado com outro URI de dados
+        self._data_uris.pop((holder_uri_str, False), None)
+        self._data_uris.pop((holder_uri_str, True), None)
+
+    def _fetch_chunk(self, holder_proxy, holder_uri_str, filename, chunk_offset, chunk_size):
+        # Holders com limite de banda podem responder só parte do chunk (UploadScheduler.reserve):
+        # o restante é pedido em seguida, cada pedido dentro do timeout do cliente
+        with self.tracer.client_span("fetch_chunk", holder=holder_uri_str, offset=chunk_offset) as span:
+            pieces = []
+            received = 0
+            while received < chunk_size:
+                piece = self._request_chunk(holder_proxy, holder_uri_str, filename, chunk_offset + received,
+                                            chunk_size - received)
+                if not piece:
+                    break
+                pieces.append(piece)
+                received += len(piece)
+            data = pieces[0] if len(pieces) == 1 else (b"".join(pieces) or None)
+            span.set(bytes=received, pieces=len(pieces))
+        if received:
+            self.metrics.bytes_downloaded.inc(received)
+        return data
+
+    def _request_chunk(self, holder_proxy, holder_uri_str, filename, chunk_offset, chunk_size):
+        # Pede um chunk negociando compressão; holders sem suporte recebem o pedido simples
+        if holder_uri_str not in self._holders_without_compression:
+            try:
+                payload = holder_proxy.request_file_chunk_compressed(filename, chunk_offset, chunk_size,
+                                                                     CHUNK_COMPRESSION_CODECS, self.peer_id)
+                return decode_chunk(payload)
+            except AttributeError:
+                self.logger.info(f"Holder {holder_uri_str} não suporta compressão de chunks. Usando pedido simples.")
+                self._holders_without_compression.add(holder_uri_str)
+        return chunk_to_bytes(holder_proxy.request_file_chunk(filename, chunk_offset, chunk_size, self.peer_id))
+
+    def _update_file_via_delta(self, filename, holder_uri_str, local_path):
+        # Atualiza uma cópia local já existente trazendo só os blocos que mudaram.
+        # Retorna False quando o delta não é possível/vantajoso e o download completo deve ser feito.
+        # O delta chega em páginas (cursor 'next'); cada uma é aplicada ao .part assim que chega.
+        # A assinatura vai só na primeira (e de novo se o holder descartou a sessão)
+        temp_path = local_path + ".part"
+        signature = None
+        first = None
+        copied = literal = 0
+        try:
+            signature = compute_signature(local_path)
+            with self.proxy_pool.lease(self._data_uri(holder_uri_str), timeout=DELTA_REQUEST_TIMEOUT) as holder_proxy, \
+                    open(local_path, "rb") as old, open(temp_path, "wb") as out:
+                request_start = time.perf_counter()
+                cursor = None
+                while True:
+                    if cursor is None:
+                        response = holder_proxy.request_file_delta(filename, signature, CHUNK_COMPRESSION_CODECS,
+                                                                   self.peer_id)
+                    else:
+                        # Páginas seguintes: a assinatura já está na sessão do holder (cursor['session'])
+                        response = holder_proxy.request_file_delta(filename, None, CHUNK_COMPRESSION_CODECS,
+                                                                   self.peer_id, cursor)
+                        if isinstance(response, dict) and response.get("status") == "expired":
+                            response = holder_proxy.request_file_delta(filename, signature, CHUNK_COMPRESSION_CODECS,
+                                                                       self.peer_id, cursor)
+                    status = response.get("status") if isinstance(response, dict) else None
+                    if status != "ok":
+                        self.logger.info(f"Delta de '{filename}' indisponível em {holder_uri_str} (status: {status}).")
+                        break
+                    ops = [op if op[0] == "copy" else ["data", decode_chunk(op[1])] for op in response["ops"]]
+                    cursor = response.get("next")
+                    if first is None:
+                        first = response
+                        if cursor is None and response["size"] == signature["size"] and \
+                                ops == [["copy", 0, len(signature["blocks"])]]:
+                            status = "unchanged"
+                            break
+                    write_delta_ops(old, out, ops, first["block_size"])
+                    page_copied, page_literal = delta_stats(ops, first["block_size"])
+                    copied += page_copied
+                    literal += page_literal
+                    if cursor is None:
+                        break
+                elapsed = time.perf_counter() - request_start
+        except AttributeError:
+            self.logger.info(f"Holder {holder_uri_str} não suporta sincronização por delta.")
+            status = None
+        except Pyro5.errors.CommunicationError:
+            self.logger.warning(f"Falha de comunicação com {holder_uri_str} ao pedir delta de '{filename}'.")
+            self.peer_scores.record_error(holder_uri_str)
+            self._forget_data_uri(holder_uri_str)
+            status = None
+        except (OSError, ChunkDecodeError) as e:
+            self.logger.error(f"Erro ao aplicar delta em '{local_path}': {e}")
+            status = None
+
+        try:
+            if status == "ok" and file_digest(temp_path) != first["digest"]:
+                self.logger.warning(f"Delta de '{filename}' gerou conteúdo diferente do holder. Baixando completo.")
+                status = None
+            if status == "ok":
+                # Substitui atomicamente: a cópia antiga continua válida até o fim
+                os.replace(temp_path, local_path)
+        except OSError as e:
+            self.logger.error(f"Erro ao aplicar delta em '{local_path}': {e}")
+            status = None
+        finally:
+            if os.path.exists(temp_path): os.remove(temp_path)
+        if status == "unchanged":
+            print(f"Arquivo '{filename}' já está atualizado.")
+            return True
+        if status != "ok":
+            return False
+
+        self.peer_scores.record_transfer(holder_uri_str, literal, elapsed)
+        self.peer_scores.record_success(holder_uri_str)
+        print(f"\nArquivo '{filename}' atualizado via delta: {literal} bytes novos recebidos, "
+              f"~{min(copied, first['size'])} bytes reaproveitados da cópia local.")
+        self.logger.info(f"Arquivo '{filename}' atualizado via delta a partir de {holder_uri_str}.")
+        self._publish_downloaded_file(filename, local_path)
+        return True
+
+    def _publish_downloaded_file(self, filename, download_path):
+        # Guarda o download no store e o recompartilha via hardlink na pasta compartilhada,
+        # anunciando-o ao tracker na hora (o conteúdo popular se espalha entre os peers)
+        try:
+            digest = self.content_store.ingest(download_path)
+        except OSError as e:
+            self.logger.error(f"Erro ao guardar '{filename}' no store: {e}")
+            return
+        if not SHARE_DOWNLOADED_FILES:
+            self.runtime.submit(self._collect_store_garbage)  # A versão anterior pode ter perdido sua última visão
             return
 
+        shared_path = to_local_path(self.shared_folder, filename)
+        if os.path.exists(shared_path) and not self.content_store.is_store_linked(shared_path):
+            # Arquivo próprio do usuário com o mesmo nome: não é sobrescrito
+            self.logger.info(f"'{filename}' já existe na pasta compartilhada (arquivo próprio). Não recompartilhado.")
+            return
         try:
-            target_peer_proxy = Pyro5.api.Proxy(target_peer_uri_str)
-            target_peer_proxy._pyroTimeout = 10
+            self.content_store.link_into(digest, shared_path)
+        except OSError as e:
+            self.logger.error(f"Erro ao recompartilhar '{filename}': {e}")
+            return
+        self.logger.info(f"'{filename}' (conteúdo {digest[:12]}) recompartilhado e anunciado ao tracker.")
+        if filename not in self.local_files_set:
+            self.update_local_files_and_notify_tracker(sorted(self.local_files_set | {filename}))
+        # Delta ou download novo substituíram as visões do conteúdo antigo: o objeto dele pode ter ficado órfão
+        self.runtime.submit(self._collect_store_garbage)
+
+    def _collect_store_garbage(self):
+        removed = self.content_store.collect_garbage()
+        if removed:
+            self.logger.info(f"Store: {removed} objeto(s) sem visões removido(s).")
+
+    def _download_file_from_peer(self, filename, target_peer_uri_str, download_folder, job=None):
+        """Baixa um arquivo de outro peer em chunks. True se o arquivo foi baixado.
+
+        Com 'job' (DownloadManager), o progresso vai para o job em vez do terminal.
+        """
+        if not is_safe_relative_name(filename):
+            self.logger.error(f"Nome de arquivo inválido para download: '{filename}'.")
+            return False
+        save_path = to_local_path(download_folder, filename)
+        # Arquivos de subdiretórios compartilhados mantêm a mesma estrutura na pasta de download
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        if os.path.exists(save_path):
+            # Já existe uma cópia (possivelmente antiga): sincroniza só as diferenças
+            self.logger.info(f"Arquivo '{filename}' já existe em {save_path}. Tentando atualização por delta.")
+            if self._update_file_via_delta(filename, target_peer_uri_str, save_path):
+                return True
+            self.logger.info(f"Baixando '{filename}' completo para substituir a cópia existente.")
+        # O download completo é gravado em um arquivo temporário e só substitui o destino ao final
+        part_path = save_path + ".part"
+
+        target_peer_proxy = None
+        proxy_broken = False
+        try:
+            target_peer_proxy = self.proxy_pool.acquire(self._data_uri(target_peer_uri_str),
+                                                        timeout=CHUNK_REQUEST_TIMEOUT)
 
-            total_size = target_peer_proxy.get_file_size(filename)
+            with self.tracer.client_span("get_file_size", holder=target_peer_uri_str):
+                total_size = target_peer_proxy.get_file_size(filename)
             if total_size == -1:
                 self.logger.error(
                     f"Arquivo '{filename}' não encontrado ou erro ao obter tamanho no peer de origem {target_peer_uri_str}.")
-                return
+                return False
             if total_size == 0:
                 self.logger.info(f"Arquivo '{filename}' está vazio. Criando arquivo vazio localmente.")
-                open(save_path, 'wb').close()
-                print("\nDownload concluído (arquivo vazio)!")
+                open(part_path, 'wb').close()
+                os.replace(part_path, save_path)
+                if job is None:
+                    print("\nDownload concluído (arquivo vazio)!")
                 # Após o download, atualiza os arquivos locais e notifica o tracker
-                return
+                self._publish_downloaded_file(filename, save_path)
+                return True
 
             self.logger.info(f"Iniciando download de '{filename}' ({total_size} bytes) de {target_peer_uri_str}...")
 
             bytes_downloaded = 0
-            with open(save_path, 'wb') as f:
+            with ChunkWriter(part_path, total_size) as writer:
                 while bytes_downloaded < total_size:
-                    chunk_data = target_peer_proxy.request_file_chunk(filename, bytes_downloaded, DOWNLOAD_CHUNK_SIZE)
+                    chunk_start = time.perf_counter()
+                    chunk_data = self._fetch_chunk(target_peer_proxy, target_peer_uri_str, filename, bytes_downloaded,
+                                                   min(DOWNLOAD_CHUNK_SIZE, total_size - bytes_downloaded))
                     if not chunk_data:
                         if bytes_downloaded < total_size:
                             self.logger.error(
                                 f"Erro ao baixar chunk de '{filename}' (chunk vazio/None recebido antes do fim). Download interrompido.")
-                            if os.path.exists(save_path): os.remove(save_path)
-                            return
+                            self.peer_scores.record_error(target_peer_uri_str)
+                            if os.path.exists(part_path): os.remove(part_path)
+                            return False
                         else:  # Download completo, mas último chunk foi None (improvável se total_size > 0)
                             break
 
-                    f.write(chunk_data)
+                    self.peer_scores.record_transfer(target_peer_uri_str, len(chunk_data),
+                                                     time.perf_counter() - chunk_start)
+                    with self.tracer.span("write_chunk", bytes=len(chunk_data)):
+                        writer.write_at(bytes_downloaded, chunk_data)
                     bytes_downloaded += len(chunk_data)
-                    progress = (bytes_downloaded / total_size) * 100 if total_size > 0 else 100
-                    print(f"\rBaixando '{filename}': {bytes_downloaded}/{total_size} bytes ({progress:.2f}%)", end="")
-            print("\nDownload concluído!")
+                    if job is not None:
+                        job.update_progress(bytes_downloaded, total_size)
+                        if job.cancel_requested:
+                            raise DownloadCancelled()
+                    else:
+                        progress = (bytes_downloaded / total_size) * 100 if total_size > 0 else 100
+                        print(f"\rBaixando '{filename}': {bytes_downloaded}/{total_size} bytes ({progress:.2f}%)", end="")
+            os.replace(part_path, save_path)
+            if job is None:
+                print("\nDownload concluído!")
+            self.peer_scores.record_success(target_peer_uri_str)
             self.logger.info(f"Arquivo '{filename}' baixado para {save_path}.")
-            # Se os arquivos baixados devem ser compartilhados, eles precisam ser movidos para self.shared_folder
-            # e então self.update_local_files_and_notify_tracker() chamado.
-            # Exemplo:
-            # shutil.move(save_path, os.path.join(self.shared_folder, filename))
-            # self.update_local_files_and_notify_tracker()
+            self._publish_downloaded_file(filename, save_path)
+            return True
 
         except Pyro5.errors.CommunicationError:
             self.logger.error(f"Falha de comunicação com {target_peer_uri_str} durante o download.")
-            if os.path.exists(save_path): os.remove(save_path)
+            proxy_broken = True
+            self.peer_scores.record_error(target_peer_uri_str)
+            self._forget_data_uri(target_peer_uri_str)
+            if job is not None and target_peer_uri_str not in job.failed_holders:
+                job.failed_holders.append(target_peer_uri_str)
+            if os.path.exists(part_path): os.remove(part_path)
+        except ChunkDecodeError as e:
+            self.logger.error(f"Chunk inválido recebido de {target_peer_uri_str} para '{filename}': {e}")
+            self.peer_scores.record_error(target_peer_uri_str)
+            if job is not None and target_peer_uri_str not in job.failed_holders:
+                job.failed_holders.append(target_peer_uri_str)
+            if os.path.exists(part_path): os.remove(part_path)
+        except DownloadCancelled:
+            self.logger.info(f"Download de '{filename}' cancelado.")
+            if os.path.exists(part_path): os.remove(part_path)
         except Exception as e:
             self.logger.error(f"Erro ao baixar arquivo '{filename}' de {target_peer_uri_str}: {e}")
-            if os.path.exists(save_path): os.remove(save_path)
+            if os.path.exists(part_path): os.remove(part_path)
+        finally:
+            if target_peer_proxy is not None:
+                self.proxy_pool.release(target_peer_proxy, broken=proxy_broken)
+        return False
+
+    def _download_file_multi_source(self, filename, full_holders, partial_holders, download_folder, job=None):
+        """Baixa um arquivo de vários holders ao mesmo tempo, escalonando os chunks do mais raro ao mais comum.
+
+        full_holders: [(peer_id, uri)] já ordenados pela pontuação; partial_holders: [(peer_id, uri,
+        tamanho_total, bitfield)]. Os chunks recebidos são anunciados ao tracker e servidos a outros
+        peers antes do fim do download, então o holder original não precisa servir todas as cópias.
+        Com 'job', o .part de uma tentativa anterior é retomado e, se o download ficar incompleto,
+        mantido para a próxima. Retorna True se o arquivo foi baixado.
+        """
+        save_path = to_local_path(download_folder, filename)
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        part_path = save_path + ".part"
+
+        # O tamanho vem de um holder completo; o anunciado pelos parciais só vale se nenhum completo responder
+        total_size = -1
+        for _, holder_uri_str in full_holders:
+            if total_size >= 0:
+                break
+            try:
+                with self.tracer.client_span("get_file_size", holder=holder_uri_str), \
+                        self.proxy_pool.lease(self._data_uri(holder_uri_str),
+                                              timeout=CHUNK_REQUEST_TIMEOUT) as size_proxy:
+                    total_size = size_proxy.get_file_size(filename)
+            except Pyro5.errors.CommunicationError:
+                self.peer_scores.record_error(holder_uri_str)
+                self._forget_data_uri(holder_uri_str)
+        if total_size < 0 and partial_holders:
+            # Sem holder completo: vale o tamanho anunciado pela maioria dos parciais
+            sizes = [size for _, _, size, _ in partial_holders]
+            total_size = max(set(sizes), key=sizes.count)
+        rejected = [uri for _, uri, size, _ in partial_holders if size != total_size]
+        if rejected:
+            self.logger.warning(f"Ignorando holders parciais de '{filename}' com tamanho diferente de "
+                                f"{total_size} bytes: {rejected}")
+            partial_holders = [entry for entry in partial_holders if entry[2] == total_size]
+        if total_size <= 0:
+            # Tamanho desconhecido ou arquivo vazio: o download simples já trata esses casos
+            if full_holders:
+                return self._download_file_from_peer(filename, full_holders[0][1], download_folder, job=job)
+            self.logger.error(f"Não foi possível obter o tamanho de '{filename}' de nenhum holder.")
+            return False
+
+        num_chunks = num_chunks_for(total_size)
+        # O melhor holder completo entra primeiro; os parciais aliviam os demais
+        selected = (full_holders[:1] + [(pid, uri) for pid, uri, _, _ in partial_holders] + full_holders[1:])
+        selected = selected[:MULTI_SOURCE_MAX_HOLDERS]
+        partial_bits = {uri: bits for _, uri, _, bits in partial_holders}
+        sources = {}
+        for _, holder_uri_str in selected:
+            if holder_uri_str in partial_bits:
+                sources[holder_uri_str] = Bitfield(num_chunks, partial_bits[holder_uri_str])
+            elif holder_uri_str not in sources and holder_uri_str in {uri for _, uri in full_holders}:
+                sources[holder_uri_str] = Bitfield.full(num_chunks)
+
+        resume_bits = None
+        if job is not None and job.resume_bits and job.total_size == total_size:
+            resume_bits = bytes.fromhex(job.resume_bits)
+        try:
+            partial = PartialFile(part_path, total_size, resume_bits=resume_bits)
+        except OSError as e:
+            self.logger.error(f"Erro ao criar '{part_path}': {e}")
+            return False
+        self.partial_downloads[filename] = partial
+        num_sources = len(sources)
+        scheduler = RarestFirstScheduler(num_chunks, partial.bitfield, sources)
+        resumed_chunks = num_chunks - scheduler.remaining()
+        self.logger.info(
+            f"Iniciando download de '{filename}' ({total_size} bytes, {num_chunks} chunks) de {len(sources)} fontes: "
+            f"{list(sources)}" + (f" (retomado: {resumed_chunks} chunks já gravados)" if resumed_chunks else ""))
+
+        async def download_from(holder_uri_str):
+            # Corrotina por fonte: as chamadas Pyro e a escrita em disco vão para o pool do runtime
+            holder_proxy = None
+            proxy_broken = False
+
+            def fetch(chunk_offset, chunk_size):
+                # O proxy é usado por uma thread do pool de cada vez, mas não sempre pela mesma
+                holder_proxy._pyroClaimOwnership()
+                return self._fetch_chunk(holder_proxy, holder_uri_str, filename, chunk_offset, chunk_size)
+
+            chunk_index = None
+            try:
+                holder_proxy = await self.runtime.to_thread(
+                    lambda: self.proxy_pool.acquire(self._data_uri(holder_uri_str, holder_uri_str in partial_bits),
+                                                    CHUNK_REQUEST_TIMEOUT))
+                while True:
+                    if job is not None and job.cancel_requested:
+                        return
+                    chunk_index = scheduler.next_chunk(holder_uri_str)
+                    if chunk_index is None:
+                        # Nada livre agora; espera caso um chunk em andamento em outra fonte falhe
+                        if not scheduler.has_pending_work(holder_uri_str):
+                            return
+                        await asyncio.sleep(0.05)
+                        continue
+                    chunk_offset = chunk_index * DOWNLOAD_CHUNK_SIZE
+                    chunk_size = min(DOWNLOAD_CHUNK_SIZE, total_size - chunk_offset)
+                    chunk_start = time.perf_counter()
+                    chunk_data = await self.runtime.to_thread(fetch, chunk_offset, chunk_size)
+                    if not chunk_data or len(chunk_data) != chunk_size:
+                        raise ChunkDecodeError(f"chunk {chunk_index} vazio ou incompleto")
+                    await self.runtime.to_thread(self._write_partial_chunk, partial, chunk_index, chunk_data)
+                    scheduler.complete(chunk_index)
+                    chunk_index = None
+                    self.peer_scores.record_transfer(holder_uri_str, chunk_size, time.perf_counter() - chunk_start)
+                    await self.runtime.to_thread(self._announce_chunks, filename, partial)
+            except (Pyro5.errors.CommunicationError, ChunkDecodeError, OSError) as e:
+                proxy_broken = isinstance(e, Pyro5.errors.CommunicationError)
+                self.logger.warning(f"Fonte {holder_uri_str} falhou no download de '{filename}': {e}")
+                self.peer_scores.record_error(holder_uri_str)
+                if proxy_broken:
+                    self._forget_data_uri(holder_uri_str)
+                if job is not None and holder_uri_str not in job.failed_holders:
+                    job.failed_holders.append(holder_uri_str)
+                if chunk_index is not None:
+                    scheduler.fail(chunk_index)
+                scheduler.drop_source(holder_uri_str)
+            finally:
+                if holder_proxy is not None:
+                    self.proxy_pool.release(holder_proxy, broken=proxy_broken)
+
+        async def download_from_all():
+            await asyncio.gather(*(download_from(uri) for uri in sources))
+
+        def report_progress():
+            done = num_chunks - scheduler.remaining()
+            if job is not None:
+                # Só os chunks já sincronizados com o disco: um crash não pode deixar bits de dados perdidos
+                job.update_progress(min(total_size, done * DOWNLOAD_CHUNK_SIZE), total_size,
+                                    partial.durable_bitfield_bytes())
+                self.download_manager.save_progress()
+            else:
+                print(f"\rBaixando '{filename}': {done}/{num_chunks} chunks de {len(scheduler.sources)} fontes", end="")
+
+        download_future = self.runtime.run_coroutine(download_from_all())
+        while not download_future.done():
+            report_progress()
+            time.sleep(0.2)
+        if download_future.exception() is not None:
+            self.logger.error(f"Erro no download de '{filename}': {download_future.exception()}")
+        partial.close()  # fsync final: a partir daqui todos os bits do bitfield estão em disco
+        report_progress()
+        if scheduler.remaining():
+            if job is None:
+                print()
+            self.partial_downloads.pop(filename, None)
+            self._announce_chunks(filename, partial, withdraw=True)
+            if job is not None and not job.cancel_requested:
+                # O .part e o bitfield (no job) ficam para a próxima tentativa
+                job.error = f"{scheduler.remaining()} chunks sem fonte disponível"
+                self.logger.warning(f"Download de '{filename}' incompleto: {job.error}; .part mantido para retomar.")
+                return False
+            self.logger.error(
+                f"Download de '{filename}' incompleto: {scheduler.remaining()} chunks sem fonte disponível.")
+            if os.path.exists(part_path): os.remove(part_path)
+            return False
+
+        os.replace(part_path, save_path)
+        # Continua servindo os chunks (agora do arquivo final) até o arquivo ser publicado por completo
+        partial.path = save_path
+        if job is None:
+            print(f"\rBaixando '{filename}': {num_chunks}/{num_chunks} chunks\nDownload concluído!")
+        for holder_uri_str in scheduler.sources:
+            self.peer_scores.record_success(holder_uri_str)
+        self.logger.info(f"Arquivo '{filename}' baixado para {save_path} a partir de {num_sources} fontes.")
+        self._publish_downloaded_file(filename, save_path)
+        self.partial_downloads.pop(filename, None)
+        self._announce_chunks(filename, partial, withdraw=True)
+        return True
+
+    def open_remote(self, filename):
+        """Abre 'filename' da rede para leitura aleatória (RemoteFile), sem baixá-lo por inteiro."""
+        response = self._query_file_response(filename)
+        holders = [tuple(h) for h in response.get("holders", []) if h[1] != str(self.uri)] if response else []
+        if not holders:
+            raise FileNotFoundError(f"'{filename}' não está disponível em outros peers.")
+        self._probe_holders(holders)
+        holders = self.peer_scores.rank(holders, holder_load=response.get("holder_load", {}))
+        for _, holder_uri_str in holders:
+            try:
+                with self.proxy_pool.lease(self._data_uri(holder_uri_str), timeout=CHUNK_REQUEST_TIMEOUT) as size_proxy:
+                    size = size_proxy.get_file_size(filename)
+            except Pyro5.errors.CommunicationError:
+                self.peer_scores.record_error(holder_uri_str)
+                self._forget_data_uri(holder_uri_str)
+                continue
+            if size >= 0:
+                return RemoteFile(self, filename, holders, size)
+        raise FileNotFoundError(f"Nenhum holder informou o tamanho de '{filename}'.")
+
+    def _run_download_job(self, job):
+        # Executado pelo DownloadManager em uma thread própria: consulta o tracker e baixa sem interação.
+        # Holders que já falharam neste job ficam de fora enquanto houver alternativas.
+        filename = job.filename
+        with self.tracer.start_trace("download_job", filename=filename, job=job.job_id, attempt=job.attempts):
+            response = self._query_file_response(filename)
+            if not response:
+                job.error = "arquivo fora do índice ou tracker indisponível"
+                return False
+            holders = [tuple(h) for h in response.get("holders", [])]
+            if any(uri == str(self.uri) for _, uri in holders):
+                self.logger.info(f"Job #{job.job_id}: '{filename}' já está neste peer.")
+                return True
+            holder_load = response.get("holder_load", {})
+            partial_holders = [(pid, uri, total_size, chunk_to_bytes(bits))
+                               for pid, uri, total_size, bits in response.get("partial_holders", [])
+                               if uri != str(self.uri)]
+            fresh_holders = [h for h in holders if h[1] not in job.failed_holders]
+            fresh_partials = [h for h in partial_holders if h[1] not in job.failed_holders]
+            if fresh_holders or fresh_partials:
+                holders, partial_holders = fresh_holders, fresh_partials
+            else:
+                job.failed_holders = []  # Todos já falharam uma vez: tenta todos de novo
+            if not holders and not partial_holders:
+                job.error = "nenhum holder na rede"
+                return False
+
+            if holders:
+                self._probe_holders(holders)
+                holders = self.peer_scores.rank(holders, holder_load=holder_load)
+            download_folder = os.path.join(os.getcwd(), "p2p_download_folders", self.peer_id)
+            save_path = to_local_path(download_folder, filename)
+            if os.path.exists(save_path):
+                if not holders:
+                    job.error = "cópia local existe e só há holders parciais"
+                    return False
+                return self._download_file_from_peer(filename, holders[0][1], download_folder, job=job)
+            with self.tracer.span("download", mode="multi_source", sources=len(holders) + len(partial_holders)):
+                return self._download_file_multi_source(filename, holders, partial_holders, download_folder, job=job)
+
+    def _write_partial_chunk(self, partial, chunk_index, chunk_data):
+        with self.tracer.span("write_chunk", chunk=chunk_index, bytes=len(chunk_data)):
+            partial.write_chunk(chunk_index, chunk_data)
+
+    def _announce_chunks(self, filename, partial, withdraw=False):
+        # Informa ao tracker os chunks já baixados (no máximo a cada CHUNK_ANNOUNCE_INTERVAL);
+        # withdraw=True remove este peer dos holders parciais (download concluído ou abortado)
+        now = time.monotonic()
+        if not withdraw and now - self._last_chunk_announce.get(filename, 0) < CHUNK_ANNOUNCE_INTERVAL:
+            return
+        self._last_chunk_announce[filename] = now
+        if withdraw:
+            self._last_chunk_announce.pop(filename, None)
+        bits = None if withdraw else partial.bitfield_bytes()
+        try:
+            if self.is_tracker:
+                self.register_chunks(self.peer_id, str(self.uri), filename, partial.total_size, bits,
+                                     self.current_tracker_epoch)
+            elif self.current_tracker_uri_str:
+                with self.tracer.client_span("register_chunks", withdraw=withdraw), \
+                        self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                    tracker_proxy_local.register_chunks(self.peer_id, str(self.uri), filename, partial.total_size,
+                                                        bits, self.current_tracker_epoch)
+        except AttributeError:
+            self.logger.debug("Tracker não suporta anúncio de chunks parciais.")
+        except Pyro5.errors.CommunicationError:
+            self.logger.warning(f"Falha ao anunciar chunks de '{filename}' ao tracker.")
+        except Exception as e:
+            self.logger.error(f"Erro ao anunciar chunks de '{filename}' ao tracker: {e}")
 
     def cli_list_my_files(self):
         # Garante que a lista local_files está atualizada antes de listar
-        self.local_files = self._scan_local_files()
+        # (com o observador ativo ela já é mantida em dia, sem varrer a pasta)
+        if not (self.shared_folder_watcher and self.shared_folder_watcher.is_running()):
+            self._set_local_files(self._scan_local_files())
         self.logger.info(f"Meus arquivos compartilhados ({len(self.local_files)}):")
         if not self.local_files:
             print("  (Nenhum arquivo local compartilhado)")
@@ -1228,19 +2461,23 @@ class Peer:
             self.logger.info("Consultando meu próprio índice (sou o tracker) por todos os arquivos...")
             raw_response = self.get_all_indexed_files(self.current_tracker_epoch)
         elif self.current_tracker_uri_str:
-            try:
-                tracker_proxy_local = Pyro5.api.Proxy(self.current_tracker_uri_str)
-                tracker_proxy_local._pyroTimeout = 5
-                self.logger.info(
-                    f"Consultando tracker {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}) por todos os arquivos da rede...")
-                raw_response = tracker_proxy_local.get_all_indexed_files(self.current_tracker_epoch)
-            except Pyro5.errors.CommunicationError:
-                self.logger.error("Falha de comunicação com o tracker ao listar arquivos da rede.")
-                self._handle_tracker_communication_error()
-                return
-            except Exception as e:
-                self.logger.error(f"Erro ao listar arquivos da rede no tracker: {e}")
-                return
+            raw_response = self._cached_tracker_lookup(("get_all_indexed_files",))
+            if raw_response is not None:
+                self.logger.info("Usando listagem em cache (índice do tracker não mudou).")
+            else:
+                try:
+                    self.logger.info(
+                        f"Consultando tracker {self.current_tracker_uri_str} (Época {self.current_tracker_epoch}) por todos os arquivos da rede...")
+                    with self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                        raw_response = tracker_proxy_local.get_all_indexed_files(self.current_tracker_epoch)
+                    self._store_tracker_lookup(("get_all_indexed_files",), raw_response)
+                except Pyro5.errors.CommunicationError:
+                    self.logger.error("Falha de comunicação com o tracker ao listar arquivos da rede.")
+                    self._handle_tracker_communication_error()
+                    return
+                except Exception as e:
+                    self.logger.error(f"Erro ao listar arquivos da rede no tracker: {e}")
+                    return
         else:
             self.logger.info("Não foi possível determinar um tracker para consultar.")
             return
@@ -1257,34 +2494,180 @@ class Peer:
         else:
             self.logger.info("Nenhum arquivo encontrado na rede ou tracker vazio.")
 
+    def cli_subscribe_index(self):
+        pattern = input("Padrão dos arquivos a acompanhar (glob, ex.: dataset/* ; Enter = todos): ").strip() or "*"
+        self.cli_unsubscribe_index(quiet=True)
+        self.index_mirror = IndexMirror(pattern)
+        self.index_mirror.resubscribing = True  # Evita que um heartbeat dispare outra assinatura em paralelo
+        if self._subscribe_index(self.index_mirror):
+            print(f"Acompanhando mudanças do índice para '{pattern}'. Use 'list sub' para ver os arquivos.")
+        else:
+            print("Não foi possível assinar agora; nova tentativa automática nos próximos heartbeats.")
+
+    def cli_unsubscribe_index(self, quiet=False):
+        mirror, self.index_mirror = self.index_mirror, None
+        if mirror is None:
+            if not quiet:
+                print("Nenhuma assinatura ativa.")
+            return
+        try:
+            if self.is_tracker:
+                self.unsubscribe_index(mirror.subscription_id)
+            elif self.current_tracker_uri_str:
+                with self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                    tracker_proxy_local.unsubscribe_index(mirror.subscription_id)
+        except Exception as e:
+            # O tracker descarta a assinatura sozinho quando o próximo lote for recusado
+            self.logger.debug(f"Falha ao cancelar assinatura no tracker: {e}")
+        if not quiet:
+            print(f"Assinatura '{mirror.pattern}' cancelada.")
+
+    def cli_list_subscribed_files(self):
+        mirror = self.index_mirror
+        if mirror is None:
+            print("Nenhuma assinatura ativa (use 'subscribe').")
+            return
+        files = mirror.sorted_files()
+        print(f"Arquivos na rede para '{mirror.pattern}' ({len(files)}, versão do índice {mirror.version}):")
+        for filename in files:
+            print(f"  - {filename}")
+
+    def cli_enqueue_downloads(self):
+        names = input("Arquivo(s) a baixar em segundo plano (separados por vírgula; aceita glob, ex.: dataset/*): ")
+        priority_text = input("Prioridade (maior primeiro; Enter = 0): ").strip()
+        try:
+            priority = int(priority_text) if priority_text else 0
+        except ValueError:
+            print("Prioridade inválida.")
+            return
+        filenames = []
+        for name in (part.strip() for part in names.split(",")):
+            if not name:
+                continue
+            if any(ch in name for ch in "*?["):
+                filenames.extend(self._expand_network_pattern(name))
+            elif is_safe_relative_name(name):
+                filenames.append(name)
+            else:
+                print(f"Nome inválido ignorado: '{name}'")
+        for filename in filenames:
+            job = self.download_manager.enqueue(filename, priority)
+            print(f"  #{job.job_id} {filename}")
+        if not filenames:
+            print("Nenhum arquivo adicionado à fila.")
+
+    def _expand_network_pattern(self, pattern):
+        # Nomes do índice do tracker que casam com o glob 'pattern'
+        if self.is_tracker:
+            response = self.get_all_indexed_files(self.current_tracker_epoch)
+        elif self.current_tracker_uri_str:
+            response = self._cached_tracker_lookup(("get_all_indexed_files",))
+            if response is None:
+                try:
+                    with self.proxy_pool.lease(self.current_tracker_uri_str, timeout=5) as tracker_proxy_local:
+                        response = tracker_proxy_local.get_all_indexed_files(self.current_tracker_epoch)
+                    self._store_tracker_lookup(("get_all_indexed_files",), response)
+                except Exception as e:
+                    self.logger.error(f"Erro ao listar arquivos da rede para expandir '{pattern}': {e}")
+                    return []
+        else:
+            self.logger.info("Nenhum tracker conhecido para expandir o padrão.")
+            return []
+        response = self._handle_tracker_response_for_cli(response, "listagem de arquivos da rede")
+        if not response:
+            return []
+        return sorted(name for name in response.get("index", {})
+                      if fnmatch.fnmatchcase(name, pattern) and name not in self.local_files_set)
+
+    def cli_peek_remote_file(self):
+        filename = input("Arquivo da rede a ler (sem baixar): ").strip()
+        offset_text = input("Offset (negativo = a partir do fim; Enter = 0): ").strip()
+        length_text = input(f"Bytes (Enter = {REMOTE_PEEK_DEFAULT_BYTES}): ").strip()
+        try:
+            offset = int(offset_text) if offset_text else 0
+            length = int(length_text) if length_text else REMOTE_PEEK_DEFAULT_BYTES
+        except ValueError:
+            print("Offset/tamanho inválido.")
+            return
+        with self.tracer.start_trace("peek_remote", filename=filename, offset=offset, bytes=length):
+            start = time.perf_counter()
+            try:
+                with self.open_remote(filename) as remote:
+                    remote.seek(offset, os.SEEK_END if offset < 0 else os.SEEK_SET)
+                    position = remote.tell()
+                    data = remote.read(length) if length >= 0 else remote.readall()
+            except (OSError, ValueError) as e:
+                print(f"Não foi possível ler '{filename}': {e}")
+                return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"{len(data)} bytes de '{filename}' a partir do offset {position} (arquivo de {remote.size} bytes, "
+              f"{elapsed_ms:.0f} ms):")
+        try:
+            print(data.decode("utf-8"))
+        except UnicodeDecodeError:
+            for line_offset in range(0, len(data), 16):
+                line = data[line_offset:line_offset + 16]
+                print(f"  {position + line_offset:08x}  {' '.join(f'{byte:02x}' for byte in line)}")
+
+    def cli_list_download_jobs(self):
+        jobs = self.download_manager.jobs()
+        if not jobs:
+            print("Nenhum download na fila.")
+            return
+        stats = self.download_manager.stats()
+        print(f"Downloads: {stats['running']} em andamento, {stats['queued']} na fila, {stats['done']} concluídos, "
+              f"{stats['failed']} com falha ({stats['throughput'] / 1024:.0f} KiB/s no total)")
+        for job in jobs:
+            print(f"  {job.describe()}")
+
+    def cli_cancel_download_job(self):
+        job_id_text = input("Número do job a cancelar: ").strip().lstrip("#")
+        if job_id_text.isdigit() and self.download_manager.cancel(int(job_id_text)):
+            print(f"Job #{job_id_text} cancelado.")
+        else:
+            print("Job inexistente ou já finalizado.")
+
     def cli_refresh_local_files(self):
         self.logger.info("Verificando arquivos locais e notificando tracker (se aplicável)...")
         self.update_local_files_and_notify_tracker()  # Esta função já atualiza self.local_files
         self.cli_list_my_files()  # Apenas lista o estado atual de self.local_files
 
     def cli_status(self):
-        # Atualiza a lista de arquivos locais antes de exibir o status
-        self.local_files = self._scan_local_files()
+        # Atualiza a lista de arquivos locais antes de exibir o status (desnecessário com o observador ativo)
+        if not (self.shared_folder_watcher and self.shared_folder_watcher.is_running()):
+            self._set_local_files(self._scan_local_files())
 
         status_msg = f"\n--- Status do Peer {self.peer_id} ---"
         status_msg += f"\nURI: {self.uri}"
+        if self.metrics_http.port:
+            status_msg += f"\nMétricas: http://{self.metrics_http.host}:{self.metrics_http.port}/metrics"
         status_msg += f"\nÉ Tracker: {'Sim' if self.is_tracker else 'Não'}"
         if self.is_tracker:
             status_msg += f"\nTracker Época Atual (Minha): {self.current_tracker_epoch}"
-            status_msg += f"\nÍndice de Arquivos do Tracker ({len(self.file_index)} arquivos distintos):"
-            if not self.file_index:
+            index_snapshot = self.tracker_index.snapshot()
+            status_msg += f"\nÍndice de Arquivos do Tracker ({len(index_snapshot)} arquivos distintos):"
+            if not index_snapshot:
                 status_msg += " Vazio"
             else:
-                for fname, fholders in self.file_index.items():
+                for fname, fholders in index_snapshot.items():
                     status_msg += f"\n  - {fname}: {[pid for pid, _ in fholders]}"
         else:
             status_msg += f"\nTracker Atual URI: {self.current_tracker_uri_str if self.current_tracker_uri_str else 'Nenhum conhecido'}"
             status_msg += f"\nTracker Atual Época (Conhecida): {self.current_tracker_epoch if self.current_tracker_uri_str else 'N/A'}"
 
         status_msg += f"\nMeus Arquivos Locais ({len(self.local_files)}): {self.local_files if self.local_files else 'Nenhum'}"
-
+        if self.index_mirror is not None:
+            status_msg += (f"\nAssinatura do Índice: '{self.index_mirror.pattern}', {len(self.index_mirror.files)} "
+                           f"arquivos, versão {self.index_mirror.version}")
+        if self.is_tracker and len(self.index_subscriptions):
+            status_msg += f"\nAssinantes do Índice: {', '.join(sub.peer_id for sub in self.index_subscriptions.all())}"
+
+        with self._election_lock:
+            voted_in_epoch = dict(self.voted_in_epoch)
+            active_cand_epoch = self.candidate_for_epoch_value if self.candidate_for_epoch == 1 else 0
+            votes_for_active = len(self.votes_received_for_epoch.get(active_cand_epoch, ()))
         voted_info_list = []
-        for ep, cand_uri in self.voted_in_epoch.items():
+        for ep, cand_uri in voted_in_epoch.items():
             try:
                 cand_peer_id_part = cand_uri.split('@')[0].replace(PEER_NAME_PREFIX,
                                                                    '') if '@' in cand_uri else cand_uri[-6:]
@@ -1295,10 +2678,9 @@ class Peer:
         voted_info = ", ".join(voted_info_list) if voted_info_list else "Nenhum voto registrado"
         status_msg += f"\nHistórico de Votos (Época:Candidato): {voted_info}"
 
-        active_cand_epoch = self.candidate_for_epoch_value if self.candidate_for_epoch == 1 else 0
         status_msg += f"\nSou candidato ativo para Época: {active_cand_epoch if active_cand_epoch > 0 else 'Não'}"
-        if active_cand_epoch > 0 and active_cand_epoch in self.votes_received_for_epoch:
-            status_msg += f"\nVotos recebidos para minha candidatura (época {active_cand_epoch}): {len(self.votes_received_for_epoch[active_cand_epoch])} de {QUORUM} necessários"
+        if active_cand_epoch > 0 and votes_for_active:
+            status_msg += f"\nVotos recebidos para minha candidatura (época {active_cand_epoch}): {votes_for_active} de {QUORUM} necessários"
         status_msg += "\n-------------------------"
         print(status_msg)
 
@@ -1311,6 +2693,13 @@ class Peer:
         print("  search    - Buscar um arquivo na rede e opção de download")
         print("  list my   - Listar meus arquivos compartilhados")
         print("  list net  - Listar todos os arquivos na rede (via tracker)")
+        print("  subscribe - Acompanhar mudanças do índice (todos os arquivos, um prefixo ou glob)")
+        print("  list sub  - Listar arquivos da assinatura (atualizados pelo tracker)")
+        print("  unsubscribe - Cancelar a assinatura do índice")
+        print("  download  - Colocar arquivos (ou um glob) na fila de downloads em segundo plano")
+        print("  jobs      - Listar a fila de downloads (progresso e vazão)")
+        print("  peek      - Ler um trecho de um arquivo da rede sem baixá-lo (início, fim ou offset)")
+        print("  cancel    - Cancelar um download da fila")
         print("  refresh   - Re-escanear pasta local e notificar tracker")
         print("  status    - Mostrar status atual do peer e do tracker")
         print("  election  - Forçar início de uma eleição (simula falha do tracker)")
@@ -1325,6 +2714,20 @@ class Peer:
                     self.cli_list_my_files()
                 elif cmd == "list net":
                     self.cli_list_network_files()
+                elif cmd == "subscribe":
+                    self.cli_subscribe_index()
+                elif cmd == "list sub":
+                    self.cli_list_subscribed_files()
+                elif cmd == "unsubscribe":
+                    self.cli_unsubscribe_index()
+                elif cmd == "download":
+                    self.cli_enqueue_downloads()
+                elif cmd == "peek":
+                    self.cli_peek_remote_file()
+                elif cmd == "jobs":
+                    self.cli_list_download_jobs()
+                elif cmd == "cancel":
+                    self.cli_cancel_download_job()
                 elif cmd == "refresh":
                     self.cli_refresh_local_files()
                 elif cmd == "status":
@@ -1364,6 +2767,18 @@ class Peer:
     def start(self):
         """Inicia o peer: configura PyRO, descobre tracker e inicia loop do daemon."""
         self._setup_pyro()
+        if self.data_plane is not None:
+            if SERVING_WORKERS > 0:
+                self.serving_workers = ServingWorkerPool(self.peer_id, self.shared_folder, self._get_local_ip(),
+                                                         SERVING_WORKERS, self.logger)
+                # Chunks de .part servidos aqui disputam os mesmos slots e o mesmo limite global dos workers
+                self.upload_scheduler = self.serving_workers.new_scheduler()
+            self.data_plane.start()
+            if self.serving_workers is not None:
+                self.serving_workers.start(self.local_files)
+        self.runtime.start()
+        self.metrics_http.start()
+        self.download_manager.start()  # Retoma os jobs pendentes da execução anterior
 
         initial_delay = random.uniform(0.5, 2.0)
         if self.peer_id == "Peer1":
@@ -1373,6 +2788,7 @@ class Peer:
         time.sleep(initial_delay)
 
         self._discover_tracker()
+        self._start_shared_folder_watcher()
 
         cli_thread = threading.Thread(target=self.run_cli, name=f"CLIThread-{self.peer_id}",
                                       daemon=False)  # daemon=False para que o programa espere a CLI
@@ -1395,11 +2811,24 @@ class Peer:
         """Encerra o peer de forma limpa."""
         self.logger.info(f"Encerrando Peer {self.peer_id}...")
 
+        if self.shared_folder_watcher:
+            self.shared_folder_watcher.stop()
+        self.probe_pool.shutdown(wait=False)
+
         self._stop_tracker_timeout_detection()
         self._stop_sending_heartbeats()
         if self.election_vote_collection_timer and self.election_vote_collection_timer.is_alive():
             self.election_vote_collection_timer.cancel()
             self.logger.debug("Timer de coleta de votos da eleição cancelado.")
+        self.download_manager.stop()
+        if self.serving_workers is not None:
+            self.serving_workers.stop()
+        if self.data_plane is not None:
+            self.data_plane.stop()
+        self.runtime.stop()
+        self.metrics_http.stop()
+        self.profiler.stop()
+        self.tracer.close()
 
         # O daemon Pyro já deve ter sido desligado pela CLI ou pelo finally do start()
         if self.pyro_daemon and hasattr(self.pyro_daemon, 'transportServer') and self.pyro_daemon.transportServer:
@@ -1407,29 +2836,29 @@ class Peer:
             self.pyro_daemon.shutdown()  # Garante que está desligado
 
         # Desregistro do NameServer
-        ns_proxy_shutdown = None
         try:
-            ns_proxy_shutdown = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
-            ns_proxy_shutdown.remove(f"{PEER_NAME_PREFIX}{self.peer_id}")
-            self.logger.info(f"Removido {PEER_NAME_PREFIX}{self.peer_id} do servidor de nomes.")
-            if self.is_tracker:  # Se era tracker, remove seu registro de tracker
-                tracker_name_to_remove = f"{TRACKER_BASE_NAME}{self.current_tracker_epoch}"
-                try:
-                    registered_uri = ns_proxy_shutdown.lookup(tracker_name_to_remove)
-                    if str(registered_uri) == str(self.uri):  # Só remove se o URI for o meu
-                        ns_proxy_shutdown.remove(tracker_name_to_remove)
-                        self.logger.info(f"Removido {tracker_name_to_remove} (meu registro de tracker) do NS.")
-                    else:
-                        self.logger.info(
-                            f"Não removi {tracker_name_to_remove} do NS, URI ({registered_uri}) não é meu.")
-                except Pyro5.errors.NamingError:
-                    self.logger.debug(f"{tracker_name_to_remove} não encontrado no NS para remoção (tracker).")
+            with self.proxy_pool.lease_ns() as ns_proxy_shutdown:
+                ns_proxy_shutdown.remove(f"{PEER_NAME_PREFIX}{self.peer_id}")
+                self.logger.info(f"Removido {PEER_NAME_PREFIX}{self.peer_id} do servidor de nomes.")
+                if self.is_tracker:  # Se era tracker, remove seu registro de tracker
+                    tracker_name_to_remove = f"{TRACKER_BASE_NAME}{self.current_tracker_epoch}"
+                    try:
+                        registered_uri = ns_proxy_shutdown.lookup(tracker_name_to_remove)
+                        if str(registered_uri) == str(self.uri):  # Só remove se o URI for o meu
+                            ns_proxy_shutdown.remove(tracker_name_to_remove)
+                            self.logger.info(f"Removido {tracker_name_to_remove} (meu registro de tracker) do NS.")
+                        else:
+                            self.logger.info(
+                                f"Não removi {tracker_name_to_remove} do NS, URI ({registered_uri}) não é meu.")
+                    except Pyro5.errors.NamingError:
+                        self.logger.debug(f"{tracker_name_to_remove} não encontrado no NS para remoção (tracker).")
         except Pyro5.errors.NamingError:
             self.logger.debug("Nomes não encontrados no servidor de nomes para remoção (podem já ter sido removidos).")
         except Pyro5.errors.CommunicationError:
             self.logger.warning("Falha de comunicação com o servidor de nomes durante o desregistro.")
         except Exception as e:
             self.logger.warning(f"Erro ao desregistrar do servidor de nomes: {e}")
+        self.proxy_pool.close_all()
 
         self.logger.info(f"Peer {self.peer_id} finalizado.")
 
@@ -0,0 +1,134 @@
+# peer_logging.py
+# Logging do peer sem bloquear quem loga: os registros vão para uma fila em memória e uma única
+# thread (QueueListener) formata e grava no arquivo. Cada subsistema (heartbeat, tracker,
+# transferências) tem seu logger e seu nível, e os caminhos quentes passam por um limitador de taxa.
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+from constants import LOG_FORMAT, LOG_ROOT_LEVEL, LOG_SUBSYSTEM_LEVELS, LOG_RATE_LIMITED_SUBSYSTEMS, \
+    LOG_RATE_LIMIT_INTERVAL, LOG_RATE_LIMIT_BURST
+
+LOGGER_ROOT_NAME = "p2p"
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Não formata aqui: a mensagem (msg % args) é montada na thread do listener.
+        # Por isso os argumentos de log devem ser imutáveis ou não ser mais alterados depois da chamada.
+        return record
+
+
+class _DefaultPeerIdFilter(logging.Filter):
+    # Registros de outras bibliotecas (ex.: Pyro5) não trazem peer_id, exigido pelo formato
+    def __init__(self, peer_id):
+        super().__init__()
+        self.peer_id = peer_id
+
+    def filter(self, record):
+        if not hasattr(record, "peer_id"):
+            record.peer_id = self.peer_id
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Deixa passar no máximo 'burst' registros de cada mensagem por janela de 'interval' segundos.
+
+    A chave é o template da mensagem (antes da formatação), então "Heartbeat de %s" conta como uma só
+    mensagem para qualquer peer. O primeiro registro que passa depois de uma janela com descartes
+    informa quantos foram suprimidos. WARNING e acima nunca são descartados.
+    """
+
+    def __init__(self, interval=LOG_RATE_LIMIT_INTERVAL, burst=LOG_RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        # (logger, template) -> [início da janela, registros na janela, suprimidos]
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = [now, 0, 0]
+            elif now - window[0] >= self.interval:
+                window[0] = now
+                window[1] = 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [+{suppressed} mensagens semelhantes suprimidas]"
+        return True
+
+
+def setup_peer_logging(peer_id, log_file_path):
+    """Direciona todo o logging do processo para log_file_path através da fila (sobrescreve o arquivo)."""
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+
+        file_handler = logging.FileHandler(log_file_path, mode='w', encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        file_handler.addFilter(_DefaultPeerIdFilter(peer_id))
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        # Remove handlers antigos do logger raiz para evitar logs duplicados
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        _queue_handler = _DeferredQueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+        root.setLevel(LOG_ROOT_LEVEL)
+
+        logging.getLogger(LOGGER_ROOT_NAME).setLevel(LOG_ROOT_LEVEL)
+        for subsystem, level in LOG_SUBSYSTEM_LEVELS.items():
+            logging.getLogger(f"{LOGGER_ROOT_NAME}.{subsystem}").setLevel(level)
+        for subsystem in LOG_RATE_LIMITED_SUBSYSTEMS:
+            subsystem_logger = logging.getLogger(f"{LOGGER_ROOT_NAME}.{subsystem}")
+            if not any(isinstance(f, RateLimitFilter) for f in subsystem_logger.filters):
+                subsystem_logger.addFilter(RateLimitFilter())
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+
+
+def stop_peer_logging():
+    # Esvazia a fila (grava o que falta) e fecha o arquivo; chamadas repetidas são ignoradas.
+    # Registrada no atexit, roda depois que as threads não-daemon (CLI) terminam.
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is None:
+            return
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        _queue_handler = None
+
+
+atexit.register(stop_peer_logging)
+
+
+def get_peer_logger(peer_id, subsystem="peer"):
+    """Logger do subsistema (p2p.<subsystem>) com o peer_id nos registros."""
+    return logging.LoggerAdapter(logging.getLogger(f"{LOGGER_ROOT_NAME}.{subsystem}"), {'peer_id': peer_id})
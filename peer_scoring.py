@@ -0,0 +1,121 @@
+# peer_scoring.py
+# Pontuação dos peers detentores de arquivos: acompanha RTT (via ping), vazão recente e taxa
+# de erros de cada holder e estima o tempo de conclusão de um download, para que o downloader
+# escolha (ou sorteie com peso) o holder mais rápido em vez do primeiro da lista.
+
+import random
+import threading
+import time
+
+from constants import (
+    DOWNLOAD_CHUNK_SIZE, PEER_SCORING_EWMA_ALPHA, PEER_SCORING_DEFAULT_THROUGHPUT, PEER_SCORING_DEFAULT_RTT,
+    PEER_SCORING_RTT_MAX_AGE
+)
+
+
+class PeerStats:
+    __slots__ = ("rtt", "rtt_measured_at", "throughput", "error_rate", "transfers", "errors")
+
+    def __init__(self):
+        self.rtt = None  # segundos (média móvel exponencial)
+        self.rtt_measured_at = 0.0
+        self.throughput = None  # bytes/s (média móvel exponencial)
+        self.error_rate = 0.0  # fração de tentativas que falharam (média móvel exponencial)
+        self.transfers = 0
+        self.errors = 0
+
+
+def _ewma(old, new, alpha=PEER_SCORING_EWMA_ALPHA):
+    return new if old is None else (1 - alpha) * old + alpha * new
+
+
+class PeerScoreBoard:
+    """Estatísticas por holder (chaveadas pela URI) e estimativa de tempo de conclusão."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, peer_uri):
+        stats = self._stats.get(peer_uri)
+        if stats is None:
+            stats = self._stats[peer_uri] = PeerStats()
+        return stats
+
+    # --- Registro de medições ---
+    def record_rtt(self, peer_uri, seconds):
+        with self._lock:
+            stats = self._get(peer_uri)
+            stats.rtt = _ewma(stats.rtt, seconds)
+            stats.rtt_measured_at = time.monotonic()
+
+    def record_transfer(self, peer_uri, nbytes, seconds):
+        if nbytes <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            stats = self._get(peer_uri)
+            stats.throughput = _ewma(stats.throughput, nbytes / seconds)
+
+    def record_success(self, peer_uri):
+        with self._lock:
+            stats = self._get(peer_uri)
+            stats.transfers += 1
+            stats.error_rate = _ewma(stats.error_rate, 0.0)
+
+    def record_error(self, peer_uri):
+        with self._lock:
+            stats = self._get(peer_uri)
+            stats.errors += 1
+            stats.error_rate = _ewma(stats.error_rate, 1.0)
+
+    def needs_probe(self, peer_uri):
+        # True se não há RTT recente para este holder
+        with self._lock:
+            stats = self._stats.get(peer_uri)
+            return stats is None or stats.rtt is None or \
+                time.monotonic() - stats.rtt_measured_at > PEER_SCORING_RTT_MAX_AGE
+
+    # --- Estimativas ---
+    def expected_completion_time(self, peer_uri, size=None, load=0):
+        """Tempo estimado (s) para baixar 'size' bytes deste holder, dado o número de uploads em andamento nele."""
+        size = DOWNLOAD_CHUNK_SIZE if size is None or size <= 0 else size
+        with self._lock:
+            stats = self._stats.get(peer_uri) or PeerStats()
+            rtt = stats.rtt if stats.rtt is not None else PEER_SCORING_DEFAULT_RTT
+            throughput = stats.throughput or PEER_SCORING_DEFAULT_THROUGHPUT
+            error_rate = min(stats.error_rate, 0.95)
+        num_chunks = max(1, -(-size // DOWNLOAD_CHUNK_SIZE))
+        # Cada upload concorrente no holder divide a banda dele; erros exigem novas tentativas
+        transfer_time = num_chunks * rtt + (size / throughput) * (1 + max(load, 0))
+        return transfer_time / (1 - error_rate)
+
+    def rank(self, holders, size=None, holder_load=None):
+        """Ordena holders [(peer_id, uri), ...] do menor para o maior tempo estimado."""
+        holder_load = holder_load or {}
+        return sorted(holders, key=lambda h: self.expected_completion_time(h[1], size, holder_load.get(h[1], 0)))
+
+    def pick(self, holders, size=None, holder_load=None):
+        """Sorteia um holder entre os competitivos (até 2x o melhor tempo), com peso inversamente
+        proporcional ao tempo estimado, para que peers com a mesma visão não escolham todos o mesmo."""
+        if not holders:
+            return None
+        holder_load = holder_load or {}
+        estimates = [(self.expected_completion_time(h[1], size, holder_load.get(h[1], 0)), h) for h in holders]
+        best_time = min(t for t, _ in estimates)
+        competitive = [(t, h) for t, h in estimates if t <= 2 * best_time]
+        return random.choices([h for _, h in competitive], weights=[1 / max(t, 1e-6) for t, _ in competitive])[0]
+
+    def describe(self, peer_uri):
+        # Resumo legível das estatísticas de um holder (para a CLI)
+        with self._lock:
+            stats = self._stats.get(peer_uri)
+            if stats is None:
+                return "sem histórico"
+            parts = []
+            if stats.rtt is not None:
+                parts.append(f"RTT {stats.rtt * 1000:.1f} ms")
+            if stats.throughput:
+                parts.append(f"{stats.throughput / 1024:.0f} KiB/s")
+            if stats.errors:
+                parts.append(f"erros {stats.error_rate:.0%}")
+            return ", ".join(parts) or "sem histórico"
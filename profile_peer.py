@@ -0,0 +1,46 @@
+# profile_peer.py
+# Coleta um perfil de um peer em execução e grava as pilhas no formato folded (flamegraph).
+# Uso: python profile_peer.py <peer_id> [duração_s] [arquivo_saída]
+# Ex.:  python profile_peer.py Peer1 30 peer1.folded && flamegraph.pl peer1.folded > peer1.svg
+
+import sys
+import time
+
+import Pyro5.api
+import Pyro5.errors
+
+from constants import NAMESERVER_HOST, NAMESERVER_PORT, PEER_NAME_PREFIX, PROFILER_DEFAULT_DURATION
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python profile_peer.py <peer_id> [duração_s] [arquivo_saída]")
+        sys.exit(1)
+    peer_id = sys.argv[1]
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else PROFILER_DEFAULT_DURATION
+    output_path = sys.argv[3] if len(sys.argv) > 3 else f"{peer_id}.folded"
+
+    try:
+        ns = Pyro5.api.locate_ns(host=NAMESERVER_HOST, port=NAMESERVER_PORT)
+        peer_uri = ns.lookup(f"{PEER_NAME_PREFIX}{peer_id}")
+    except Pyro5.errors.NamingError as e:
+        print(f"Não foi possível localizar {PEER_NAME_PREFIX}{peer_id} no servidor de nomes: {e}")
+        sys.exit(1)
+
+    with Pyro5.api.Proxy(peer_uri) as peer_proxy:
+        peer_proxy._pyroTimeout = 10
+        response = peer_proxy.start_profiling(duration)
+        if response["status"] != "started":
+            print(f"O peer {peer_id} já está com uma coleta em andamento; use-a ou tente mais tarde.")
+            sys.exit(1)
+        print(f"Coletando amostras de {peer_id} por {duration:.0f}s...")
+        time.sleep(duration)
+        result = peer_proxy.stop_profiling()
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(result["folded"] + "\n")
+    print(f"{result['samples']} amostras ({result['distinct_stacks']} pilhas distintas) gravadas em {output_path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# profiler.py
+# Profiler por amostragem de pilhas, ligado sob demanda em um peer em execução (sem reiniciá-lo, o
+# que dispararia uma eleição se ele fosse o tracker). Uma thread lê sys._current_frames() a cada
+# intervalo e acumula as pilhas no formato "folded" (uma linha "quadro;quadro;... contagem"),
+# aceito por flamegraph.pl, speedscope e inferno.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from constants import PROFILER_SAMPLE_INTERVAL, PROFILER_MAX_DURATION, PROFILER_MAX_STACK_DEPTH
+
+# Thread -> método remoto em execução nela (preenchido por metrics.timed_rpc); vira um quadro
+# "rpc:<método>" logo abaixo do nome da thread, separando o tempo de cada RPC no flamegraph
+active_rpcs = {}
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name}[{os.path.basename(code.co_filename)}:{code.co_firstlineno}]"
+
+
+class SamplingProfiler:
+    def __init__(self, logger, max_stack_depth=PROFILER_MAX_STACK_DEPTH):
+        self.logger = logger
+        self.max_stack_depth = max_stack_depth
+        self._lock = threading.Lock()
+        self._stacks = Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._started_at = None
+        self._finished_at = None
+        self._interval = PROFILER_SAMPLE_INTERVAL
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration, interval=PROFILER_SAMPLE_INTERVAL):
+        """Inicia uma coleta de 'duration' segundos (limitada a PROFILER_MAX_DURATION). False se já houver uma."""
+        duration = min(max(float(duration), 0.1), PROFILER_MAX_DURATION)
+        interval = max(float(interval), 0.001)
+        with self._lock:
+            if self.is_running():
+                return False
+            self._stacks = Counter()
+            self._samples = 0
+            self._interval = interval
+            self._started_at = time.time()
+            self._finished_at = None
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(duration, interval, self._stop_event),
+                                            name="SamplingProfiler", daemon=True)
+            self._thread.start()
+        self.logger.info(f"Profiler iniciado: {duration:.1f}s, uma amostra a cada {interval * 1000:.1f} ms.")
+        return True
+
+    def stop(self):
+        # Interrompe a coleta em andamento (se houver) e espera a thread terminar
+        thread = self._thread
+        self._stop_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2)
+
+    def _run(self, duration, interval, stop_event):
+        own_ident = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not stop_event.is_set() and time.monotonic() < deadline:
+            self._sample(own_ident)
+            stop_event.wait(interval)
+        self._finished_at = time.time()
+        self.logger.info(f"Profiler finalizado: {self._samples} amostras, {len(self._stacks)} pilhas distintas.")
+
+    def _sample(self, own_ident):
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        frames = sys._current_frames()
+        sampled = []
+        for ident, frame in frames.items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_stack_depth:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()  # Folded: da raiz para a folha
+            # Espaços separam a pilha da contagem no formato folded (nomes de thread podem ter espaços)
+            root = [thread_names.get(ident, f"thread-{ident}").replace(" ", "_")]
+            rpc = active_rpcs.get(ident)
+            if rpc is not None:
+                root.append(f"rpc:{rpc}")
+            sampled.append(";".join(root + stack))
+        del frames
+        with self._lock:
+            self._stacks.update(sampled)
+            self._samples += 1
+
+    def folded(self):
+        """Pilhas coletadas no formato folded, uma por linha (mais frequentes primeiro)."""
+        with self._lock:
+            items = self._stacks.most_common()
+        return "\n".join(f"{stack} {count}" for stack, count in items)
+
+    def summary(self):
+        with self._lock:
+            return {"running": self.is_running(),
+                    "samples": self._samples,
+                    "distinct_stacks": len(self._stacks),
+                    "interval": self._interval,
+                    "started_at": self._started_at,
+                    "finished_at": self._finished_at}
@@ -0,0 +1,183 @@
+# proxy_pool.py
+# Pool de proxies Pyro5 por URI. Reaproveita conexões já abertas (evita um connect TCP + handshake
+# Pyro por chamada), empresta cada proxy a uma thread de cada vez (reivindicando a posse do proxy),
+# confere a conexão de proxies parados há algum tempo, fecha os ociosos e descarta todos os proxies
+# de um URI quando uma chamada falha com CommunicationError.
+
+import collections
+import contextlib
+import threading
+import time
+
+import Pyro5.api
+import Pyro5.core
+import Pyro5.errors
+
+from constants import NAMESERVER_HOST, NAMESERVER_PORT, PROXY_POOL_MAX_IDLE_PER_URI, PROXY_POOL_IDLE_TIMEOUT, \
+    PROXY_POOL_HEALTH_CHECK_AGE, PROXY_POOL_CONNECT_TIMEOUT
+
+
+def nameserver_uri(host=NAMESERVER_HOST, port=NAMESERVER_PORT):
+    # URI direto do servidor de nomes (o mesmo que locate_ns encontraria com host/porta conhecidos)
+    return f"PYRO:{Pyro5.core.NAMESERVER_NAME}@{host}:{port}"
+
+
+class ProxyPool:
+    def __init__(self, logger, max_idle_per_uri=PROXY_POOL_MAX_IDLE_PER_URI, idle_timeout=PROXY_POOL_IDLE_TIMEOUT,
+                 health_check_age=PROXY_POOL_HEALTH_CHECK_AGE, tracer=None):
+        self.logger = logger
+        # Com um tracer, conexões novas abertas dentro de um trace viram um span "connect"
+        self.tracer = tracer
+        self.max_idle_per_uri = max_idle_per_uri
+        self.idle_timeout = idle_timeout
+        self.health_check_age = health_check_age
+        self._lock = threading.Lock()
+        # URI -> deque de (proxy, instante em que voltou ao pool); o mais recente fica à direita
+        self._idle = {}
+        self._last_eviction = time.monotonic()
+        self._stats = collections.Counter()
+
+    # --- Empréstimo ---
+    def acquire(self, uri, timeout=None):
+        """Empresta um proxy conectado a 'uri' para a thread atual (devolva com release())."""
+        uri = str(uri)
+        self._evict_idle_if_due()
+        while True:
+            with self._lock:
+                idle = self._idle.get(uri)
+                entry = idle.pop() if idle else None
+                if idle is not None and not idle:
+                    del self._idle[uri]
+            if entry is None:
+                break
+            proxy, returned_at = entry
+            proxy._pyroClaimOwnership()
+            if time.monotonic() - returned_at < self.health_check_age or self._is_healthy(proxy):
+                self._stats["reused"] += 1
+                proxy._pyroTimeout = timeout
+                return proxy
+            # Conexão morta (peer reiniciou, timeout do outro lado): descarta e tenta o próximo
+            self._close(proxy)
+
+        proxy = Pyro5.api.Proxy(uri)
+        # Conecta já aqui: falhas de conexão aparecem no empréstimo, antes do primeiro uso
+        proxy._pyroTimeout = PROXY_POOL_CONNECT_TIMEOUT if timeout is None else min(timeout, PROXY_POOL_CONNECT_TIMEOUT)
+        try:
+            if self.tracer is not None:
+                with self.tracer.span("connect", uri=uri):
+                    proxy._pyroBind()
+            else:
+                proxy._pyroBind()
+        except Pyro5.errors.CommunicationError:
+            self._close(proxy)
+            raise
+        self._stats["created"] += 1
+        proxy._pyroTimeout = timeout
+        return proxy
+
+    def release(self, proxy, broken=False):
+        uri = str(proxy._pyroUri)
+        if broken:
+            self._close(proxy)
+            self.invalidate(uri)
+            return
+        with self._lock:
+            idle = self._idle.setdefault(uri, collections.deque())
+            idle.append((proxy, time.monotonic()))
+            overflow = idle.popleft()[0] if len(idle) > self.max_idle_per_uri else None
+        if overflow is not None:
+            self._close(overflow)
+
+    @contextlib.contextmanager
+    def lease(self, uri, timeout=None):
+        """with pool.lease(uri, timeout) as proxy: ... — devolve o proxy ao pool ao final."""
+        proxy = self.acquire(uri, timeout)
+        broken = False
+        try:
+            yield proxy
+        except Pyro5.errors.CommunicationError:
+            broken = True
+            raise
+        finally:
+            self.release(proxy, broken)
+
+    @contextlib.contextmanager
+    def lease_ns(self, timeout=None):
+        # Servidor de nomes inacessível vira NamingError, como em Pyro5.api.locate_ns
+        try:
+            proxy = self.acquire(nameserver_uri(), timeout)
+        except Pyro5.errors.CommunicationError as e:
+            raise Pyro5.errors.NamingError(f"servidor de nomes inacessível: {e}") from e
+        broken = False
+        try:
+            yield proxy
+        except Pyro5.errors.CommunicationError:
+            broken = True
+            raise
+        finally:
+            self.release(proxy, broken)
+
+    # --- Manutenção ---
+    def invalidate(self, uri):
+        # Descarta todos os proxies ociosos de 'uri' (o peer provavelmente caiu)
+        with self._lock:
+            idle = self._idle.pop(str(uri), ())
+        for proxy, _ in idle:
+            self._close(proxy)
+        if idle:
+            self._stats["invalidated"] += len(idle)
+
+    def _is_healthy(self, proxy):
+        # Ida e volta barata até o daemon remoto (não depende de métodos do objeto)
+        previous_timeout = proxy._pyroTimeout
+        try:
+            proxy._pyroTimeout = PROXY_POOL_CONNECT_TIMEOUT
+            proxy._pyroGetMetadata()
+            return True
+        except Pyro5.errors.PyroError:
+            self._stats["failed_health_checks"] += 1
+            return False
+        finally:
+            proxy._pyroTimeout = previous_timeout
+
+    def _evict_idle_if_due(self):
+        now = time.monotonic()
+        if now - self._last_eviction < self.idle_timeout / 2:
+            return
+        self._last_eviction = now
+        self.evict_idle()
+
+    def evict_idle(self):
+        # Fecha conexões paradas há mais de idle_timeout (cada uma ocupa uma thread do daemon remoto)
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            for uri in list(self._idle):
+                idle = self._idle[uri]
+                while idle and now - idle[0][1] > self.idle_timeout:
+                    expired.append(idle.popleft()[0])
+                if not idle:
+                    del self._idle[uri]
+        for proxy in expired:
+            self._close(proxy)
+        self._stats["evicted"] += len(expired)
+        return len(expired)
+
+    def _close(self, proxy):
+        try:
+            proxy._pyroClaimOwnership()
+            proxy._pyroRelease()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            all_idle = [proxy for idle in self._idle.values() for proxy, _ in idle]
+            self._idle.clear()
+        for proxy in all_idle:
+            self._close(proxy)
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(q) for q in self._idle.values())
+        return dict(self._stats, idle=idle)
@@ -0,0 +1,156 @@
+# remote_file.py
+# Leitura de um arquivo da rede sem baixá-lo inteiro: RemoteFile é um arquivo binário (io.RawIOBase)
+# com read/readinto/seek/tell sobre get_file_size e request_file_chunk dos holders indicados pelo
+# tracker. Os chunks lidos ficam em um cache LRU pequeno e, em leitura sequencial, os próximos chunks
+# são pedidos antes de serem necessários (janela que dobra a cada acerto e zera em um seek aleatório).
+# Ler o cabeçalho de um arquivo grande, o fim de um log ou saltar em um vídeo custa só os chunks lidos.
+
+import io
+import threading
+from collections import OrderedDict
+
+import Pyro5.errors
+
+from chunk_codec import ChunkDecodeError
+from constants import DOWNLOAD_CHUNK_SIZE, REMOTE_FILE_CACHE_CHUNKS, REMOTE_FILE_MAX_READAHEAD, CHUNK_REQUEST_TIMEOUT
+
+
+class RemoteFile(io.RawIOBase):
+    """Arquivo remoto somente leitura. Use peer.open_remote(nome) (ou io.BufferedReader por cima)."""
+
+    def __init__(self, peer, filename, holders, size, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 cache_chunks=REMOTE_FILE_CACHE_CHUNKS, max_readahead=REMOTE_FILE_MAX_READAHEAD):
+        # holders: [(peer_id, uri)] já ordenados pela pontuação; o primeiro que responder serve cada chunk
+        super().__init__()
+        self.peer = peer
+        self.name = filename
+        self.holders = list(holders)
+        self.size = size
+        self.chunk_size = chunk_size
+        self.cache_chunks = max(1, cache_chunks)
+        self.max_readahead = max_readahead
+        self._pos = 0
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # índice do chunk -> bytes (LRU)
+        self._pending = {}  # índice -> Future da leitura antecipada
+        self._last_index = None
+        self._window = 0  # Chunks pedidos à frente; cresce em leitura sequencial
+
+    # --- Interface de arquivo ---
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if position < 0:
+            raise ValueError(f"posição negativa: {position}")
+        self._pos = position
+        return position
+
+    def readinto(self, buffer):
+        """Preenche 'buffer' a partir da posição atual (atravessando chunks); 0 no fim do arquivo."""
+        if self.closed:
+            raise ValueError("leitura de arquivo remoto fechado")
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(view) and self._pos < self.size:
+            index, offset = divmod(self._pos, self.chunk_size)
+            data = self._chunk(index)
+            count = min(len(view) - filled, len(data) - offset)
+            view[filled:filled + count] = data[offset:offset + count]
+            filled += count
+            self._pos += count
+        return filled
+
+    def close(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._cache.clear()
+        super().close()
+
+    # --- Chunks ---
+    def _chunk(self, index):
+        with self._lock:
+            data = self._cache.get(index)
+            if data is not None:
+                self._cache.move_to_end(index)
+            future = self._pending.pop(index, None) if data is None else None
+        if data is None and future is not None:
+            data = future.result()  # Leitura antecipada em andamento (None se falhou: tenta de novo abaixo)
+        if data is None:
+            data = self._fetch(index)
+            if data is None:
+                raise OSError(f"Nenhum holder respondeu o chunk {index} de '{self.name}'.")
+        with self._lock:
+            self._store(index, data)
+            self._schedule_readahead(index)
+        return data
+
+    def _store(self, index, data):
+        # Chamado com _lock adquirido
+        self._cache[index] = data
+        self._cache.move_to_end(index)
+        while len(self._cache) > self.cache_chunks:
+            self._cache.popitem(last=False)
+
+    def _schedule_readahead(self, index):
+        # Chamado com _lock adquirido. Sequencial: janela dobra (até max_readahead); salto: janela zera
+        if index == self._last_index:
+            pass
+        elif index == (self._last_index + 1 if self._last_index is not None else 0):
+            # Leitura sequencial (ou a primeira, do início do arquivo)
+            self._window = min(self.max_readahead, max(1, self._window * 2))
+        else:
+            self._window = 0
+        self._last_index = index
+        last_chunk = (self.size - 1) // self.chunk_size
+        for ahead in range(index + 1, min(last_chunk, index + self._window) + 1):
+            if ahead not in self._cache and ahead not in self._pending:
+                self._pending[ahead] = self.peer.runtime.submit(self._fetch_ahead, ahead)
+
+    def _fetch_ahead(self, index):
+        data = self._fetch(index)
+        with self._lock:
+            # Só guarda se ainda é esperado (close() descarta as leituras pendentes)
+            if self._pending.pop(index, None) is not None and data is not None:
+                self._store(index, data)
+        return data
+
+    def _fetch(self, index):
+        """Bytes do chunk 'index' do primeiro holder que responder; None se todos falharem."""
+        offset = index * self.chunk_size
+        size = min(self.chunk_size, self.size - offset)
+        peer = self.peer
+        for _, holder_uri_str in list(self.holders):
+            try:
+                with peer.proxy_pool.lease(peer._data_uri(holder_uri_str), timeout=CHUNK_REQUEST_TIMEOUT) as holder_proxy:
+                    data = peer._fetch_chunk(holder_proxy, holder_uri_str, self.name, offset, size)
+                if data and len(data) == size:
+                    return data
+                peer.logger.warning(f"Chunk {index} de '{self.name}' incompleto em {holder_uri_str}.")
+            except (Pyro5.errors.CommunicationError, ChunkDecodeError) as e:
+                peer.logger.warning(f"Holder {holder_uri_str} falhou no chunk {index} de '{self.name}': {e}")
+                peer.peer_scores.record_error(holder_uri_str)
+                peer._forget_data_uri(holder_uri_str)
+            # Holder com problema vai para o fim da lista; os próximos chunks tentam os outros primeiro
+            with self._lock:
+                entry = [h for h in self.holders if h[1] == holder_uri_str]
+                if entry and len(self.holders) > 1:
+                    self.holders.remove(entry[0])
+                    self.holders.append(entry[0])
+        return None
@@ -5,7 +5,7 @@ import os
 import sys
 import shutil
 import base64  # adicionar import
-from constants import NAMESERVER_HOST, NAMESERVER_PORT, TOTAL_PEERS_EXPECTED
+from constants import NAMESERVER_HOST, NAMESERVER_PORT, TOTAL_PEERS_EXPECTED, CONTENT_STORE_BASE_DIR
 
 # --- configurações ---
 PYTHON_EXECUTABLE = sys.executable  # usa o mesmo executável Python que está rodando este script
@@ -13,6 +13,7 @@ PEER_SCRIPT_PATH = "peer.py"  # caminho para o script peer.py
 BASE_SHARED_DIR = "p2p_shared_folders"  # pasta base para os diretórios compartilhados dos peers
 BASE_DOWNLOAD_DIR = "p2p_download_folders"  # pasta base para os downloads dos peers
 LOGS_DIR = "logs" # pasta base para os ficheiros de log dos peers
+BASE_STORE_DIR = CONTENT_STORE_BASE_DIR  # pasta base dos stores endereçados por conteúdo dos peers
 
 # arquivos de exemplo para popular as pastas dos peers
 EXAMPLE_FILES_CONTENT = {
@@ -43,7 +44,7 @@ def start_nameserver():
 
 def create_shared_folders_and_files(num_peers):
     """cria as pastas de compartilhamento e popula com arquivos de exemplo."""
-    for dir_to_clean in [BASE_SHARED_DIR, BASE_DOWNLOAD_DIR, LOGS_DIR]:
+    for dir_to_clean in [BASE_SHARED_DIR, BASE_DOWNLOAD_DIR, BASE_STORE_DIR, LOGS_DIR]:
         if os.path.exists(dir_to_clean):
             print(f"limpando diretório antigo: {dir_to_clean}")
             shutil.rmtree(dir_to_clean)
@@ -0,0 +1,237 @@
+# serving_workers.py
+# Processos que servem os arquivos completos da pasta compartilhada (chunks, deltas e tamanho), fora do
+# processo principal do peer: leitura, compressão e cálculo de delta deixam de disputar o GIL com o
+# tracker, a CLI e os heartbeats, e a vazão de upload escala com o número de núcleos.
+# Cada worker tem seu próprio daemon Pyro (porta própria, pois o Pyro5 não aceita um socket de escuta
+# compartilhado via SO_REUSEPORT), seu cache de chunks e seu escalonador de uploads. O peer principal
+# coordena: inicia/encerra os workers e, em get_data_uri, distribui os downloaders entre eles.
+# Cada downloader fica fixo num worker, então o limite por peer vale inteiro em cada um; o limite global
+# de banda e os UPLOAD_SLOTS são compartilhados entre os workers e o processo principal (memória
+# compartilhada e semáforo entre processos), valendo para o peer como um todo.
+# Chunks de downloads em andamento (.part) continuam sendo servidos pelo plano de dados do processo
+# principal, que é quem conhece os bitfields. Os workers só servem os nomes publicados pelo peer
+# (local_files), recebidos como diferenças (adicionados, removidos) pelo mesmo pipe que avisa o
+# encerramento do processo principal.
+
+import multiprocessing
+import os
+import threading
+import zlib
+
+import Pyro5.api
+import Pyro5.server
+
+from chunk_cache import ChunkCache
+from chunk_codec import encode_chunk
+from constants import (
+    CHUNK_CACHE_MAX_BYTES, CHUNK_CACHE_READAHEAD_BYTES, DELTA_PAGE_MAX_LITERAL_BYTES, UPLOAD_SLOTS,
+    UPLOAD_MAX_BYTES_PER_SEC, UPLOAD_PER_PEER_MAX_BYTES_PER_SEC, SERVING_WORKER_START_TIMEOUT
+)
+from delta_sync import delta_page_response, DeltaSessions, DeltaTooLarge, DeltaSourceChanged, DeltaSessionExpired
+from shared_tree import is_path_excluded, to_local_path
+from upload_scheduler import UploadScheduler, UploadQueueTimeout, SharedTokenBucket
+
+
+@Pyro5.api.expose
+class ChunkServingWorker:
+    """Objeto Pyro de um processo worker (lado servidor, só leitura da pasta compartilhada)."""
+
+    def __init__(self, shared_folder, num_workers, bytes_served, bucket_state, shared_slots):
+        self.shared_folder = shared_folder
+        self.bytes_served = bytes_served  # multiprocessing.Value lido pelas métricas do processo principal
+        # Nomes que o peer anuncia ao tracker; qualquer outro pedido é recusado. Só a thread ParentWatch
+        # altera o conjunto (no lugar); as threads do daemon apenas consultam
+        self.published = set()
+        # Cache dividido entre os workers: o total continua o configurado
+        self.chunk_cache = ChunkCache(CHUNK_CACHE_MAX_BYTES // num_workers, CHUNK_CACHE_READAHEAD_BYTES)
+        self.delta_sessions = DeltaSessions()
+        self.upload_scheduler = _shared_scheduler(bucket_state, shared_slots)
+
+    def _path(self, filename):
+        if filename not in self.published or is_path_excluded(filename):
+            return None
+        path = to_local_path(self.shared_folder, filename)
+        return path if path is not None and os.path.isfile(path) else None
+
+    def _count(self, nbytes):
+        with self.bytes_served.get_lock():
+            self.bytes_served.value += nbytes
+
+    def request_file_chunk(self, filename, chunk_offset, chunk_size, requester_id=None):
+        return self._serve_chunk(filename, chunk_offset, chunk_size, requester_id)
+
+    def request_file_chunk_compressed(self, filename, chunk_offset, chunk_size, accepted_codecs, requester_id=None):
+        return self._serve_chunk(filename, chunk_offset, chunk_size, requester_id, accepted_codecs or [])
+
+    def _serve_chunk(self, filename, chunk_offset, chunk_size, requester_id, accepted_codecs=None):
+        path = self._path(filename)
+        if path is None:
+            return None
+        requester_id = requester_id or "desconhecido"
+        try:
+            with self.upload_scheduler.slot(requester_id) as slot:
+                data, _ = self.chunk_cache.read(path, chunk_offset, chunk_size)
+                reservation = slot.reserve(len(data))
+                if reservation.nbytes < len(data):
+                    data = data[:reservation.nbytes]  # Limite de banda: o downloader pede o restante do chunk em seguida
+                if accepted_codecs is None:
+                    reservation.settle(len(data))
+                    self._count(len(data))
+                    return data
+                # Compressão no próprio worker: é justamente o trabalho que escala com os núcleos
+                payload = encode_chunk(data, accepted_codecs)
+                reservation.settle(len(payload["data"]))
+                self._count(len(payload["data"]))
+                return payload
+        except (UploadQueueTimeout, OSError):
+            return None
+
+    def request_file_delta(self, filename, signature, accepted_codecs=None, requester_id=None, cursor=None):
+        path = self._path(filename)
+        if path is None:
+            return {"status": "not_found"}
+        requester_id = requester_id or "desconhecido"
+        try:
+            with self.upload_scheduler.slot(requester_id) as slot:
+                reservation = slot.reserve(DELTA_PAGE_MAX_LITERAL_BYTES)
+                response, wire_bytes = delta_page_response(path, signature, cursor, accepted_codecs,
+                                                           self.delta_sessions, reservation.nbytes)
+                reservation.settle(wire_bytes)
+                self._count(wire_bytes)
+                return response
+        except DeltaTooLarge:
+            return {"status": "too_different"}
+        except DeltaSourceChanged:
+            return {"status": "changed"}
+        except DeltaSessionExpired:
+            return {"status": "expired"}
+        except UploadQueueTimeout:
+            return {"status": "busy"}
+        except OSError:
+            return {"status": "not_found"}
+
+    def get_file_size(self, filename):
+        path = self._path(filename)
+        try:
+            return os.path.getsize(path) if path is not None else -1
+        except OSError:
+            return -1
+
+
+def _shared_scheduler(bucket_state, shared_slots):
+    # Os downloaders ficam fixos num worker (pick): o limite por peer vale inteiro em cada processo.
+    # Slots e limite global vêm do estado compartilhado criado pelo ServingWorkerPool
+    return UploadScheduler(UPLOAD_SLOTS, UPLOAD_MAX_BYTES_PER_SEC, UPLOAD_PER_PEER_MAX_BYTES_PER_SEC,
+                           global_bucket=SharedTokenBucket(UPLOAD_MAX_BYTES_PER_SEC, bucket_state),
+                           shared_slots=shared_slots)
+
+
+def _worker_main(shared_folder, host, num_workers, bytes_served, bucket_state, shared_slots, conn):
+    # Ponto de entrada do processo worker: publica o objeto, devolve o URI e atende até o pai sair
+    Pyro5.config.SERIALIZER = "serpent"
+    daemon = Pyro5.server.Daemon(host=host)
+    worker = ChunkServingWorker(shared_folder, num_workers, bytes_served, bucket_state, shared_slots)
+    uri = daemon.register(worker)
+    conn.send(str(uri))
+
+    def watch_parent():
+        # Cada mensagem é um par (adicionados, removidos) em relação ao envio anterior. O pipe fecha
+        # quando o processo principal encerra (ou morre): o worker sai junto
+        try:
+            while True:
+                added, removed = conn.recv()
+                worker.published.difference_update(removed)
+                worker.published.update(added)
+        except (EOFError, OSError):
+            pass
+        daemon.shutdown()
+
+    threading.Thread(target=watch_parent, name="ParentWatch", daemon=True).start()
+    daemon.requestLoop()
+
+
+class ServingWorkerPool:
+    """Workers de um peer: inicia os processos e escolhe um para cada downloader."""
+
+    def __init__(self, peer_id, shared_folder, host, num_workers, logger):
+        self.peer_id = peer_id
+        self.shared_folder = shared_folder
+        self.host = host
+        self.num_workers = num_workers
+        self.logger = logger
+        self.uris = []
+        self._processes = []
+        self._conns = []
+        self._counters = []
+        self._send_lock = threading.Lock()
+        self._published = frozenset()  # Último conjunto enviado aos workers (base das diferenças)
+        # "spawn": o processo principal já tem threads (fork copiaria locks em estado inconsistente)
+        self._context = multiprocessing.get_context("spawn")
+        # Limite global de banda e slots de upload do peer inteiro (workers + processo principal)
+        self._bucket_state = SharedTokenBucket.new_state(self._context, UPLOAD_MAX_BYTES_PER_SEC)
+        self._shared_slots = self._context.BoundedSemaphore(max(1, UPLOAD_SLOTS))
+
+    def new_scheduler(self):
+        """Escalonador para o processo principal que disputa os mesmos slots e banda global dos workers."""
+        return _shared_scheduler(self._bucket_state, self._shared_slots)
+
+    def start(self, published_names):
+        for index in range(self.num_workers):
+            parent_conn, child_conn = self._context.Pipe()
+            bytes_served = self._context.Value("Q", 0)
+            process = self._context.Process(
+                target=_worker_main, name=f"ServingWorker-{self.peer_id}-{index}",
+                args=(self.shared_folder, self.host, self.num_workers, bytes_served, self._bucket_state,
+                      self._shared_slots, child_conn), daemon=True)
+            process.start()
+            child_conn.close()
+            try:
+                if not parent_conn.poll(SERVING_WORKER_START_TIMEOUT):
+                    raise EOFError("sem resposta")
+                uri = parent_conn.recv()
+            except (EOFError, OSError) as e:
+                self.logger.error(f"Worker de upload {index} não iniciou ({e}); seguindo sem ele.")
+                process.terminate()
+                parent_conn.close()
+                continue
+            self.uris.append(uri)
+            self._processes.append(process)
+            self._conns.append(parent_conn)
+            self._counters.append(bytes_served)
+        self.publish(published_names)
+        if self.uris:
+            self.logger.info(f"{len(self.uris)} processos servindo a pasta compartilhada: {self.uris}")
+
+    def publish(self, names):
+        """Envia aos workers as mudanças na lista de arquivos compartilhados (os únicos que eles servem)."""
+        names = frozenset(names)
+        with self._send_lock:
+            added = list(names - self._published)
+            removed = list(self._published - names)
+            self._published = names
+            if not added and not removed:
+                return
+            for conn in self._conns:
+                try:
+                    conn.send((added, removed))
+                except (OSError, ValueError) as e:
+                    self.logger.warning(f"Falha ao enviar a lista de arquivos a um worker de upload: {e}")
+
+    def pick(self, requester_id):
+        """URI do worker de um downloader (sempre o mesmo para o mesmo peer, reaproveitando a conexão)."""
+        if not self.uris:
+            return None
+        return self.uris[zlib.crc32((requester_id or "").encode("utf-8")) % len(self.uris)]
+
+    def bytes_served(self):
+        return sum(counter.value for counter in self._counters)
+
+    def stop(self):
+        with self._send_lock:
+            for conn in self._conns:
+                conn.close()  # O worker percebe o pipe fechado e encerra o daemon
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.uris = []
@@ -0,0 +1,84 @@
+# shared_tree.py
+# Varredura recursiva da árvore compartilhada. Os nomes dos arquivos são caminhos relativos
+# à pasta compartilhada, sempre com '/' como separador (ex.: "dataset/parte1/a.csv").
+
+import fnmatch
+import os
+import re
+
+from constants import SHARED_EXCLUDE_PATTERNS
+
+
+def compile_exclude_patterns(patterns=SHARED_EXCLUDE_PATTERNS):
+    # Junta todos os padrões glob em uma única regex (uma chamada de match por entrada)
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+_DEFAULT_EXCLUDE = compile_exclude_patterns()
+
+
+def is_excluded(rel_path, exclude_regex=_DEFAULT_EXCLUDE):
+    # Um padrão pode casar com o nome da entrada ("*.tmp") ou com o caminho relativo ("cache/*")
+    if exclude_regex is None:
+        return False
+    return bool(exclude_regex.match(rel_path.rsplit("/", 1)[-1]) or exclude_regex.match(rel_path))
+
+
+def is_path_excluded(rel_path, exclude_regex=_DEFAULT_EXCLUDE):
+    # Como a varredura: o nome é excluído se ele ou qualquer diretório do caminho casar com um padrão
+    if exclude_regex is None:
+        return False
+    parts = rel_path.split("/")
+    return any(is_excluded("/".join(parts[:depth]), exclude_regex) for depth in range(1, len(parts) + 1))
+
+
+def is_safe_relative_name(name):
+    # Rejeita nomes que escapariam da pasta base (absolutos, com '..', vazios ou com '\')
+    if not name or name.startswith("/") or "\\" in name or "\0" in name:
+        return False
+    return all(part not in ("", ".", "..") for part in name.split("/"))
+
+
+def to_local_path(root, name):
+    # Converte um nome relativo ('/' como separador) para um caminho local dentro de root
+    if not is_safe_relative_name(name):
+        return None
+    return os.path.join(root, *name.split("/"))
+
+
+def scan_shared_tree(root, exclude_regex=_DEFAULT_EXCLUDE, with_stat=False, prefix=""):
+    """Varre root de forma iterativa com os.scandir.
+
+    Retorna uma lista de nomes relativos ou, com with_stat=True, um dict
+    nome -> (inode, mtime_ns, tamanho). Sem with_stat nenhum stat extra é feito:
+    o tipo da entrada vem do próprio DirEntry (d_type).
+    """
+    result = {} if with_stat else []
+    # Pilha de (caminho_absoluto, prefixo_relativo): evita recursão e limita a memória à própria saída
+    pending_dirs = [(root, prefix)]
+    while pending_dirs:
+        dir_path, rel_prefix = pending_dirs.pop()
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                rel_name = rel_prefix + entry.name
+                if is_excluded(rel_name, exclude_regex):
+                    continue
+                try:
+                    # Não segue links simbólicos de diretórios (evita ciclos)
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append((entry.path, rel_name + "/"))
+                    elif entry.is_file():
+                        if with_stat:
+                            st = entry.stat()
+                            result[rel_name] = (st.st_ino, st.st_mtime_ns, st.st_size)
+                        else:
+                            result.append(rel_name)
+                except OSError:
+                    continue
+    return result
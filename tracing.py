@@ -0,0 +1,177 @@
+# tracing.py
+# Rastreamento distribuído dos fluxos de busca/download e de eleição. O span atual fica em uma
+# ContextVar (vale por thread e por tarefa asyncio; o AsyncRuntime copia o contexto para o pool) e
+# atravessa as chamadas Pyro5 como anotação da mensagem (TRACE_ANNOTATION = "trace_id:span_id").
+# Cada peer grava seus spans em traces/<peer_id>_spans.jsonl; merge_traces.py junta os arquivos
+# em uma linha do tempo única.
+#
+# Só há spans dentro de um trace iniciado com start_trace(): heartbeats e chamadas sem anotação
+# não geram registro algum.
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import secrets
+import threading
+import time
+
+from Pyro5.callcontext import current_context
+
+from constants import TRACING_ENABLED, TRACE_DIR, TRACE_ANNOTATION, TRACE_FLUSH_INTERVAL
+
+_current_span = contextvars.ContextVar("p2p_current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "attrs", "status")
+
+    def __init__(self, trace_id, parent_id, name, kind, attrs):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time()
+        self.attrs = attrs
+        self.status = "ok"
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    # Devolvido fora de um trace: set() não faz nada, então o chamador não precisa testar
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _remote_parent():
+    # (trace_id, span_id) da anotação da chamada Pyro recebida por esta thread, se houver
+    value = current_context.annotations.get(TRACE_ANNOTATION)
+    if not value:
+        return None
+    try:
+        trace_id, span_id = bytes(value).decode("ascii").split(":", 1)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return trace_id, span_id
+
+
+class Tracer:
+    def __init__(self, peer_id, logger, directory=TRACE_DIR, enabled=TRACING_ENABLED):
+        self.peer_id = peer_id
+        self.logger = logger
+        self.enabled = enabled
+        self.path = os.path.join(directory, f"{peer_id}_spans.jsonl")
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_flush = time.monotonic()
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "w", encoding="utf-8")  # Sobrescreve a cada execução, como os logs
+
+    # --- Criação de spans ---
+    @contextlib.contextmanager
+    def _activate(self, span):
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = f"error: {type(e).__name__}"
+            raise
+        finally:
+            _current_span.reset(token)
+            self._record(span, time.time())
+
+    def start_trace(self, name, **attrs):
+        """Span raiz de um novo trace (ou filho do span atual, se já houver um)."""
+        if not self.enabled:
+            return contextlib.nullcontext(NULL_SPAN)
+        parent = _current_span.get()
+        if parent is not None:
+            return self._activate(Span(parent.trace_id, parent.span_id, name, "internal", attrs))
+        return self._activate(Span(secrets.token_hex(16), None, name, "internal", attrs))
+
+    def span(self, name, **attrs):
+        """Span filho do atual; fora de um trace não registra nada."""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            return contextlib.nullcontext(NULL_SPAN)
+        return self._activate(Span(parent.trace_id, parent.span_id, name, "internal", attrs))
+
+    @contextlib.contextmanager
+    def client_span(self, name, **attrs):
+        """Span de uma chamada Pyro de saída: o contexto vai na anotação das chamadas feitas nesta thread."""
+        parent = _current_span.get()
+        if parent is None or not self.enabled:
+            yield NULL_SPAN
+            return
+        span = Span(parent.trace_id, parent.span_id, name, "client", attrs)
+        previous_annotations = current_context.annotations
+        current_context.annotations = dict(previous_annotations)
+        current_context.annotations[TRACE_ANNOTATION] = f"{span.trace_id}:{span.span_id}".encode("ascii")
+        try:
+            with self._activate(span):
+                yield span
+        finally:
+            current_context.annotations = previous_annotations
+
+    def server_span(self, name, remote_parent):
+        # Span de uma chamada recebida, filho do span do cliente que a fez
+        trace_id, parent_id = remote_parent
+        return self._activate(Span(trace_id, parent_id, name, "server", {}))
+
+    def current_ref(self):
+        """(trace_id, span_id) do span atual, para continuar o trace depois (ex.: em um timer)."""
+        span = _current_span.get()
+        return (span.trace_id, span.span_id) if span is not None else None
+
+    def continue_trace(self, ref, name, **attrs):
+        # Span filho de um span guardado com current_ref(); sem referência não registra nada
+        if ref is None or not self.enabled:
+            return contextlib.nullcontext(NULL_SPAN)
+        return self._activate(Span(ref[0], ref[1], name, "internal", attrs))
+
+    # --- Gravação ---
+    def _record(self, span, end):
+        record = {"trace_id": span.trace_id, "span_id": span.span_id, "parent_id": span.parent_id,
+                  "name": span.name, "kind": span.kind, "peer": self.peer_id,
+                  "thread": threading.current_thread().name, "start": span.start,
+                  "duration": end - span.start, "status": span.status, "attrs": span.attrs}
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)  # Buffer do arquivo; o flush em disco é periódico
+            now = time.monotonic()
+            if now - self._last_flush >= TRACE_FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def traced_rpc(method):
+    """Registra um span de servidor quando a chamada recebida traz o contexto de um trace."""
+    method_name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        remote_parent = _remote_parent() if self.tracer.enabled else None
+        if remote_parent is None:
+            return method(self, *args, **kwargs)
+        with self.tracer.server_span(f"rpc:{method_name}", remote_parent):
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,250 @@
+# tracker_index.py
+# Índice de arquivos do tracker com cópia-na-escrita. As escritas de arquivos completos (register_files,
+# unregister_files) passam por um único lock e publicam um novo snapshot imutável; as leituras (query_file,
+# get_all_indexed_files, status) só leem a referência do snapshot atual, sem lock, e nunca veem
+# um dicionário sendo modificado durante a iteração.
+#
+# Representação compacta: cada peer é internado uma vez em uma tabela (número -> (peer_id, uri)) e
+# os holders de um arquivo são só números de peer: um int quando há um único holder (o caso comum)
+# ou um array('I') ordenado. Os pares (peer_id, uri) só são remontados na borda da API.
+#
+# As escritas que mudam o conjunto de nomes também entram em um log de mudanças limitado
+# ((versão, "add" | "remove", nome)), lido pelas assinaturas (index_subscriptions.py) e pelo filtro de
+# Bloom do tracker. 'version' muda a cada escrita de arquivos completos; 'names_version' só quando o
+# conjunto de nomes muda.
+#
+# Os holders parciais (downloads em andamento) ficam fora do snapshot: são anunciados a cada poucos
+# chunks, então cada anúncio só troca a entrada do arquivo no lugar e incrementa partials_version, sem
+# mudar 'version' (o que invalidaria os caches de consulta e o filtro de toda a rede).
+
+from array import array
+from collections import deque
+import threading
+from types import MappingProxyType
+
+from constants import INDEX_CHANGE_LOG_SIZE
+
+_EMPTY = MappingProxyType({})
+
+
+def _pack(peer_numbers):
+    # Conjunto de números de peer -> int (um holder) ou array('I') ordenado; None se vazio
+    if not peer_numbers:
+        return None
+    if len(peer_numbers) == 1:
+        return next(iter(peer_numbers))
+    return array('I', sorted(peer_numbers))
+
+
+def _unpack(packed):
+    return (packed,) if isinstance(packed, int) else packed
+
+
+class PartialHolder:
+    """Peer com download em andamento de um arquivo: quais chunks já pode servir."""
+
+    __slots__ = ("peer_id", "uri", "total_size", "bits")
+
+    def __init__(self, peer_id, uri, total_size, bits):
+        self.peer_id = peer_id
+        self.uri = uri
+        self.total_size = total_size
+        self.bits = bits
+
+
+class IndexSnapshot:
+    """Estado imutável do índice de arquivos completos em um instante (arquivos e tabela de peers)."""
+
+    __slots__ = ("files", "peers", "version", "names_version")
+
+    def __init__(self, files, peers, version, names_version):
+        self.files = files  # nome -> int | array('I') de números de peer
+        self.peers = peers  # tupla: número do peer -> (peer_id, uri)
+        self.version = version
+        self.names_version = names_version  # Versão da última escrita que mudou o conjunto de nomes
+
+    def __len__(self):
+        return len(self.files)
+
+    def holders(self, filename):
+        """[(peer_id, uri), ...] dos peers com o arquivo completo."""
+        packed = self.files.get(filename)
+        if packed is None:
+            return []
+        peers = self.peers
+        return [peers[n] for n in _unpack(packed)]
+
+    def items(self):
+        # (nome, [(peer_id, uri), ...]) para cada arquivo; os pares são remontados sob demanda
+        peers = self.peers
+        for filename, packed in self.files.items():
+            yield filename, [peers[n] for n in _unpack(packed)]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+_EMPTY_SNAPSHOT = IndexSnapshot(_EMPTY, (), 0, 0)
+
+
+class TrackerIndex:
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        self._state = _EMPTY_SNAPSHOT
+        # peer_id -> número na tabela (só usado pelos escritores, sob _write_lock)
+        self._peer_numbers = {}
+        # Log de mudanças de nomes (protegido por _write_lock); versões <= _changes_floor podem ter
+        # eventos já descartados
+        self._changes = deque()
+        self._changes_floor = 0
+        # Holders parciais: nome -> tupla de PartialHolder, alterado no lugar sob _partials_lock. Leitores
+        # só fazem get() de uma tupla imutável, sem lock
+        self._partials = {}
+        self._partials_lock = threading.Lock()
+        self._partials_version = 0
+
+    # --- Leitura (sem lock) ---
+    def snapshot(self):
+        """Snapshot imutável e consistente do índice completo."""
+        return self._state
+
+    @property
+    def version(self):
+        return self._state.version
+
+    @property
+    def names_version(self):
+        return self._state.names_version
+
+    @property
+    def partials_version(self):
+        return self._partials_version
+
+    def holders(self, filename):
+        return self._state.holders(filename)
+
+    def partial_holders(self, filename):
+        """{peer_id: (uri, tamanho_total, bitfield)} dos peers que ainda estão baixando o arquivo."""
+        return {h.peer_id: (h.uri, h.total_size, h.bits) for h in self._partials.get(filename, ())}
+
+    def __len__(self):
+        return len(self._state)
+
+    def changes_since(self, version):
+        """(eventos com versão > 'version', versão atual); None se parte desses eventos já saiu do log."""
+        with self._write_lock:
+            if version < self._changes_floor:
+                return None
+            return [change for change in self._changes if change[0] > version], self._state.version
+
+    # --- Escrita (serializada) ---
+    def _intern_peer(self, peer_id, peer_uri, peers):
+        # Número do peer na tabela; devolve também a tabela (nova, se o peer é novo ou mudou de URI)
+        number = self._peer_numbers.get(peer_id)
+        if number is None:
+            number = len(peers)
+            self._peer_numbers[peer_id] = number
+            return number, peers + ((peer_id, peer_uri),)
+        if peers[number][1] != peer_uri:
+            # Peer reiniciado com outro URI: todas as entradas dele passam a apontar para o novo
+            peers = peers[:number] + ((peer_id, peer_uri),) + peers[number + 1:]
+        return number, peers
+
+    def _record_changes(self, version, added, removed):
+        # Chamado com _write_lock adquirido, antes de publicar a versão 'version'
+        for op, names in (("add", added), ("remove", removed)):
+            for name in names:
+                self._changes.append((version, op, name))
+        while len(self._changes) > INDEX_CHANGE_LOG_SIZE:
+            self._changes_floor = self._changes.popleft()[0]
+
+    def _publish(self, files, peers, names_changed):
+        # Chamado com _write_lock adquirido: troca a referência de uma vez só
+        state = self._state
+        version = state.version + 1
+        self._state = IndexSnapshot(MappingProxyType(files), peers, version,
+                                    version if names_changed else state.names_version)
+
+    def replace_peer_files(self, peer_id, peer_uri, file_list):
+        """Atualização completa: o peer passa a ter exatamente os arquivos de file_list."""
+        with self._write_lock:
+            number, peers = self._intern_peer(peer_id, peer_uri, self._state.peers)
+            previous = self._state.files
+            files = {}
+            for filename, packed in previous.items():
+                if packed == number if isinstance(packed, int) else number in packed:
+                    packed = _pack(set(_unpack(packed)) - {number})
+                if packed is not None:
+                    files[filename] = packed
+            for filename in file_list:
+                packed = files.get(filename)
+                files[filename] = number if packed is None else _pack(set(_unpack(packed)) | {number})
+            added = [name for name in files if name not in previous]
+            removed = [name for name in previous if name not in files]
+            self._record_changes(self._state.version + 1, added, removed)
+            self._publish(files, peers, bool(added or removed))
+
+    def add_peer_files(self, peer_id, peer_uri, file_list):
+        """Atualização incremental: apenas adiciona o peer como holder dos arquivos de file_list."""
+        with self._write_lock:
+            number, peers = self._intern_peer(peer_id, peer_uri, self._state.peers)
+            files = dict(self._state.files)
+            added = []
+            for filename in file_list:
+                packed = files.get(filename)
+                if packed is None:
+                    added.append(filename)
+                files[filename] = number if packed is None else _pack(set(_unpack(packed)) | {number})
+            self._record_changes(self._state.version + 1, added, ())
+            self._publish(files, peers, bool(added))
+
+    def remove_peer_files(self, peer_id, file_list):
+        """Atualização incremental: apenas retira o peer dos holders dos arquivos de file_list."""
+        with self._write_lock:
+            number = self._peer_numbers.get(peer_id)
+            if number is None:
+                return
+            files = None
+            removed = []
+            for filename in file_list:
+                packed = (self._state.files if files is None else files).get(filename)
+                if packed is None or not (packed == number if isinstance(packed, int) else number in packed):
+                    continue
+                if files is None:
+                    files = dict(self._state.files)
+                packed = _pack(set(_unpack(packed)) - {number})
+                if packed is None:
+                    del files[filename]
+                    removed.append(filename)
+                else:
+                    files[filename] = packed
+            if files is None:
+                return  # O peer não era holder de nenhum deles: nada a publicar
+            self._record_changes(self._state.version + 1, (), removed)
+            self._publish(files, self._state.peers, bool(removed))
+
+    def set_partial(self, filename, peer_id, entry):
+        # entry = (uri, tamanho_total, bitfield) ou None para remover o peer dos holders parciais
+        with self._partials_lock:
+            current = self._partials.get(filename, ())
+            holders = tuple(h for h in current if h.peer_id != peer_id)
+            if entry is None and len(holders) == len(current):
+                return
+            if entry is not None:
+                holders += (PartialHolder(peer_id, entry[0], entry[1], entry[2]),)
+            if holders:
+                self._partials[filename] = holders
+            else:
+                self._partials.pop(filename, None)
+            self._partials_version += 1
+
+    def clear(self):
+        with self._write_lock:
+            self._peer_numbers = {}
+            self._state = IndexSnapshot(_EMPTY, (), self._state.version + 1, self._state.version + 1)
+            # Quem estava em uma versão anterior precisa da lista completa de novo
+            self._changes.clear()
+            self._changes_floor = self._state.version
+        with self._partials_lock:
+            self._partials = {}
+            self._partials_version += 1
@@ -0,0 +1,276 @@
+# upload_scheduler.py
+# Escalonador de uploads do lado do holder: limita o número de chunks servidos ao mesmo tempo
+# (slots), distribui os slots de forma justa entre os peers solicitantes (round-robin entre
+# filas por peer) e aplica limites de banda com token buckets (global e por peer).
+# A espera pela banda acontece com a chamada Pyro do downloader aberta, então fila + banda cabem em
+# UPLOAD_WAIT_BUDGET (abaixo do timeout do cliente): dentro do slot, reserve() debita de uma vez, sob
+# os locks dos buckets, só os bytes que saem no que sobrou do orçamento depois da fila. Com pouca
+# banda o holder manda só esse pedaço do chunk e o downloader pede o restante em seguida.
+
+import collections
+import threading
+import time
+
+from constants import (
+    UPLOAD_SLOTS, UPLOAD_MAX_BYTES_PER_SEC, UPLOAD_PER_PEER_MAX_BYTES_PER_SEC, UPLOAD_QUEUE_TIMEOUT,
+    UPLOAD_WAIT_BUDGET, UPLOAD_MIN_PIECE_BYTES, UPLOAD_MIN_PIECE_WAIT, UPLOAD_PEER_BUCKET_IDLE
+)
+
+
+class UploadQueueTimeout(Exception):
+    """Nenhum slot de upload ficou livre dentro do tempo limite."""
+
+
+class TokenBucket:
+    """Token bucket em bytes/s; rate <= 0 significa sem limite."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        # Chamado com _lock adquirido
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def adjust(self, nbytes):
+        # Devolve (nbytes > 0) ou cobra (nbytes < 0) bytes de uma reserva que não bateu com o enviado
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + nbytes)
+
+    def idle_for(self, now):
+        return now - self._last
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket com o estado (tokens, último refill) em memória compartilhada entre processos.
+
+    Os workers de upload (serving_workers.py) e o processo principal usam o mesmo estado, então o limite
+    global vale para o peer inteiro e não para cada processo. time.monotonic() é o mesmo relógio do
+    sistema em todos os processos.
+    """
+
+    def __init__(self, rate, state, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._values = state.get_obj()  # Acesso direto: as leituras/escritas já acontecem sob _lock
+        self._lock = state.get_lock()
+
+    @staticmethod
+    def new_state(context, rate, burst=None):
+        # Criado no processo principal e passado aos workers na criação do processo
+        return context.Array("d", [burst if burst is not None else rate, time.monotonic()])
+
+    @property
+    def _tokens(self):
+        return self._values[0]
+
+    @_tokens.setter
+    def _tokens(self, value):
+        self._values[0] = value
+
+    @property
+    def _last(self):
+        return self._values[1]
+
+    @_last.setter
+    def _last(self, value):
+        self._values[1] = value
+
+
+class _Reservation:
+    """Bytes já debitados dos buckets; settle() acerta o enviado e espera até a banda liberá-los."""
+
+    __slots__ = ("buckets", "nbytes", "release_at")
+
+    def __init__(self, buckets, nbytes, wait):
+        self.buckets = buckets
+        self.nbytes = nbytes
+        self.release_at = time.monotonic() + wait
+
+    def settle(self, sent_bytes):
+        if sent_bytes != self.nbytes:
+            for bucket in self.buckets:
+                bucket.adjust(self.nbytes - sent_bytes)
+        # Leitura e compressão já contam como parte da espera
+        remaining = self.release_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+            return remaining
+        return 0.0
+
+
+class _Ticket:
+    __slots__ = ("requester_id", "granted")
+
+    def __init__(self, requester_id):
+        self.requester_id = requester_id
+        self.granted = False
+
+
+class UploadScheduler:
+    """Controla slots de upload com fila justa por peer e limites de banda."""
+
+    def __init__(self, slots=UPLOAD_SLOTS, max_bytes_per_sec=UPLOAD_MAX_BYTES_PER_SEC,
+                 per_peer_max_bytes_per_sec=UPLOAD_PER_PEER_MAX_BYTES_PER_SEC, queue_timeout=UPLOAD_QUEUE_TIMEOUT,
+                 wait_budget=UPLOAD_WAIT_BUDGET, global_bucket=None, shared_slots=None):
+        self.slots = max(1, slots)
+        self.queue_timeout = queue_timeout
+        self.wait_budget = wait_budget
+        self.per_peer_max_bytes_per_sec = per_peer_max_bytes_per_sec
+        # global_bucket/shared_slots: limite de banda e semáforo de slots comuns a vários processos
+        # (SharedTokenBucket e multiprocessing.BoundedSemaphore); a fila justa continua por processo
+        self._global_bucket = global_bucket if global_bucket is not None else TokenBucket(max_bytes_per_sec)
+        self._shared_slots = shared_slots
+        self._peer_buckets = {}
+        self._last_prune = time.monotonic()
+        self._cond = threading.Condition()
+        self._active = 0
+        # Fila por solicitante; a ordem do OrderedDict é a ordem do round-robin
+        self._queues = collections.OrderedDict()
+        self._queued = 0
+
+    # --- Estado (reportado ao tracker) ---
+    def active(self):
+        return self._active
+
+    def queue_depth(self):
+        return self._queued
+
+    def load(self):
+        # Uploads em andamento + aguardando slot: é o que os downloaders usam para desviar de holders ocupados
+        return self._active + self._queued
+
+    def status(self):
+        with self._cond:
+            return {"slots": self.slots, "active": self._active, "queued": self._queued,
+                    "queued_by_peer": {peer: len(q) for peer, q in self._queues.items() if q}}
+
+    # --- Aquisição de slots ---
+    def _grant_next(self):
+        # Concede slots livres ao próximo solicitante da rotação (chamado com self._cond adquirido)
+        granted_any = False
+        while self._active < self.slots and self._queued:
+            requester_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            self._queued -= 1
+            # Move o solicitante para o fim da rotação (ou remove, se não tiver mais pedidos)
+            del self._queues[requester_id]
+            if queue:
+                self._queues[requester_id] = queue
+            ticket.granted = True
+            self._active += 1
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def acquire(self, requester_id):
+        ticket = _Ticket(requester_id)
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            self._queues.setdefault(requester_id, collections.deque()).append(ticket)
+            self._queued += 1
+            self._grant_next()
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue = self._queues.get(requester_id)
+                    if queue is not None:
+                        queue.remove(ticket)
+                        self._queued -= 1
+                        if not queue:
+                            del self._queues[requester_id]
+                    raise UploadQueueTimeout(f"sem slot de upload livre para {requester_id}")
+                self._cond.wait(remaining)
+        # Slot local concedido; com slots compartilhados ainda é preciso um dos slots do peer inteiro
+        if self._shared_slots is not None and \
+                not self._shared_slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._release_local()
+            raise UploadQueueTimeout(f"sem slot de upload livre para {requester_id}")
+
+    def _release_local(self):
+        with self._cond:
+            self._active -= 1
+            self._grant_next()
+
+    def release(self):
+        if self._shared_slots is not None:
+            self._shared_slots.release()
+        self._release_local()
+
+    def _peer_bucket(self, requester_id):
+        if self.per_peer_max_bytes_per_sec <= 0:
+            return None
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_prune >= UPLOAD_PEER_BUCKET_IDLE:
+                # Buckets parados há tanto tempo já estão cheios: descartá-los não muda nada para o peer
+                self._last_prune = now
+                for peer in [peer for peer, bucket in self._peer_buckets.items()
+                             if bucket.idle_for(now) >= UPLOAD_PEER_BUCKET_IDLE]:
+                    del self._peer_buckets[peer]
+            bucket = self._peer_buckets.get(requester_id)
+            if bucket is None:
+                bucket = self._peer_buckets[requester_id] = TokenBucket(self.per_peer_max_bytes_per_sec)
+            return bucket
+
+    def reserve(self, requester_id, nbytes, max_wait):
+        """Reserva até nbytes nos limites de banda (global e por peer) com espera de no máximo ~max_wait.
+
+        Os dois buckets são debitados juntos, sob os seus locks, então pedidos simultâneos enxergam as
+        reservas uns dos outros; a espera é a maior entre eles (pagas em paralelo, não somadas). Sempre
+        cabe ao menos um pedaço mínimo (UPLOAD_MIN_PIECE_WAIT de banda), para o download avançar.
+        """
+        buckets = [bucket for bucket in (self._global_bucket, self._peer_bucket(requester_id))
+                   if bucket is not None and bucket.rate > 0]
+        if not buckets or nbytes <= 0:
+            return _Reservation([], nbytes, 0.0)
+        for bucket in buckets:  # Sempre na mesma ordem (global, peer): sem deadlock entre pedidos
+            bucket._lock.acquire()
+        try:
+            for bucket in buckets:
+                bucket._refill()
+            allowance = min(bucket._tokens + max(0.0, max_wait) * bucket.rate for bucket in buckets)
+            floor = max(1, min([UPLOAD_MIN_PIECE_BYTES] + [int(bucket.rate * UPLOAD_MIN_PIECE_WAIT) for bucket in buckets]))
+            granted = int(min(nbytes, max(allowance, floor)))
+            wait = 0.0
+            for bucket in buckets:
+                bucket._tokens -= granted
+                if bucket._tokens < 0:
+                    wait = max(wait, -bucket._tokens / bucket.rate)
+        finally:
+            for bucket in reversed(buckets):
+                bucket._lock.release()
+        return _Reservation(buckets, granted, wait)
+
+    def slot(self, requester_id):
+        return _UploadSlot(self, requester_id)
+
+
+class _UploadSlot:
+    # Gerenciador de contexto: 'with scheduler.slot(peer_id) as slot:' adquire e libera o slot
+    __slots__ = ("scheduler", "requester_id", "queue_wait")
+
+    def __init__(self, scheduler, requester_id):
+        self.scheduler = scheduler
+        self.requester_id = requester_id
+        self.queue_wait = 0.0
+
+    def __enter__(self):
+        start = time.monotonic()
+        self.scheduler.acquire(self.requester_id)
+        self.queue_wait = time.monotonic() - start
+        return self
+
+    def reserve(self, nbytes):
+        # O tempo na fila sai do orçamento: fila + banda ficam em scheduler.wait_budget
+        return self.scheduler.reserve(self.requester_id, nbytes, self.scheduler.wait_budget - self.queue_wait)
+
+    def __exit__(self, exc_type, exc, tb):
+        self.scheduler.release()
+        return False